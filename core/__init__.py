@@ -6,8 +6,14 @@ Mofy Agent Framework - 核心模块
 __version__ = "1.0.0"
 __author__ = "Mofy Team"
 
-from .agent import Agent
-from .config import AgentConfig
+from .config import MofyConfig
 from .exceptions import MofyException
 
-__all__ = ["Agent", "AgentConfig", "MofyException"]
\ No newline at end of file
+__all__ = ["MofyAgent", "MofyConfig", "MofyException"]
+
+def __getattr__(name: str):
+    # Agent依赖运行时、记忆和工具模块，按需导入，导入core.config等轻量模块时不会连带加载，也不会与modules循环导入
+    if name == "MofyAgent":
+        from .agent import MofyAgent
+        return MofyAgent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
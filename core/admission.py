@@ -0,0 +1,171 @@
+"""
+Mofy Agent Framework - 准入控制
+限制进程和租户的在途请求数，超出时按优先级排队；
+根据实时的LLM与工具延迟估算排队时间，注定超时的请求立即以429/503拒绝并给出Retry-After
+"""
+
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Callable, List
+from loguru import logger
+from .exceptions import AdmissionError
+from .router import BackendStats
+
+_LLM_CALLS_PER_TURN = 2  # 意图分析和最终回复
+
+def estimate_turn_latency(runtime) -> float:
+    """按当前LLM延迟中位数和工具平均耗时估算处理一条消息的秒数"""
+    llm_latency = runtime.llm_client.get_reliability_stats()["p50_ms"] / 1000
+    metrics = list(runtime.tool_registry.get_metrics().values())
+    calls = sum(m["calls"] for m in metrics)
+    # ToolRegistry的total_time以毫秒累计
+    tool_latency = sum(m["total_time"] for m in metrics) / calls / 1000 if calls else 0.0
+    return llm_latency * _LLM_CALLS_PER_TURN + tool_latency
+
+class AdmissionController:
+    """在途请求上限、按优先级排队和快速拒绝，只在单个事件循环中使用
+    
+    优先级数值越小越先被放行（与TaskScheduler一致），同优先级先到先得。
+    """
+    
+    def __init__(self, max_inflight: int = 256, max_inflight_per_tenant: int = 0, max_queue: int = 512,
+                 max_queue_time: float = 10, latency_probe: Callable[[], float] = None):
+        self.max_inflight = max_inflight
+        self.max_inflight_per_tenant = max_inflight_per_tenant  # 0表示不限制，在途和排队的请求都计入
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.latency_probe = latency_probe  # 返回实时估算的单请求处理秒数
+        self.inflight = 0
+        self._tenants: Counter = Counter()
+        self._waiters: List[tuple] = []  # (优先级, 序号, future, 租户)
+        self._sequence = itertools.count()
+        self.service_times = BackendStats(window=200, window_seconds=300)  # 实测的请求处理时间
+        self.wait_times = BackendStats(window=200, window_seconds=300)     # 排队等待时间
+        self.stats = {"admitted": 0, "queued": 0, "tenant_limited": 0, "queue_full": 0,
+                      "overloaded": 0, "queue_timeouts": 0, "shed": 0}
+    
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future, _ in self._waiters if not future.done())
+    
+    def service_time(self) -> float:
+        """单请求处理时间估计：实测中位数与按LLM/工具实时延迟估算值中的较大者，延迟上升时立即生效"""
+        estimate = self.service_times.percentile(0.5)
+        if self.latency_probe is not None:
+            try:
+                estimate = max(estimate, self.latency_probe())
+            except Exception as e:
+                logger.debug(f"延迟估算失败: {str(e)}")
+        return estimate
+    
+    def _retry_after(self, seconds: float) -> int:
+        return max(1, math.ceil(seconds))
+    
+    def _expected_wait(self, priority: int) -> float:
+        """新请求的预计排队时间：排在它前面的请求数 × 单请求处理时间 / 并发数"""
+        ahead = sum(1 for p, _, future, _ in self._waiters if p <= priority and not future.done())
+        return (ahead + 1) * self.service_time() / self.max_inflight
+    
+    def _shed_lowest(self, priority: int) -> bool:
+        """队列已满时挤掉优先级更低且最晚到达的请求"""
+        candidates = [w for w in self._waiters if not w[2].done() and w[0] > priority]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda w: (w[0], w[1]))
+        victim[2].set_exception(AdmissionError(
+            "请求被更高优先级的请求挤出队列", 503, self._retry_after(self.service_time())
+        ))
+        self.stats["shed"] += 1
+        return True
+    
+    async def acquire(self, tenant: str = "default", priority: int = 5):
+        """获取处理名额，无法在max_queue_time内放行时抛出AdmissionError"""
+        if self.max_inflight_per_tenant and self._tenants[tenant] >= self.max_inflight_per_tenant:
+            self.stats["tenant_limited"] += 1
+            raise AdmissionError(f"租户{tenant}的并发请求过多", 429, self._retry_after(self.service_time()))
+        
+        if self.inflight < self.max_inflight and not self.queue_depth:
+            self.inflight += 1
+            self._tenants[tenant] += 1
+            self.stats["admitted"] += 1
+            self.wait_times.record(0.0, success=True)
+            return
+        
+        expected = self._expected_wait(priority)
+        if expected > self.max_queue_time:
+            self.stats["overloaded"] += 1
+            raise AdmissionError(f"服务繁忙，预计排队{expected:.1f}秒", 503, self._retry_after(expected))
+        if self.queue_depth >= self.max_queue and not self._shed_lowest(priority):
+            self.stats["queue_full"] += 1
+            raise AdmissionError("服务繁忙，等待队列已满", 503, self._retry_after(expected))
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future, tenant))
+        self._tenants[tenant] += 1
+        self.stats["queued"] += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_queue_time)
+        except BaseException as e:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self._release_slot()  # 放行和超时/取消同时发生，归还名额
+            elif not future.done():
+                future.cancel()
+            self._forget_tenant(tenant)
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["queue_timeouts"] += 1
+                raise AdmissionError(f"排队超过{self.max_queue_time}秒", 503,
+                                     self._retry_after(self.service_time())) from None
+            raise
+        self.stats["admitted"] += 1
+        self.wait_times.record(time.monotonic() - start, success=True)
+    
+    def release(self, tenant: str = "default", service_time: float = None):
+        """归还处理名额并放行队首请求"""
+        if service_time is not None:
+            self.service_times.record(service_time, success=True)
+        self._forget_tenant(tenant)
+        self._release_slot()
+    
+    def _forget_tenant(self, tenant: str):
+        self._tenants[tenant] -= 1
+        if self._tenants[tenant] <= 0:
+            del self._tenants[tenant]
+    
+    def _release_slot(self):
+        # 名额直接移交给队首等待者，在途数不变
+        while self._waiters:
+            _, _, future, _ = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self.inflight -= 1
+    
+    @asynccontextmanager
+    async def admit(self, tenant: str = "default", priority: int = 5):
+        """在上下文中持有处理名额"""
+        await self.acquire(tenant, priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(tenant, time.monotonic() - start)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """准入统计：在途数、队列深度、排队时间分位数和当前处理时间估计"""
+        wait = self.wait_times.snapshot()
+        return {
+            **self.stats,
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "queue_depth": self.queue_depth,
+            "tenants": len(self._tenants),
+            "wait_p50_ms": wait["p50_ms"],
+            "wait_p95_ms": wait["p95_ms"],
+            "service_time_ms": round(self.service_time() * 1000, 1)
+        }
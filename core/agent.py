@@ -1,61 +1,146 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+import re
+import json
 import time
 import uuid
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 from loguru import logger
 from .config import config
-from .llm import LLMClient
-from ..modules.scheduler import TaskScheduler
-from ..modules.memory import MemoryManager
-from ..modules.tools.registry import ToolRegistry
-from ..modules.reflection import ReflectionEngine
+from .usage import usage_scope, get_usage_tracker
+from .intent_router import get_intent_router
+from .plan_cache import get_plan_cache
+from .tokenizer import context_budget
+from .runtime import AgentRuntime, get_agent_runtime
+from ..modules.scheduler import TaskScheduler, TaskStatus
+from ..modules.state import ConversationState
 
 class MofyAgent:
     """Mofy Agent基类：智能体核心实现"""
     
-    def __init__(self, session_id: str = None):
+    def __init__(self, session_id: str = None, runtime: AgentRuntime = None):
         self.session_id = session_id or str(uuid.uuid4())
-        self.llm_client = LLMClient()
+        
+        # 重量级组件来自共享运行时，会话只持有自身的调度器和状态
+        self.runtime = runtime or get_agent_runtime()
+        self.llm_client = self.runtime.llm_client
+        self.memory = self.runtime.memory
+        self.tool_registry = self.runtime.tool_registry
+        self.reflection_engine = self.runtime.reflection_engine
         self.scheduler = TaskScheduler()
-        self.memory = MemoryManager()
-        self.tool_registry = ToolRegistry()
-        self.reflection_engine = ReflectionEngine(self.llm_client)
+        self.state = ConversationState(self.session_id)
         self.last_active = time.time()
+        self.last_context: Dict[str, Any] = {}  # 最近一次上下文的token使用情况
+        self.runtime.track_session()
         
-        # 初始化内置工具
-        self._init_builtin_tools()
-        
-        logger.info(f"Mofy Agent初始化完成: {self.session_id}")
+        logger.debug(f"Mofy Agent会话创建: {self.session_id}")
     
-    def process_message(self, message: str) -> str:
-        """处理用户消息的主要入口"""
-        try:
-            # 更新活跃时间
-            self.last_active = time.time()
-            
-            # 保存用户消息到记忆
-            self.memory.add_experience(self.session_id, f"用户: {message}")
-            
-            # 获取相关记忆作为上下文
-            context = self.memory.get_relevant_memory(self.session_id, message)
-            
-            # 分析用户意图并规划任务
-            task_plan = self._analyze_intent(message, context)
+    async def process_message(self, message: str) -> str:
+        """处理用户消息的主要入口（异步）：记忆读写、LLM调用和工具执行都不阻塞事件循环，单进程可交错处理大量会话"""
+        with usage_scope(session_id=self.session_id):
+            try:
+                # 保存用户消息、构建上下文并规划任务
+                task_plan = await self._aplan_turn(message)
+                
+                # 执行任务计划
+                result = await self._aexecute_task_plan(task_plan)
+                
+                # 保存助手回复到记忆
+                await self.memory.aadd_experience(self.session_id, f"助手: {result}")
+                
+                return result
             
-            # 执行任务计划
-            result = self._execute_task_plan(task_plan)
+            except Exception as e:
+                logger.error(f"消息处理失败: {str(e)}")
+                return f"抱歉，处理过程中出现错误：{str(e)}"
+    
+    async def stream_message(self, message: str) -> AsyncIterator[str]:
+        """流式处理用户消息：工具执行完成后逐段输出最终回复，直接回复作为一段输出"""
+        with usage_scope(session_id=self.session_id):
+            parts = []
+            try:
+                task_plan = await self._aplan_turn(message)
+                reply, final_prompt = await self._aresolve_reply(task_plan)
+                if reply is not None:
+                    parts.append(reply)
+                    yield reply
+                else:
+                    with usage_scope(call_site="final_reply"):
+                        async for chunk in self.llm_client.astream(final_prompt):
+                            parts.append(chunk)
+                            yield chunk
             
-            # 保存助手回复到记忆
-            self.memory.add_experience(self.session_id, f"助手: {result}")
+            except Exception as e:
+                logger.error(f"消息处理失败: {str(e)}")
+                error = f"抱歉，处理过程中出现错误：{str(e)}"
+                parts.append(error)
+                yield error
             
-            return result
+            await self.memory.aadd_experience(self.session_id, f"助手: {''.join(parts)}")
+    
+    async def _aplan_turn(self, message: str) -> Dict[str, Any]:
+        """记录用户消息，在token预算内构建上下文并生成任务计划"""
+        # 更新活跃时间
+        self.last_active = time.time()
+        
+        # 保存用户消息到记忆
+        await self.memory.aadd_experience(self.session_id, f"用户: {message}")
+        
+        # 在token预算内获取相关记忆作为上下文
+        context = await self.memory.abuild_context(
+            self.session_id, message, max_tokens=self._context_budget(message), slots=self.state.slots
+        )
+        self.last_context = context.to_dict()
+        
+        # 分析用户意图并规划任务
+        task_plan = await self._aanalyze_intent(message, context.text)
+        self.state.intent = task_plan.get("intent") or self.state.intent
+        return task_plan
+    
+    def process_message_sync(self, message: str) -> str:
+        """同步处理用户消息，供命令行等没有事件循环的场景使用"""
+        with usage_scope(session_id=self.session_id):
+            try:
+                self.last_active = time.time()
+                self.memory.add_experience(self.session_id, f"用户: {message}")
+                
+                context = self.memory.build_context(
+                    self.session_id, message, max_tokens=self._context_budget(message), slots=self.state.slots
+                )
+                self.last_context = context.to_dict()
+                
+                task_plan = self._analyze_intent(message, context.text)
+                self.state.intent = task_plan.get("intent") or self.state.intent
+                result = self._execute_task_plan(task_plan)
+                
+                self.memory.add_experience(self.session_id, f"助手: {result}")
+                return result
             
-        except Exception as e:
-            logger.error(f"消息处理失败: {str(e)}")
-            return f"抱歉，处理过程中出现错误：{str(e)}"
+            except Exception as e:
+                logger.error(f"消息处理失败: {str(e)}")
+                return f"抱歉，处理过程中出现错误：{str(e)}"
     
-    def _analyze_intent(self, message: str, context: str) -> Dict[str, Any]:
-        """分析用户意图并生成任务计划"""
-        prompt = f"""基于以下上下文分析用户意图，生成任务执行计划:
+    def _context_budget(self, message: str) -> int:
+        """上下文可用预算：扣除按空上下文渲染的规划提示词，原生工具调用模式还要扣除随请求发送的工具定义"""
+        if config.llm_tool_calling:
+            template = self._tool_plan_prompt(message, "") + json.dumps(
+                self.tool_registry.to_openai_tools(), ensure_ascii=False
+            )
+        else:
+            template = self._intent_prompt(message, "")
+        return context_budget(template)
+    
+    def _intent_prompt(self, message: str, context: str) -> str:
+        """意图分析提示词，融合模式下同时要求直接回复或回复模板"""
+        fused_fields, fused_rules = "", ""
+        if config.fused_plan_answer:
+            fused_fields = (
+                ',\n    "answer": "不需要工具时直接给用户的回复"'
+                ',\n    "reply_template": "需要工具时的回复模板，用${任务编号}代表对应任务的输出"'
+            )
+            fused_rules = "\n不需要工具时tasks为空列表，并在answer中直接回复；工具输出可以直接套入回复时给出reply_template，需要进一步总结时省略该字段。"
+        return f"""基于以下上下文分析用户意图，生成任务执行计划:
 
 上下文信息:
 {context}
@@ -67,16 +152,21 @@ class MofyAgent:
     "intent": "用户意图描述",
     "tasks": [
         {{
+            "id": "任务编号，如t1",
             "type": "任务类型",
             "tool": "工具名称",
             "parameters": {{"param": "value"}},
+            "depends_on": ["需要先完成的任务编号"],
             "priority": 1-10
         }}
-    ]
+    ]{fused_fields}
 }}
+
+相互独立的任务不要声明依赖，它们会并行执行；参数中可以用${{任务编号}}引用所依赖任务的输出。{fused_rules}
 """
-        
-        response = self.llm_client.invoke(prompt)
+    
+    def _plan_from_response(self, response: str) -> Dict[str, Any]:
+        """解析任务计划"""
         plan = self.llm_client.parse_response(response)
         
         # 验证并修正计划
@@ -85,107 +175,321 @@ class MofyAgent:
         
         return plan
     
-    def _execute_task_plan(self, task_plan: Dict[str, Any]) -> str:
-        """执行任务计划"""
-        if not task_plan.get("tasks"):
-            return "我理解了您的需求，但没有找到合适的工具来处理。"
+    def _local_plan(self, message: str) -> Optional[Dict[str, Any]]:
+        """不调用LLM的计划来源：先查计划缓存，再走本地意图路由"""
+        tools = self.tool_registry.tools.keys()
+        validate = self.tool_registry.validate_parameters
+        if config.plan_cache:
+            plan = get_plan_cache().lookup(message, tools, validate=validate)
+            if plan:
+                return plan
+        if config.intent_router:
+            return get_intent_router().route(message, tools, validate=validate)
+        return None
+    
+    def _learn_plan(self, message: str, plan: Dict[str, Any]):
+        """LLM生成的计划写入计划缓存，并作为本地分类器的训练样本"""
+        if not plan.get("tasks"):
+            return
+        if config.plan_cache:
+            get_plan_cache().store(message, plan)
+        if config.intent_router:
+            get_intent_router().observe(message, plan)
+    
+    def _plan_feedback(self, task_plan: Dict[str, Any], refs: Dict[str, str]):
+        """来自计划缓存的计划执行后反馈结果，工具失败的模板会被逐步淘汰"""
+        if not task_plan.get("plan_key"):
+            return
+        task_ids = set(refs.values())
+        success = not any(
+            task["status"] == TaskStatus.FAILED
+            for task in self.scheduler.task_queue if task["task_id"] in task_ids
+        )
+        get_plan_cache().feedback(task_plan["plan_key"], success)
+    
+    def _analyze_intent(self, message: str, context: str) -> Dict[str, Any]:
+        """分析用户意图并生成任务计划"""
+        plan = self._local_plan(message)
+        if plan:
+            return plan
         
-        # 添加任务到调度器
-        for task in task_plan["tasks"]:
-            self.scheduler.add_task(
+        if config.llm_tool_calling:
+            plan = self._plan_with_tools(message, context)
+        else:
+            with usage_scope(call_site="analyze_intent"):
+                response = self.llm_client.invoke(self._intent_prompt(message, context), semantic_key=message)
+            plan = self._plan_from_response(response)
+        
+        self._learn_plan(message, plan)
+        return plan
+    
+    async def _aanalyze_intent(self, message: str, context: str) -> Dict[str, Any]:
+        """_analyze_intent的异步版本"""
+        plan = self._local_plan(message)
+        if plan:
+            return plan
+        
+        if config.llm_tool_calling:
+            with usage_scope(call_site="analyze_intent"):
+                result = await self.llm_client.ainvoke_tools(
+                    self._tool_plan_prompt(message, context), self.tool_registry.to_openai_tools()
+                )
+            plan = self._plan_from_tool_calls(result)
+        else:
+            with usage_scope(call_site="analyze_intent"):
+                response = await self.llm_client.ainvoke(self._intent_prompt(message, context), semantic_key=message)
+            plan = self._plan_from_response(response)
+        
+        self._learn_plan(message, plan)
+        return plan
+    
+    def _tool_plan_prompt(self, message: str, context: str) -> str:
+        """原生工具调用模式的提示词，工具定义通过tools参数发送"""
+        return f"""基于以下上下文处理用户消息，需要时调用工具，可同时调用多个工具:
+
+上下文信息:
+{context}
+
+用户消息: {message}
+"""
+    
+    def _plan_from_tool_calls(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """把结构化的工具调用转换为任务计划"""
+        return {
+            "intent": result["content"],
+            "tasks": [
+                {"type": call["name"], "tool": call["name"], "parameters": call["arguments"], "priority": 5}
+                for call in result["tool_calls"]
+            ],
+            # 没有工具调用时模型已直接作答
+            "answer": result["content"]
+        }
+    
+    def _plan_with_tools(self, message: str, context: str) -> Dict[str, Any]:
+        """原生工具调用模式：直接得到结构化的（可并行的）工具调用"""
+        with usage_scope(call_site="analyze_intent"):
+            result = self.llm_client.invoke_tools(
+                self._tool_plan_prompt(message, context), self.tool_registry.to_openai_tools()
+            )
+        return self._plan_from_tool_calls(result)
+    
+    def _schedule_tasks(self, task_plan: Dict[str, Any]) -> Dict[str, str]:
+        """添加任务到调度器，返回计划中的任务编号到调度器任务ID的映射"""
+        # 之前计划中已结束的任务不再需要，避免队列随对话轮数增长
+        self.scheduler.prune_finished()
+        refs = {}
+        for index, task in enumerate(task_plan["tasks"], 1):
+            refs[str(task.get("id", index))] = self.scheduler.add_task(
                 task_type=task.get("type", "unknown"),
                 parameters=task.get("parameters", {}),
-                priority=task.get("priority", 5)
+                priority=task.get("priority", 5),
+                tool=task.get("tool") or task_plan.get("tool")
             )
         
-        # 执行任务
-        results = []
-        task_history = []
+        # 所有任务都有ID后再设置依赖，允许依赖指向计划中靠后的任务
+        for index, task in enumerate(task_plan["tasks"], 1):
+            depends_on = task.get("depends_on") or []
+            if isinstance(depends_on, (str, int)):
+                depends_on = [depends_on]
+            unknown = [str(d) for d in depends_on if str(d) not in refs]
+            if unknown:
+                logger.warning(f"忽略不存在的依赖任务: {unknown}")
+            self.scheduler.set_dependencies(
+                refs[str(task.get("id", index))], [refs[str(d)] for d in depends_on if str(d) in refs]
+            )
+        return refs
+    
+    def _resolve_params(self, params: Any, refs: Dict[str, str], outputs: Dict[str, Any]) -> Any:
+        """把参数中的${任务编号}替换为对应任务的输出"""
+        if isinstance(params, dict):
+            return {k: self._resolve_params(v, refs, outputs) for k, v in params.items()}
+        if isinstance(params, list):
+            return [self._resolve_params(v, refs, outputs) for v in params]
+        if not isinstance(params, str):
+            return params
         
+        def replace(match):
+            task_id = refs.get(match.group(1))
+            return str(outputs[task_id]) if task_id in outputs else match.group(0)
+        return re.sub(r"\$\{([^}]+)\}", replace, params)
+    
+    def _run_task(self, task: Dict[str, Any], refs: Dict[str, str], outputs: Dict[str, Any]):
+        """_arun_task的同步版本"""
+        if not task.get("tool"):
+            return True, "任务执行完成"
+        try:
+            params = self._resolve_params(task["params"], refs, outputs)
+            return True, self.tool_registry.run_tool(task["tool"], params)
+        except Exception as e:
+            logger.error(f"工具执行失败 {task['tool']}: {str(e)}")
+            return False, str(e)
+    
+    async def _arun_task(self, task: Dict[str, Any], refs: Dict[str, str], outputs: Dict[str, Any]):
+        """执行单个任务，返回(是否成功, 输出)"""
+        if not task.get("tool"):
+            return True, "任务执行完成"
+        try:
+            params = self._resolve_params(task["params"], refs, outputs)
+            return True, await self.tool_registry.aexecute_tool(task["tool"], params)
+        except Exception as e:
+            logger.error(f"工具执行失败 {task['tool']}: {str(e)}")
+            return False, str(e)
+    
+    async def _arun_task_graph(self, refs: Dict[str, str]) -> List[str]:
+        """按依赖关系并发执行已调度的任务：依赖满足的任务立即启动，总耗时取决于关键路径而不是所有工具耗时之和"""
+        outputs: Dict[str, Any] = {}
+        running: Dict[asyncio.Task, Dict[str, Any]] = {}
         while True:
-            task = self.scheduler.get_next_task()
-            if not task:
+            for task in self.scheduler.get_ready_tasks():
+                running[asyncio.create_task(self._arun_task(task, refs, outputs))] = task
+            if not running:
                 break
             
-            # 执行具体任务
-            if "tool" in task_plan:
-                tool_name = task_plan["tool"]
-                params_str = str(task["params"])
-                result = self.tool_registry.execute_tool(tool_name, params_str)
-            else:
-                result = "任务执行完成"
-            
-            results.append(result)
-            task_history.append(f"任务: {task['type']}, 结果: {result}")
-            
-            # 标记任务完成
-            self.scheduler.complete_task(task["task_id"], result)
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                success, output = future.result()
+                if success:
+                    outputs[task["task_id"]] = output
+                self.scheduler.complete_task(task["task_id"], output, success=success)
+        return self._task_history(refs)
+    
+    def _run_task_graph(self, refs: Dict[str, str]) -> List[str]:
+        """_arun_task_graph的同步版本：就绪任务提交到线程池并发执行，不创建事件循环，可以在事件循环内调用"""
+        outputs: Dict[str, Any] = {}
+        running: Dict[Future, Dict[str, Any]] = {}
+        with ThreadPoolExecutor(max_workers=config.tool_max_concurrency, thread_name_prefix="mofy-task") as executor:
+            while True:
+                for task in self.scheduler.get_ready_tasks():
+                    # 工作线程沿用调用方的用量统计上下文
+                    context = contextvars.copy_context()
+                    running[executor.submit(context.run, self._run_task, task, refs, outputs)] = task
+                if not running:
+                    break
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    success, output = future.result()
+                    if success:
+                        outputs[task["task_id"]] = output
+                    self.scheduler.complete_task(task["task_id"], output, success=success)
+        return self._task_history(refs)
+    
+    def _task_history(self, refs: Dict[str, str]) -> List[str]:
+        """任务图执行结束后汇总结果"""
+        # 仍未执行的任务只可能处于循环依赖中
+        task_ids = set(refs.values())
+        for task in self.scheduler.task_queue:
+            if task["task_id"] in task_ids and task["status"] == TaskStatus.PENDING:
+                self.scheduler.complete_task(task["task_id"], "存在循环依赖", success=False)
         
-        # 生成最终回复
-        if results:
-            final_prompt = f"""基于以下任务执行结果，生成自然语言回复:
+        task_history = []
+        for task in self.scheduler.task_queue:
+            if task["task_id"] in task_ids:
+                if task["status"] == TaskStatus.COMPLETED:
+                    task_history.append(f"任务: {task['type']}, 结果: {task['result']}")
+                else:
+                    task_history.append(f"任务: {task['type']}, 失败: {task['result']}")
+        return task_history
+    
+    def _final_prompt(self, task_history: List[str]) -> str:
+        """最终回复提示词"""
+        return f"""基于以下任务执行结果，生成自然语言回复:
 
 任务执行历史:
 {chr(10).join(task_history)}
 
 请生成简洁、有用的回复:
 """
-            response = self.llm_client.invoke(final_prompt)
+    
+    def _template_reply(self, task_plan: Dict[str, Any], refs: Dict[str, str]) -> Optional[str]:
+        """融合模式：所有任务成功时把工具输出套入回复模板，省去最终回复的LLM调用"""
+        template = task_plan.get("reply_template")
+        if not config.fused_plan_answer or not isinstance(template, str) or not template.strip():
+            return None
+        
+        task_ids = set(refs.values())
+        outputs = {}
+        for task in self.scheduler.task_queue:
+            if task["task_id"] in task_ids:
+                if task["status"] != TaskStatus.COMPLETED:
+                    return None
+                outputs[task["task_id"]] = task["result"]
+        
+        reply = self._resolve_params(template, refs, outputs)
+        # 模板引用了不存在的任务时仍交给LLM总结
+        if re.search(r"\$\{[^}]+\}", reply):
+            return None
+        return reply
+    
+    def _execute_task_plan(self, task_plan: Dict[str, Any]) -> str:
+        """执行任务计划，相互独立的工具任务并发执行"""
+        if not task_plan.get("tasks"):
+            return task_plan.get("answer") or "我理解了您的需求，但没有找到合适的工具来处理。"
+        
+        refs = self._schedule_tasks(task_plan)
+        
+        task_history = self._run_task_graph(refs)
+        self._plan_feedback(task_plan, refs)
+        
+        reply = self._template_reply(task_plan, refs)
+        if reply is not None:
+            return reply
+        
+        # 生成最终回复
+        if task_history:
+            with usage_scope(call_site="final_reply"):
+                response = self.llm_client.invoke(self._final_prompt(task_history))
             return response
         else:
             return "任务执行完成，但没有产生具体结果。"
     
-    def _init_builtin_tools(self):
-        """初始化内置工具"""
-        # 示例：计算器工具
-        def calculator(expression: str) -> str:
-            """简单计算器"""
-            try:
-                result = eval(expression)
-                return f"计算结果: {result}"
-            except Exception as e:
-                return f"计算错误: {str(e)}"
-        
-        self.tool_registry.register_tool(
-            "calculator",
-            calculator,
-            {
-                "description": "执行数学计算",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "expression": {
-                            "type": "string",
-                            "description": "数学表达式，如 '2+3*4'"
-                        }
-                    },
-                    "required": ["expression"]
-                }
-            }
-        )
+    async def _aresolve_reply(self, task_plan: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        """执行任务计划，返回(无需LLM的直接回复, 最终回复提示词)，二者只有一个非空"""
+        if not task_plan.get("tasks"):
+            return task_plan.get("answer") or "我理解了您的需求，但没有找到合适的工具来处理。", None
         
-        # 示例：搜索工具
-        def search(query: str) -> str:
-            """模拟搜索工具"""
-            return f"搜索'{query}'的结果：这里应该是搜索结果内容"
-        
-        self.tool_registry.register_tool(
-            "search",
-            search,
-            {
-                "description": "搜索信息",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": "搜索关键词"
-                        }
-                    },
-                    "required": ["query"]
-                }
-            }
-        )
+        refs = self._schedule_tasks(task_plan)
+        task_history = await self._arun_task_graph(refs)
+        self._plan_feedback(task_plan, refs)
+        
+        reply = self._template_reply(task_plan, refs)
+        if reply is not None:
+            return reply, None
+        
+        if not task_history:
+            return "任务执行完成，但没有产生具体结果。", None
+        
+        return None, self._final_prompt(task_history)
+    
+    async def _aexecute_task_plan(self, task_plan: Dict[str, Any]) -> str:
+        """_execute_task_plan的异步版本"""
+        reply, final_prompt = await self._aresolve_reply(task_plan)
+        if reply is not None:
+            return reply
+        
+        with usage_scope(call_site="final_reply"):
+            return await self.llm_client.ainvoke(final_prompt)
+    
+    def to_snapshot(self) -> Dict[str, Any]:
+        """导出会话状态、未完成任务和进程内的短期记忆，用于空闲会话换出"""
+        return {
+            "session_id": self.session_id,
+            "last_active": self.last_active,
+            "last_context": self.last_context,
+            "state": self.state.to_dict(),
+            "scheduler": self.scheduler.export_pending(),
+            "memory": self.memory.export_session(self.session_id)
+        }
+    
+    def restore_snapshot(self, snapshot: Dict[str, Any]):
+        """从to_snapshot的结果恢复会话"""
+        self.last_active = snapshot.get("last_active", self.last_active)
+        self.last_context = snapshot.get("last_context", {})
+        self.state = ConversationState.from_dict(self.session_id, snapshot.get("state", {}))
+        self.scheduler.import_pending(snapshot.get("scheduler", {}))
+        self.memory.import_session(snapshot.get("memory", []))
     
     def get_status(self) -> Dict[str, Any]:
         """获取Agent状态信息"""
@@ -194,5 +498,13 @@ class MofyAgent:
             "last_active": self.last_active,
             "pending_tasks": len([t for t in self.scheduler.task_queue if t["status"].value == "pending"]),
             "completed_tasks": len(self.scheduler.completed_tasks),
-            "tool_metrics": self.tool_registry.get_metrics()
-        }
\ No newline at end of file
+            "tool_metrics": self.tool_registry.get_metrics(),
+            "context": self.last_context,
+            "usage": get_usage_tracker().session_snapshot(self.session_id),
+            "intent_router": get_intent_router().get_stats() if config.intent_router else {},
+            "plan_cache": get_plan_cache().get_stats() if config.plan_cache else {}
+        }
+
+def create_agent(session_id: str = None) -> MofyAgent:
+    """在进程级运行时上创建会话"""
+    return get_agent_runtime().create_session(session_id)
\ No newline at end of file
@@ -0,0 +1,287 @@
+"""
+Mofy Agent Framework - LLM流量录制与回放
+录制模式把每次上游调用的提示词、回答和耗时追加写入JSONL文件（.gz后缀时gzip压缩），缓存命中也会录制；
+回放模式按提示词哈希返回录制的回答，并按原始或缩放后的延迟等待，回放时LLMClient不读写Redis缓存
+"""
+
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional, Iterator
+from loguru import logger
+from .config import config
+from .exceptions import LLMError
+from .mock_provider import MockStream, MockAsyncStream, make_completion, make_chunks, default_response
+from .router import _ClientView
+
+def prompt_hash(prompt: str) -> str:
+    """回放查找使用的提示词哈希"""
+    return hashlib.sha256(prompt.encode()).hexdigest()[:32]
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def iter_cassette(path: str) -> Iterator[Dict[str, Any]]:
+    """按录制顺序遍历记录，跳过末尾未写完的行"""
+    with _open(path, "r") as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"跳过损坏的录制记录: {line[:80]}")
+        except EOFError:
+            # 录制进程异常退出时gzip尾部不完整，已读出的记录仍然有效
+            logger.warning(f"录制文件未正常结束: {path}")
+
+class _RecordingStream:
+    """包装同步流，完整读完后写入一条记录"""
+    
+    def __init__(self, stream, on_complete):
+        self._stream = stream
+        self._on_complete = on_complete
+    
+    def __iter__(self):
+        start = time.perf_counter()
+        first_chunk_ms = None
+        parts = []
+        for chunk in self._stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_chunk_ms is None:
+                    first_chunk_ms = (time.perf_counter() - start) * 1000
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self._on_complete("".join(parts), first_chunk_ms)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def close(self):
+        self._stream.close()
+
+class _RecordingAsyncStream:
+    """包装异步流，完整读完后写入一条记录"""
+    
+    def __init__(self, stream, on_complete):
+        self._stream = stream
+        self._on_complete = on_complete
+    
+    async def __aiter__(self):
+        start = time.perf_counter()
+        first_chunk_ms = None
+        parts = []
+        async for chunk in self._stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_chunk_ms is None:
+                    first_chunk_ms = (time.perf_counter() - start) * 1000
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        await self._on_complete("".join(parts), first_chunk_ms)
+    
+    async def close(self):
+        await self._stream.close()
+
+class CassetteRecorder:
+    """追加写入的录制器，多线程共享一个文件句柄"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = _open(path, "a")
+        self._lock = threading.Lock()
+        self.recorded = 0
+    
+    def record(self, request: Dict[str, Any], response: Optional[str], latency_ms: float,
+               first_chunk_ms: Optional[float] = None, tool_calls: List[Dict[str, Any]] = None, cached: bool = False):
+        """写入一条记录，每条一行并立即刷盘"""
+        prompt = request["messages"][-1]["content"]
+        entry = {
+            "ts": round(time.time(), 3),
+            "key": prompt_hash(prompt),
+            "model": request.get("model"),
+            "stream": bool(request.get("stream")),
+            "latency_ms": round(latency_ms, 1),
+            "prompt": prompt,
+            "response": response
+        }
+        if first_chunk_ms is not None:
+            entry["first_chunk_ms"] = round(first_chunk_ms, 1)
+        if tool_calls:
+            entry["tool_calls"] = tool_calls
+        if cached:
+            entry["cached"] = True
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.recorded += 1
+    
+    async def arecord(self, *args, **kwargs):
+        """record的异步版本，写文件和刷盘放到线程中，不阻塞事件循环"""
+        await asyncio.to_thread(self.record, *args, **kwargs)
+    
+    def record_cache_hit(self, model: str, prompt: str, cached_result: str, tools: bool = False):
+        """写入一条缓存命中记录；回放时不使用Redis缓存，这些提示词同样会到达回放器。
+        tools为True时cached_result是invoke_tools缓存的JSON"""
+        request = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+        if not tools:
+            self.record(request, cached_result, 0.0, cached=True)
+            return
+        result = json.loads(cached_result)
+        tool_calls = [
+            {"name": call["name"], "arguments": call["arguments"] if isinstance(call["arguments"], str)
+             else json.dumps(call["arguments"], ensure_ascii=False)}
+            for call in result["tool_calls"]
+        ]
+        self.record(request, result["content"], 0.0, tool_calls=tool_calls, cached=True)
+    
+    @staticmethod
+    def _response_fields(response: Any):
+        message = response.choices[0].message
+        tool_calls = [
+            {"name": call.function.name, "arguments": call.function.arguments}
+            for call in getattr(message, "tool_calls", None) or []
+        ]
+        return message.content, tool_calls
+    
+    def wrap(self, client):
+        """包装同步客户端，成功的上游调用都会被录制"""
+        def create(**kwargs):
+            start = time.perf_counter()
+            response = client.chat.completions.create(**kwargs)
+            if kwargs.get("stream"):
+                return _RecordingStream(response, lambda text, first_chunk_ms: self.record(
+                    kwargs, text, (time.perf_counter() - start) * 1000, first_chunk_ms))
+            content, tool_calls = self._response_fields(response)
+            self.record(kwargs, content, (time.perf_counter() - start) * 1000, tool_calls=tool_calls)
+            return response
+        return _ClientView(create)
+    
+    def wrap_async(self, client):
+        """包装异步客户端，录制写入在线程中进行"""
+        async def create(**kwargs):
+            start = time.perf_counter()
+            response = await client.chat.completions.create(**kwargs)
+            if kwargs.get("stream"):
+                return _RecordingAsyncStream(response, lambda text, first_chunk_ms: self.arecord(
+                    kwargs, text, (time.perf_counter() - start) * 1000, first_chunk_ms))
+            content, tool_calls = self._response_fields(response)
+            await self.arecord(kwargs, content, (time.perf_counter() - start) * 1000, tool_calls=tool_calls)
+            return response
+        return _ClientView(create)
+    
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class CassettePlayer:
+    """回放录制的回答，client/async_client与OpenAI客户端接口一致"""
+    
+    def __init__(self, path: str, latency_scale: float = 1.0, miss: str = "error"):
+        self.latency_scale = latency_scale
+        self.miss = miss
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in iter_cassette(path):
+            self.entries.setdefault(entry["key"], []).append(entry)
+        # 缓存命中的记录没有上游延迟，只在该提示词没有上游调用记录时使用
+        for key, entries in self.entries.items():
+            upstream = [entry for entry in entries if not entry.get("cached")]
+            if upstream:
+                self.entries[key] = upstream
+        self._cursors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.client = _ClientView(self.create)
+        self.async_client = _ClientView(self.acreate)
+        logger.info(f"加载LLM回放文件: {path}, 共{sum(len(v) for v in self.entries.values())}条记录")
+    
+    def _lookup(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """相同提示词有多条记录时按录制顺序轮流返回"""
+        prompt = request["messages"][-1]["content"]
+        key = prompt_hash(prompt)
+        with self._lock:
+            entries = self.entries.get(key)
+            if entries:
+                self.hits += 1
+                cursor = self._cursors.get(key, 0)
+                self._cursors[key] = cursor + 1
+                return entries[cursor % len(entries)]
+            self.misses += 1
+        
+        if self.miss == "error":
+            raise LLMError(f"回放文件中没有该提示词: {key}")
+        # 未录制的提示词交给模拟Provider的内置模板
+        return {"response": default_response(prompt), "latency_ms": 0.0}
+    
+    def _delays(self, entry: Dict[str, Any], stream: bool, chunks: int):
+        """返回(首个响应前等待, 每个chunk间隔)，单位秒"""
+        total = entry.get("latency_ms", 0.0) * self.latency_scale / 1000
+        if not stream:
+            return total, 0.0
+        first = entry.get("first_chunk_ms", entry.get("latency_ms", 0.0)) * self.latency_scale / 1000
+        return first, max(0.0, total - first) / max(1, chunks)
+    
+    def create(self, **kwargs) -> Any:
+        """回放chat.completions.create"""
+        entry = self._lookup(kwargs)
+        if kwargs.get("stream"):
+            chunks = make_chunks(kwargs, entry["response"])
+            first, interval = self._delays(entry, True, len(chunks))
+            time.sleep(first)
+            return MockStream(chunks, interval)
+        time.sleep(self._delays(entry, False, 0)[0])
+        return make_completion(kwargs, entry["response"], entry.get("tool_calls"))
+    
+    async def acreate(self, **kwargs) -> Any:
+        """create的异步版本"""
+        entry = self._lookup(kwargs)
+        if kwargs.get("stream"):
+            chunks = make_chunks(kwargs, entry["response"])
+            first, interval = self._delays(entry, True, len(chunks))
+            await asyncio.sleep(first)
+            return MockAsyncStream(chunks, interval)
+        await asyncio.sleep(self._delays(entry, False, 0)[0])
+        return make_completion(kwargs, entry["response"], entry.get("tool_calls"))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """回放命中统计"""
+        return {"hits": self.hits, "misses": self.misses, "prompts": len(self.entries)}
+
+_recorder: Optional[CassetteRecorder] = None
+_player: Optional[CassettePlayer] = None
+_cassette_lock = threading.Lock()
+
+def get_cassette_recorder() -> CassetteRecorder:
+    """获取全局录制器"""
+    global _recorder
+    if _recorder is None:
+        with _cassette_lock:
+            if _recorder is None:
+                _recorder = CassetteRecorder(config.llm_cassette_path)
+                logger.info(f"录制LLM流量到: {config.llm_cassette_path}")
+    return _recorder
+
+def get_cassette_player() -> CassettePlayer:
+    """获取全局回放器"""
+    global _player
+    if _player is None:
+        with _cassette_lock:
+            if _player is None:
+                _player = CassettePlayer(
+                    config.llm_cassette_path,
+                    latency_scale=config.llm_cassette_latency_scale,
+                    miss=config.llm_cassette_miss
+                )
+    return _player
@@ -21,14 +21,131 @@ class MofyConfig(BaseSettings):
     siliconflow_api_key: str = Field("", env="SILICONFLOW_API_KEY")
     siliconflow_base_url: str = Field("https://api.siliconflow.cn/v1", env="SILICONFLOW_BASE_URL")
 
+    # 速率限制配置（每分钟额度，0表示不限制）
+    openai_rpm: int = Field(0, env="OPENAI_RPM")
+    openai_tpm: int = Field(0, env="OPENAI_TPM")
+    siliconflow_rpm: int = Field(0, env="SILICONFLOW_RPM")
+    siliconflow_tpm: int = Field(0, env="SILICONFLOW_TPM")
+    llm_expected_completion_tokens: int = Field(512, env="LLM_EXPECTED_COMPLETION_TOKENS")
+    llm_batch_concurrency: int = Field(8, env="LLM_BATCH_CONCURRENCY")
+
+    # 多Provider路由配置（LLM_PROVIDER=router时生效）
+    llm_router_backends: str = Field("", env="LLM_ROUTER_BACKENDS")  # JSON列表: [{"name","base_url","api_key","model"}]
+    llm_router_timeout: float = Field(30, env="LLM_ROUTER_TIMEOUT")
+    llm_router_window: int = Field(100, env="LLM_ROUTER_WINDOW")
+    llm_router_window_seconds: float = Field(300, env="LLM_ROUTER_WINDOW_SECONDS")
+    llm_router_max_error_rate: float = Field(0.5, env="LLM_ROUTER_MAX_ERROR_RATE")
+    llm_router_failure_threshold: int = Field(3, env="LLM_ROUTER_FAILURE_THRESHOLD")
+    llm_router_cooldown: float = Field(30, env="LLM_ROUTER_COOLDOWN")
+
+    # 重试与对冲请求配置
+    llm_retry_max_attempts: int = Field(3, env="LLM_RETRY_MAX_ATTEMPTS")
+    llm_retry_base_delay: float = Field(0.5, env="LLM_RETRY_BASE_DELAY")
+    llm_retry_max_delay: float = Field(8.0, env="LLM_RETRY_MAX_DELAY")
+    llm_retry_max_retry_after: float = Field(60.0, env="LLM_RETRY_MAX_RETRY_AFTER")
+    llm_hedge_enabled: bool = Field(False, env="LLM_HEDGE_ENABLED")
+    llm_hedge_min_samples: int = Field(20, env="LLM_HEDGE_MIN_SAMPLES")
+    llm_hedge_min_delay: float = Field(0.5, env="LLM_HEDGE_MIN_DELAY")
+    llm_hedge_workers: int = Field(32, env="LLM_HEDGE_WORKERS")
+
+    # 连接池配置
+    llm_max_connections: int = Field(200, env="LLM_MAX_CONNECTIONS")
+    llm_max_keepalive: int = Field(50, env="LLM_MAX_KEEPALIVE")
+    redis_max_connections: int = Field(100, env="REDIS_MAX_CONNECTIONS")
+
+    # 请求合并配置
+    llm_distributed_lock: bool = Field(False, env="LLM_DISTRIBUTED_LOCK")
+    llm_lock_timeout: float = Field(60, env="LLM_LOCK_TIMEOUT")
+    llm_lock_poll_interval: float = Field(0.05, env="LLM_LOCK_POLL_INTERVAL")
+
+    # LLM响应缓存配置
+    llm_l1_cache_max_bytes: int = Field(32 * 1024 * 1024, env="LLM_L1_CACHE_MAX_BYTES")
+    llm_l1_cache_ttl: int = Field(300, env="LLM_L1_CACHE_TTL")
+    llm_cache_compress_min_bytes: int = Field(1024, env="LLM_CACHE_COMPRESS_MIN_BYTES")
+    llm_semantic_cache: bool = Field(False, env="LLM_SEMANTIC_CACHE")
+    llm_semantic_cache_threshold: float = Field(0.95, env="LLM_SEMANTIC_CACHE_THRESHOLD")
+    llm_semantic_cache_max_entries: int = Field(2000, env="LLM_SEMANTIC_CACHE_MAX_ENTRIES")
+
+    # 模拟Provider配置（LLM_PROVIDER=mock时生效）
+    mock_script_file: str = Field("", env="MOCK_SCRIPT_FILE")  # 脚本化响应规则，JSON列表或JSONL
+    mock_latency_distribution: str = Field("lognormal", env="MOCK_LATENCY_DISTRIBUTION")  # fixed/uniform/normal/lognormal
+    mock_latency_ms: float = Field(200, env="MOCK_LATENCY_MS")
+    mock_latency_sigma: float = Field(0.5, env="MOCK_LATENCY_SIGMA")
+    mock_stream_chunk_ms: float = Field(10, env="MOCK_STREAM_CHUNK_MS")
+    mock_error_rate: float = Field(0.0, env="MOCK_ERROR_RATE")
+    mock_error_types: str = Field("500,429,timeout", env="MOCK_ERROR_TYPES")
+    mock_seed: int = Field(42, env="MOCK_SEED")
+
+    # LLM流量录制/回放配置
+    llm_cassette_mode: str = Field("", env="LLM_CASSETTE_MODE")  # 空为关闭，record为录制（含缓存命中），replay为回放（不读写Redis缓存）
+    llm_cassette_path: str = Field("cassettes/llm.jsonl", env="LLM_CASSETTE_PATH")  # .gz后缀时压缩存储
+    llm_cassette_latency_scale: float = Field(1.0, env="LLM_CASSETTE_LATENCY_SCALE")  # 回放延迟倍数，0为不等待
+    llm_cassette_miss: str = Field("error", env="LLM_CASSETTE_MISS")  # 未录制的提示词：error报错，mock使用模拟模板
+
+    # 推理模型（如DeepSeek-R1）的<think>思考内容不返回、不缓存、不写入记忆
+    llm_strip_reasoning: bool = Field(True, env="LLM_STRIP_REASONING")
+    # 模型名包含这些片段（逗号分隔，不区分大小写）时视为推理模型
+    llm_reasoning_models: str = Field("deepseek-r1,r1-distill,qwq,reasoner", env="LLM_REASONING_MODELS")
+    # 推理模型流式输出开头最多缓存的字符数，用于识别省略了<think>的思考块；其他模型不缓存，首个token到达即输出
+    llm_reasoning_hold_chars: int = Field(2048, env="LLM_REASONING_HOLD_CHARS")
+
+    # 原生工具调用：通过tools参数发送工具定义，替代提示词中的JSON计划
+    llm_tool_calling: bool = Field(False, env="LLM_TOOL_CALLING")
+
+    # 融合模式：意图分析同时返回直接回复或回复模板，可省去最终回复的LLM调用
+    fused_plan_answer: bool = Field(False, env="FUSED_PLAN_ANSWER")
+
+    # 用量统计配置
+    llm_pricing: str = Field("", env="LLM_PRICING")  # JSON，如{"model": {"input": 1.0, "cached_input": 0.5, "output": 2.0}}，单位为每百万token价格
+    usage_max_sessions: int = Field(10000, env="USAGE_MAX_SESSIONS")
+
+    # 上下文token预算配置
+    tokenizer: str = Field("approx", env="TOKENIZER")  # approx为本地近似计数，tiktoken为精确计数
+    context_window: int = Field(0, env="CONTEXT_WINDOW")  # 0表示按模型自动选择
+    context_reserve_tokens: int = Field(1024, env="CONTEXT_RESERVE_TOKENS")  # 预留给提示词模板和模型输出
+    memory_context_max_tokens: int = Field(0, env="MEMORY_CONTEXT_MAX_TOKENS")  # 0表示只受模型窗口限制
+    state_context_max_tokens: int = Field(200, env="STATE_CONTEXT_MAX_TOKENS")
+
     # 记忆配置
     short_term_memory_ttl: int = Field(3600, env="SHORT_TERM_TTL")
+    short_term_memory_max_entries: int = Field(100, env="SHORT_TERM_MAX_ENTRIES")  # 每个会话在进程内保留的条数
     enable_long_term_memory: bool = Field(True, env="ENABLE_LONG_MEMORY")
     redis_url: str = Field("redis://localhost:6379/0", env="REDIS_URL")
 
+    # 会话管理配置（空闲会话换出到Redis，下一条消息到达时恢复）
+    session_idle_timeout: int = Field(1800, env="SESSION_IDLE_TIMEOUT")
+    session_max_active: int = Field(10000, env="SESSION_MAX_ACTIVE")  # 常驻内存的最大会话数
+    session_snapshot_ttl: int = Field(86400, env="SESSION_SNAPSHOT_TTL")
+    session_sweep_interval: int = Field(60, env="SESSION_SWEEP_INTERVAL")
+
+    # HTTP服务配置（python run.py --serve）
+    server_host: str = Field("0.0.0.0", env="SERVER_HOST")
+    server_port: int = Field(8000, env="SERVER_PORT")
+    server_max_concurrency: int = Field(256, env="SERVER_MAX_CONCURRENCY")  # 同时处理的对话请求数
+    admission_tenant_max_inflight: int = Field(0, env="ADMISSION_TENANT_MAX_INFLIGHT")  # 单租户在途+排队上限，0表示不限制
+    admission_max_queue: int = Field(512, env="ADMISSION_MAX_QUEUE")
+    admission_max_queue_time: float = Field(10, env="ADMISSION_MAX_QUEUE_TIME")  # 预计或实际排队超过该秒数时返回503
+    server_keepalive_timeout: float = Field(75, env="SERVER_KEEPALIVE_TIMEOUT")  # 应大于负载均衡的空闲超时
+    server_drain_timeout: float = Field(30, env="SERVER_DRAIN_TIMEOUT")  # 关闭时等待进行中请求的最长时间
+    server_workers: int = Field(1, env="SERVER_WORKERS")  # 大于1时启用多进程模式，按会话ID分配工作进程
+    server_worker_base_port: int = Field(9100, env="SERVER_WORKER_BASE_PORT")  # 工作进程监听127.0.0.1上从该端口开始的端口
+
     # 工具配置
     tool_timeout: int = Field(3, env="TOOL_TIMEOUT")
     max_tool_retries: int = Field(2, env="TOOL_RETRIES")
+    tool_max_concurrency: int = Field(4, env="TOOL_MAX_CONCURRENCY")  # 单个工具的默认最大并发数
+
+    # 本地意图路由配置（高置信度消息跳过意图分析的LLM调用）
+    intent_router: bool = Field(False, env="INTENT_ROUTER")
+    intent_router_threshold: float = Field(0.6, env="INTENT_ROUTER_THRESHOLD")
+    intent_router_min_examples: int = Field(3, env="INTENT_ROUTER_MIN_EXAMPLES")  # 分类器每个类别至少需要的样本数
+    intent_router_train_file: str = Field("", env="INTENT_ROUTER_TRAIN_FILE")  # JSONL训练样本，每行{"message", "plan"}
+
+    # 任务计划缓存配置（结构相同、槽位值不同的消息复用计划模板）
+    plan_cache: bool = Field(False, env="PLAN_CACHE")
+    plan_cache_max_entries: int = Field(1000, env="PLAN_CACHE_MAX_ENTRIES")
+    plan_cache_ttl: int = Field(86400, env="PLAN_CACHE_TTL")
+    plan_cache_max_failures: int = Field(2, env="PLAN_CACHE_MAX_FAILURES")  # 模板连续执行失败达到该次数后淘汰
 
     # 日志配置
     log_level: str = Field("INFO", env="LOG_LEVEL")
@@ -44,7 +161,7 @@ class MofyConfig(BaseSettings):
     @validator("llm_provider")
     def validate_provider(cls, v):
         """验证LLM提供商合法性"""
-        if v not in ["openai", "anthropic", "modelscope", "zhipu", "siliconflow"]:
+        if v not in ["openai", "anthropic", "modelscope", "zhipu", "siliconflow", "router", "mock"]:
             raise ValueError(f"不支持的LLM提供商: {v}")
         return v
 
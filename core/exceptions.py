@@ -39,6 +39,13 @@ class TimeoutError(MofyException):
     """超时错误"""
     pass
 
+class AdmissionError(MofyException):
+    """准入控制拒绝请求"""
+    def __init__(self, message: str, status_code: int = 503, retry_after: int = 1):
+        self.status_code = status_code
+        self.retry_after = retry_after
+        super().__init__(message)
+
 class ToolExecutionError(MofyException):
     """工具执行异常"""
     def __init__(self, tool_name: str, message: str):
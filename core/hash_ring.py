@@ -0,0 +1,52 @@
+"""
+Mofy Agent Framework - 一致性哈希环
+把会话ID稳定地映射到工作进程，增减进程时只有约1/N的会话需要迁移
+"""
+
+import bisect
+import hashlib
+from typing import List, Iterable, Optional
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+class ConsistentHashRing:
+    """带虚拟节点的一致性哈希环，节点和键都是字符串"""
+    
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 128):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.nodes: List[str] = []
+        for node in nodes:
+            self.add_node(node)
+    
+    def add_node(self, node: str):
+        """添加节点，已存在时忽略"""
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+    
+    def remove_node(self, node: str):
+        """移除节点，不存在时忽略"""
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in kept]
+        self._owners = [o for _, o in kept]
+    
+    def get_node(self, key: str) -> Optional[str]:
+        """键所属的节点，环为空时返回None"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+    
+    def __len__(self) -> int:
+        return len(self.nodes)
@@ -0,0 +1,252 @@
+"""
+Mofy Agent Framework - 本地意图路由
+高置信度的消息直接由正则规则或本地n-gram分类器生成任务计划，跳过意图分析的LLM调用
+"""
+
+import re
+import json
+import math
+import threading
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple, Iterable, Set, Callable
+from loguru import logger
+from .config import config
+from .semantic_cache import NGramHashEmbedder, SparseVector, normalize_prompt
+from .plan_cache import slot_pattern
+
+_TRAILING_PUNCT = "？?。.!！~ "
+
+def _strip_message(message: str) -> str:
+    return message.strip().rstrip(_TRAILING_PUNCT)
+
+def make_plan(tool: str, parameters: Dict[str, Any], intent: str, source: str, confidence: float) -> Dict[str, Any]:
+    """构造与LLM意图分析格式一致的单任务计划"""
+    return {
+        "intent": intent,
+        "tasks": [{"type": tool, "tool": tool, "parameters": parameters, "priority": 5}],
+        "source": source,
+        "confidence": round(confidence, 3)
+    }
+
+class IntentRule:
+    """正则规则：命名分组即工具参数"""
+    
+    def __init__(self, name: str, pattern: str, tool: str, confidence: float = 1.0):
+        self.name = name
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.tool = tool
+        self.confidence = confidence
+    
+    def match(self, message: str) -> Optional[Dict[str, Any]]:
+        match = self.pattern.search(message)
+        if not match:
+            return None
+        parameters = {k: v.strip() for k, v in match.groupdict().items() if v and v.strip()}
+        if len(parameters) != len(match.groupdict()):
+            return None
+        return make_plan(self.tool, parameters, self.name, "rule", self.confidence)
+
+class NGramIntentClassifier:
+    """TF-IDF加权的字符n-gram最近质心分类器，从LLM生成的单工具计划中在线学习
+    
+    类别为工具名；参数取值从训练样本中学到的前后缀模板提取，
+    例如"查询北京天气"学到("查询", "天气")，新消息"查询上海天气"提取出"上海"。
+    训练和打分都使用槽位被屏蔽后的完整消息（"查询#天气"），查询向量不丢弃任何特征；
+    提取出的取值还必须与训练样本的取值同类（见slot_pattern）。
+    """
+    
+    def __init__(self, min_examples: int = 3, max_affixes: int = 50):
+        self.min_examples = min_examples
+        self.max_affixes = max_affixes
+        self.embedder = NGramHashEmbedder(ngram_range=(1, 2))
+        self.documents = 0
+        self.document_freq: Counter = Counter()
+        self.centroids: Dict[str, SparseVector] = {}  # 类别 -> 各样本单位tf向量之和
+        self.examples: Counter = Counter()
+        self.affixes: Dict[str, Dict[Tuple[str, str, str, str], int]] = {}  # 类别 -> (参数名, 前缀, 后缀, 取值字符类) -> 次数
+    
+    @staticmethod
+    def _learnable(plan: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """只从单任务、单个字符串参数的计划学习"""
+        tasks = plan.get("tasks") or []
+        if len(tasks) != 1 or not tasks[0].get("tool"):
+            return None
+        parameters = tasks[0].get("parameters")
+        if not isinstance(parameters, dict) or len(parameters) != 1:
+            return None
+        value = next(iter(parameters.values()))
+        if not isinstance(value, str) or not value.strip():
+            return None
+        return tasks[0]["tool"], parameters
+    
+    def _tf(self, prefix: str, suffix: str) -> SparseVector:
+        """槽位屏蔽为#后的消息的单位tf向量"""
+        vector = self.embedder(normalize_prompt(f"{prefix}#{suffix}"))
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {feature: v / norm for feature, v in vector.items()}
+    
+    def _idf(self, feature: int) -> float:
+        return math.log((1 + self.documents) / (1 + self.document_freq.get(feature, 0))) + 1.0
+    
+    def observe(self, message: str, plan: Dict[str, Any]):
+        """记录一条(消息, 计划)训练样本"""
+        learnable = self._learnable(plan)
+        if not learnable:
+            return
+        label, parameters = learnable
+        text = _strip_message(message)
+        name, value = next(iter(parameters.items()))
+        index = text.find(value.strip())
+        if index == -1:
+            return
+        prefix, suffix = text[:index], text[index + len(value.strip()):]
+        if not prefix and not suffix:
+            return
+        
+        tf = self._tf(prefix, suffix)
+        self.documents += 1
+        self.document_freq.update(tf.keys())
+        centroid = self.centroids.setdefault(label, {})
+        for feature, weight in tf.items():
+            centroid[feature] = centroid.get(feature, 0.0) + weight
+        self.examples[label] += 1
+        
+        affixes = self.affixes.setdefault(label, {})
+        key = (name, prefix, suffix, slot_pattern(value))
+        if key in affixes or len(affixes) < self.max_affixes:
+            affixes[key] = affixes.get(key, 0) + 1
+    
+    def _extract(self, label: str, text: str) -> Optional[Tuple[str, str, str, str]]:
+        """按该类别学到的前后缀模板提取(参数名, 取值, 前缀, 后缀)，取值须与训练样本同类"""
+        # 优先使用出现次数多、更具体（前后缀更长）的模板
+        affixes = sorted(self.affixes[label].items(),
+                         key=lambda item: (item[1], len(item[0][1]) + len(item[0][2])), reverse=True)
+        for (name, prefix, suffix, pattern), _ in affixes:
+            if text.startswith(prefix) and text.endswith(suffix) and len(text) > len(prefix) + len(suffix):
+                value = text[len(prefix):len(text) - len(suffix)].strip()
+                if value and re.fullmatch(pattern, value):
+                    return name, value, prefix, suffix
+        return None
+    
+    def predict(self, message: str, tools: Set[str] = None) -> Optional[Tuple[Dict[str, Any], float]]:
+        """返回(计划, 置信度)；无法提取参数时返回None"""
+        text = _strip_message(message)
+        
+        best, best_score = None, 0.0
+        for label, centroid in self.centroids.items():
+            if self.examples[label] < self.min_examples or (tools is not None and label not in tools):
+                continue
+            extracted = self._extract(label, text)
+            if extracted is None:
+                continue
+            name, value, prefix, suffix = extracted
+            query = {f: w * self._idf(f) for f, w in self._tf(prefix, suffix).items()}
+            query_norm = math.sqrt(sum(v * v for v in query.values())) or 1.0
+            weighted_norm = math.sqrt(sum((v * self._idf(f)) ** 2 for f, v in centroid.items())) or 1.0
+            score = sum(q * centroid.get(f, 0.0) * self._idf(f) for f, q in query.items()) / (query_norm * weighted_norm)
+            if score > best_score:
+                best, best_score = (label, name, value), score
+        if best is None:
+            return None
+        
+        label, name, value = best
+        return make_plan(label, {name: value}, label, "classifier", best_score), best_score
+
+class IntentRouter:
+    """本地意图路由：先匹配规则，再查询分类器，置信度不足时交给LLM"""
+    
+    def __init__(self, threshold: float = 0.6, classifier: Any = None):
+        self.threshold = threshold
+        self.rules: Dict[str, IntentRule] = {}
+        # 可替换为任意实现了observe(message, plan)和predict(message, tools)的分类器
+        self.classifier = classifier or NGramIntentClassifier(min_examples=config.intent_router_min_examples)
+        self.stats = {"routed": 0, "rule_hits": 0, "classifier_hits": 0, "fallbacks": 0, "observed": 0}
+        self._lock = threading.Lock()
+    
+    def add_rule(self, name: str, pattern: str, tool: str, confidence: float = 1.0):
+        """注册规则，同名规则会被覆盖"""
+        with self._lock:
+            self.rules[name] = IntentRule(name, pattern, tool, confidence)
+    
+    def route(self, message: str, tools: Iterable[str] = None,
+              validate: Callable[[str, Dict[str, Any]], Any] = None) -> Optional[Dict[str, Any]]:
+        """返回高置信度的任务计划，否则返回None；tools限定当前Agent可用的工具，
+        validate(工具名, 参数)按工具schema检查生成的参数，不符合时抛出ValueError，该计划不采用"""
+        tools = set(tools) if tools is not None else None
+        
+        def accepted(plan: Dict[str, Any]) -> bool:
+            if validate is None:
+                return True
+            task = plan["tasks"][0]
+            try:
+                validate(task["tool"], task["parameters"])
+            except ValueError as e:
+                logger.debug(f"快速路由计划参数不符合工具schema: {e}")
+                return False
+            return True
+        
+        with self._lock:
+            self.stats["routed"] += 1
+            plan = None
+            for rule in self.rules.values():
+                if tools is not None and rule.tool not in tools:
+                    continue
+                plan = rule.match(message)
+                if plan and rule.confidence >= self.threshold and accepted(plan):
+                    break
+                plan = None
+            
+            if plan:
+                self.stats["rule_hits"] += 1
+            else:
+                predicted = self.classifier.predict(message, tools)
+                if predicted and predicted[1] >= self.threshold and accepted(predicted[0]):
+                    plan = predicted[0]
+                    self.stats["classifier_hits"] += 1
+                else:
+                    self.stats["fallbacks"] += 1
+        
+        if plan:
+            logger.debug(f"意图快速路由命中({plan['source']}): {plan['intent']} 置信度{plan['confidence']}")
+        return plan
+    
+    def observe(self, message: str, plan: Dict[str, Any]):
+        """记录LLM生成的计划作为分类器训练样本"""
+        with self._lock:
+            self.classifier.observe(message, plan)
+            self.stats["observed"] += 1
+    
+    def load(self, path: str) -> int:
+        """从JSONL文件加载训练样本，每行包含message和plan"""
+        count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.observe(entry["message"], entry["plan"])
+                    count += 1
+        logger.info(f"加载意图路由训练样本: {path}, 共{count}条")
+        return count
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """快速路由命中统计"""
+        with self._lock:
+            stats = dict(self.stats)
+        hits = stats["rule_hits"] + stats["classifier_hits"]
+        stats["fast_path_rate"] = hits / stats["routed"] if stats["routed"] else 0.0
+        return stats
+
+_intent_router: Optional[IntentRouter] = None
+_intent_router_lock = threading.Lock()
+
+def get_intent_router() -> IntentRouter:
+    """获取进程级意图路由器，所有会话共享学到的样本"""
+    global _intent_router
+    if _intent_router is None:
+        with _intent_router_lock:
+            if _intent_router is None:
+                router = IntentRouter(threshold=config.intent_router_threshold)
+                if config.intent_router_train_file:
+                    router.load(config.intent_router_train_file)
+                _intent_router = router
+    return _intent_router
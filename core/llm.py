@@ -5,62 +5,382 @@ Mofy Agent Framework - LLM客户端封装
 
 import json
 import time
+import asyncio
 import hashlib
-from typing import Dict, Any, Optional
-from openai import OpenAI
+import threading
+import contextvars
+from typing import Dict, Any, Optional, Iterator, AsyncIterator, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
 from .config import config
 from .exceptions import LLMError
+from .singleflight import SingleFlight, AsyncSingleFlight
+from .llm_cache import LRUCache, LLMResponseCache
+from .semantic_cache import SemanticCache
+from .rate_limit import get_rate_limiter, request_tokens, estimate_tokens
+from .router import LLMRouter, BackendStats, load_router_backends
+from .retry import RetryPolicy, Hedger
+from .mock_provider import get_mock_backend
+from .cassette import get_cassette_recorder, get_cassette_player
+from .usage import get_usage_tracker
+from .reasoning import ReasoningFilter, split_reasoning, stream_hold_limit
+from .loop_local import LoopLocal
 import redis
+from redis.exceptions import LockError
+import redis.asyncio as aioredis
 from loguru import logger
 
+# 进程级共享连接池，所有LLMClient实例复用同一组连接；异步连接绑定事件循环，每个事件循环各一份
+_redis_pools: Dict[str, redis.ConnectionPool] = {}
+_async_redis_pools: Dict[str, LoopLocal] = {}
+_http_clients: Dict[str, Any] = {}
+
+# 进程级请求合并，跨会话的相同提示词共享一次上游调用
+_singleflight = SingleFlight()
+_async_singleflight = AsyncSingleFlight()
+
+# 进程内L1响应缓存，位于Redis之前
+_l1_cache = LRUCache(config.llm_l1_cache_max_bytes)
+
+# 可选的语义缓存，近似重复的提示词复用已缓存的回答
+_semantic_cache = SemanticCache(
+    threshold=config.llm_semantic_cache_threshold,
+    max_entries=config.llm_semantic_cache_max_entries
+) if config.llm_semantic_cache else None
+
+def _split_answer(message: Any) -> Tuple[str, str]:
+    """分离思考内容与回答，只有回答会被缓存、返回和写入记忆"""
+    content = message.content or ""
+    reasoning = getattr(message, "reasoning_content", None) or ""
+    if not config.llm_strip_reasoning:
+        return reasoning, content
+    inline_reasoning, answer = split_reasoning(content)
+    return reasoning or inline_reasoning, answer
+
+def _record_answer(prompt: str, response: Any) -> str:
+    """取出非流式响应中的回答并记录用量，同步/异步调用共用"""
+    reasoning, result = _split_answer(response.choices[0].message)
+    get_usage_tracker().record_response(config.model_name, prompt, response, reasoning)
+    return result
+
+class _StreamAnswer:
+    """流式回答中与I/O无关的部分，stream/astream共用：思考内容直接跳过，回答部分到达即输出"""
+    
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.raw: List[str] = []
+        self.reasoning = ReasoningFilter(enabled=config.llm_strip_reasoning, hold_limit=stream_hold_limit())
+    
+    def feed(self, chunk: Any) -> str:
+        """处理一个chunk，返回可以立即输出的回答片段"""
+        if not chunk.choices:
+            return ""
+        delta = chunk.choices[0].delta
+        self.reasoning.feed_reasoning(getattr(delta, "reasoning_content", None))
+        self.raw.append(delta.content or "")
+        return self.reasoning.feed(self.raw[-1])
+    
+    def flush(self) -> str:
+        return self.reasoning.flush()
+    
+    def finish(self) -> str:
+        """流结束后按完整文本重新分离思考内容与回答并记录用量，返回写入缓存的回答；
+        思考块超过缓存上限已被当作回答输出时，也不会污染invoke共用的缓存键"""
+        text = "".join(self.raw)
+        if config.llm_strip_reasoning:
+            inline_reasoning, result = split_reasoning(text)
+            reasoning_text = self.reasoning.reasoning or inline_reasoning
+        else:
+            reasoning_text, result = self.reasoning.reasoning, text
+        reasoning_tokens = estimate_tokens(reasoning_text)
+        get_usage_tracker().record(config.model_name, estimate_tokens(self.prompt), estimate_tokens(result) + reasoning_tokens,
+                                   estimated=True, reasoning_tokens=reasoning_tokens)
+        return result
+
+def get_redis_pool(redis_url: str) -> redis.ConnectionPool:
+    """获取共享的同步Redis连接池"""
+    if redis_url not in _redis_pools:
+        _redis_pools[redis_url] = redis.ConnectionPool.from_url(
+            redis_url, max_connections=config.redis_max_connections
+        )
+    return _redis_pools[redis_url]
+
+def get_async_redis_pool(redis_url: str) -> aioredis.ConnectionPool:
+    """获取当前事件循环共享的异步Redis连接池，需在事件循环中调用"""
+    if redis_url not in _async_redis_pools:
+        _async_redis_pools[redis_url] = LoopLocal(lambda: aioredis.ConnectionPool.from_url(
+            redis_url, max_connections=config.redis_max_connections
+        ))
+    return _async_redis_pools[redis_url].get()
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=config.llm_max_connections,
+        max_keepalive_connections=config.llm_max_keepalive
+    )
+
+_http_clients["async"] = LoopLocal(lambda: DefaultAsyncHttpxClient(limits=_http_limits()))
+
+def _get_http_client(is_async: bool):
+    """获取共享的HTTP客户端，限制到Provider的最大并发连接数；异步客户端属于当前事件循环，需在事件循环中调用"""
+    if is_async:
+        return _http_clients["async"].get()
+    if "sync" not in _http_clients:
+        _http_clients["sync"] = DefaultHttpxClient(limits=_http_limits())
+    return _http_clients["sync"]
+
+# 重试、对冲请求及其依赖的Provider延迟统计
+_retry_policy = RetryPolicy(
+    max_attempts=config.llm_retry_max_attempts,
+    base_delay=config.llm_retry_base_delay,
+    max_delay=config.llm_retry_max_delay,
+    max_retry_after=config.llm_retry_max_retry_after
+)
+_hedger = Hedger(max_workers=config.llm_hedge_workers)
+_latency_stats = BackendStats(window=config.llm_router_window, window_seconds=config.llm_router_window_seconds)
+
+_router: Optional[LLMRouter] = None
+
+def get_router() -> LLMRouter:
+    """获取进程共享的多后端路由，所有LLMClient共用同一份延迟统计"""
+    global _router
+    if _router is None:
+        _router = LLMRouter(load_router_backends(_get_http_client(False), lambda: _get_http_client(True)))
+    return _router
+
 class LLMClient:
     """LLM客户端封装，支持多种Provider和缓存"""
     
     def __init__(self):
+        self.router = get_router() if config.llm_provider == "router" else None
         self.client = self._init_client()
-        self.redis_client = redis.Redis.from_url(config.redis_url)
+        self.async_client = self._init_client(is_async=True)
+        if config.llm_cassette_mode == "record":
+            # 录制所有成功的上游调用，供离线回放压测
+            recorder = get_cassette_recorder()
+            self.client = recorder.wrap(self.client)
+            self.async_client = recorder.wrap_async(self.async_client)
+        if config.llm_cassette_mode == "replay":
+            # 回放模式不读写Redis：共享的llm_cache:键里是真实Provider的回答，会抢在回放器之前返回，
+            # 回放的回答也不能写回生产缓存；进程内的L1缓存和请求合并照常工作
+            self.redis_client = None
+            self.async_redis_client = None
+        else:
+            self.redis_client = redis.Redis(connection_pool=get_redis_pool(config.redis_url))
+            self.async_redis_client = LoopLocal(
+                lambda: aioredis.Redis(connection_pool=get_async_redis_pool(config.redis_url))
+            )
+        self.cache = LLMResponseCache(
+            self.redis_client,
+            self.async_redis_client,
+            _l1_cache,
+            l1_ttl=config.llm_l1_cache_ttl,
+            compress_min_bytes=config.llm_cache_compress_min_bytes
+        )
+        self.semantic_cache = _semantic_cache
+        # 路由模式由LLMRouter按实际调用的后端限流
+        self.rate_limiter = None if self.router else get_rate_limiter(config.llm_provider)
     
-    def _init_client(self):
+    def _init_client(self, is_async: bool = False):
         """根据配置初始化对应的LLM客户端"""
-        if config.llm_provider == "openai":
+        if config.llm_cassette_mode == "replay":
+            # 回放模式不访问任何Provider
+            player = get_cassette_player()
+            return player.async_client if is_async else player.client
+        
+        if config.llm_provider == "router":
+            # 路由模式对外暴露与OpenAI客户端相同的接口
+            return self.router.async_client if is_async else self.router.client
+        
+        elif config.llm_provider == "mock":
+            # 离线模拟后端，无需密钥
+            backend = get_mock_backend()
+            return backend.async_client if is_async else backend.client
+        
+        elif config.llm_provider == "openai":
             if not config.openai_api_key:
                 raise LLMError("OpenAI API密钥未配置")
-            return OpenAI(api_key=config.openai_api_key)
+            return self._provider_client(is_async, api_key=config.openai_api_key)
         
         elif config.llm_provider == "siliconflow":
             if not config.siliconflow_api_key:
                 raise LLMError("硅基流动API密钥未配置")
-            return OpenAI(
+            return self._provider_client(
+                is_async,
                 api_key=config.siliconflow_api_key,
                 base_url=config.siliconflow_base_url
             )
         
         else:
             raise LLMError(f"不支持的LLM提供商: {config.llm_provider}")
+    
+    @staticmethod
+    def _provider_client(is_async: bool, **kwargs):
+        """OpenAI兼容客户端，异步客户端在每个事件循环中首次使用时创建"""
+        if is_async:
+            return LoopLocal(lambda: AsyncOpenAI(http_client=_get_http_client(True), max_retries=0, **kwargs))
+        return OpenAI(http_client=_get_http_client(False), max_retries=0, **kwargs)
+    
+    def _cache_key(self, prompt: str) -> str:
+        """生成缓存键"""
+        return f"llm_cache:{config.llm_provider}:{config.model_name}:{hashlib.md5(prompt.encode()).hexdigest()}"
+    
+    def _semantic_namespace(self, prompt: str, semantic_key: str) -> str:
+        """语义缓存只在相同Provider、模型和相同模板（提示词去掉可变部分后完全一致）之间复用"""
+        template = hashlib.md5(prompt.replace(semantic_key, "\0").encode()).hexdigest()
+        return f"{config.llm_provider}:{config.model_name}:{template}"
+    
+    def _semantic_lookup(self, prompt: str, semantic_key: str = None) -> Optional[str]:
+        """按提示词中的可变部分（如用户消息）查找近似重复的缓存回答，调用方未指定时不查找"""
+        if self.semantic_cache is None or not semantic_key:
+            return None
+        similar_key = self.semantic_cache.lookup(semantic_key, self._semantic_namespace(prompt, semantic_key))
+        if similar_key is None:
+            return None
+        cached_result = self.cache.get(similar_key)
+        if cached_result is None:
+            self.semantic_cache.discard(similar_key)
+        return cached_result
+    
+    async def _asemantic_lookup(self, prompt: str, semantic_key: str = None) -> Optional[str]:
+        """_semantic_lookup的异步版本"""
+        if self.semantic_cache is None or not semantic_key:
+            return None
+        similar_key = self.semantic_cache.lookup(semantic_key, self._semantic_namespace(prompt, semantic_key))
+        if similar_key is None:
+            return None
+        cached_result = await self.cache.aget(similar_key)
+        if cached_result is None:
+            self.semantic_cache.discard(similar_key)
+        return cached_result
+    
+    def _remember_prompt(self, prompt: str, cache_key: str, semantic_key: str = None):
+        """将新缓存的提示词按其可变部分加入语义索引"""
+        if self.semantic_cache is not None and semantic_key:
+            self.semantic_cache.add(semantic_key, cache_key, self._semantic_namespace(prompt, semantic_key))
+    
+    def _cache_hit(self, prompt: str, cached_result: str, tools: bool = False):
+        """缓存命中计入用量；录制模式下同时写入录制文件，回放时没有Redis缓存，这些提示词同样由回放器回答"""
+        get_usage_tracker().record_cache_hit(config.model_name, prompt, cached_result)
+        if config.llm_cassette_mode == "record":
+            get_cassette_recorder().record_cache_hit(config.model_name, prompt, cached_result, tools)
+    
+    async def _acache_hit(self, prompt: str, cached_result: str, tools: bool = False):
+        """_cache_hit的异步版本，录制写入在线程中进行"""
+        get_usage_tracker().record_cache_hit(config.model_name, prompt, cached_result)
+        if config.llm_cassette_mode == "record":
+            await asyncio.to_thread(get_cassette_recorder().record_cache_hit, config.model_name, prompt, cached_result, tools)
+    
+    def _cached_answer(self, prompt: str, cache_key: str, semantic_key: str = None) -> Optional[str]:
+        """依次尝试进程内缓存、Redis缓存和语义缓存，invoke与stream共用"""
+        cached_result = self.cache.get(cache_key)
+        if cached_result is not None:
+            logger.info(f"LLM缓存命中: {cache_key[:16]}")
+        else:
+            cached_result = self._semantic_lookup(prompt, semantic_key)
+            if cached_result is None:
+                return None
+            logger.info(f"LLM语义缓存命中: {cache_key[:16]}")
+        self._cache_hit(prompt, cached_result)
+        return cached_result
+    
+    async def _acached_answer(self, prompt: str, cache_key: str, semantic_key: str = None) -> Optional[str]:
+        """_cached_answer的异步版本，查询Redis不阻塞事件循环"""
+        cached_result = await self.cache.aget(cache_key)
+        if cached_result is not None:
+            logger.info(f"LLM缓存命中: {cache_key[:16]}")
+        else:
+            cached_result = await self._asemantic_lookup(prompt, semantic_key)
+            if cached_result is None:
+                return None
+            logger.info(f"LLM语义缓存命中: {cache_key[:16]}")
+        await self._acache_hit(prompt, cached_result)
+        return cached_result
+    
+    def _build_request(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """构造chat.completions请求参数，同步/异步调用共用"""
+        return {
+            "model": config.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": config.temperature,
+            **kwargs
+        }
         
-    def invoke(self, prompt: str, cache_ttl: int = 3600, **kwargs) -> str:
-        """带缓存的LLM调用"""
-        # 生成缓存键
-        cache_key = f"llm_cache:{config.llm_provider}:{config.model_name}:{hashlib.md5(prompt.encode()).hexdigest()}"
+    def _hedge_delay(self, request: Dict[str, Any]) -> Optional[float]:
+        """对冲等待时间取近期p95延迟，样本不足或流式请求时不对冲"""
+        if not config.llm_hedge_enabled or request.get("stream"):
+            return None
+        if len(_latency_stats.latencies) < config.llm_hedge_min_samples:
+            return None
+        return max(_latency_stats.percentile(0.95), config.llm_hedge_min_delay)
+    
+    def _timed_create(self, request: Dict[str, Any]) -> Any:
+        # 每次尝试（包括重试和对冲请求）都占用一次额度
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(request_tokens(request))
+        start = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(**request)
+        except Exception:
+            _latency_stats.record(time.perf_counter() - start, success=False)
+            raise
+        if not request.get("stream"):
+            _latency_stats.record(time.perf_counter() - start, success=True)
+        return response
+    
+    async def _atimed_create(self, request: Dict[str, Any]) -> Any:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.aacquire(request_tokens(request))
+        start = time.perf_counter()
+        try:
+            response = await self.async_client.chat.completions.create(**request)
+        except Exception:
+            _latency_stats.record(time.perf_counter() - start, success=False)
+            raise
+        if not request.get("stream"):
+            _latency_stats.record(time.perf_counter() - start, success=True)
+        return response
+    
+    def _create(self, request: Dict[str, Any]) -> Any:
+        """调用Provider：瞬时错误按指数退避重试，慢请求可对冲"""
+        def attempt():
+            delay = self._hedge_delay(request)
+            if delay is None:
+                return self._timed_create(request)
+            return _hedger.call(lambda: self._timed_create(request), delay)
         
-        # 尝试从Redis获取缓存
-        cached_result = self.redis_client.get(cache_key)
-        if cached_result:
-            logger.info(f"LLM缓存命中: {cache_key[:16]}")
-            return cached_result.decode()
+        return _retry_policy.call(attempt)
+    
+    async def _acreate(self, request: Dict[str, Any]) -> Any:
+        """_create的异步版本"""
+        async def attempt():
+            delay = self._hedge_delay(request)
+            if delay is None:
+                return await self._atimed_create(request)
+            return await _hedger.acall(lambda: self._atimed_create(request), delay)
         
-        # 缓存未命中，调用LLM
+        return await _retry_policy.acall(attempt)
+    
+    def invoke(self, prompt: str, cache_ttl: int = 3600, semantic_key: str = None, **kwargs) -> str:
+        """带缓存的LLM调用；semantic_key为提示词中的可变部分（如用户消息），指定时才启用语义缓存"""
+        cache_key = self._cache_key(prompt)
+        cached_result = self._cached_answer(prompt, cache_key, semantic_key)
+        if cached_result is not None:
+            return cached_result
+        
+        # 缓存未命中，相同缓存键的并发请求合并为一次上游调用
+        result = _singleflight.do(cache_key, lambda: self._fetch_with_lock(prompt, cache_key, cache_ttl, **kwargs))
+        self._remember_prompt(prompt, cache_key, semantic_key)
+        return result
+    
+    def _fetch(self, prompt: str, cache_key: str, cache_ttl: int, **kwargs) -> str:
+        """调用LLM并写入缓存"""
         try:
-            response = self.client.chat.completions.create(
-                model=config.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=config.temperature,
-                **kwargs
-            )
-            result = response.choices[0].message.content
+            result = _record_answer(prompt, self._create(self._build_request(prompt, **kwargs)))
             
             # 存入缓存
-            self.redis_client.setex(cache_key, cache_ttl, result)
+            self.cache.set(cache_key, result, cache_ttl)
             logger.info(f"LLM调用成功: {config.llm_provider}/{config.model_name}")
             return result
             
@@ -68,9 +388,288 @@ class LLMClient:
             logger.error(f"LLM调用失败: {str(e)}")
             raise LLMError(f"LLM调用失败: {str(e)}")
     
+    def _fetch_with_lock(self, prompt: str, cache_key: str, cache_ttl: int, **kwargs) -> str:
+        """通过Redis锁在多个工作进程之间合并相同请求"""
+        if not config.llm_distributed_lock or self.redis_client is None:
+            return self._fetch(prompt, cache_key, cache_ttl, **kwargs)
+        
+        lock = self.redis_client.lock(f"llm_lock:{cache_key}", timeout=config.llm_lock_timeout)
+        if lock.acquire(blocking=False):
+            try:
+                return self._fetch(prompt, cache_key, cache_ttl, **kwargs)
+            finally:
+                try:
+                    lock.release()
+                except LockError:
+                    pass
+        
+        # 其他进程正在调用，等待其写入缓存；锁释放后仍无结果则自行调用
+        deadline = time.time() + config.llm_lock_timeout
+        while time.time() < deadline:
+            time.sleep(config.llm_lock_poll_interval)
+            cached_result = self.cache.get_remote(cache_key)
+            if cached_result is not None:
+                logger.info(f"LLM跨进程合并命中: {cache_key[:16]}")
+                return cached_result
+            if not self.redis_client.exists(lock.name):
+                break
+        
+        return self._fetch(prompt, cache_key, cache_ttl, **kwargs)
+    
+    async def ainvoke(self, prompt: str, cache_ttl: int = 3600, semantic_key: str = None, **kwargs) -> str:
+        """带缓存的异步LLM调用，单个事件循环即可承载大量并发请求；semantic_key含义同invoke"""
+        cache_key = self._cache_key(prompt)
+        cached_result = await self._acached_answer(prompt, cache_key, semantic_key)
+        if cached_result is not None:
+            return cached_result
+        
+        result = await _async_singleflight.do(cache_key, lambda: self._afetch_with_lock(prompt, cache_key, cache_ttl, **kwargs))
+        self._remember_prompt(prompt, cache_key, semantic_key)
+        return result
+    
+    async def _afetch(self, prompt: str, cache_key: str, cache_ttl: int, **kwargs) -> str:
+        """异步调用LLM并写入缓存"""
+        try:
+            result = _record_answer(prompt, await self._acreate(self._build_request(prompt, **kwargs)))
+            
+            await self.cache.aset(cache_key, result, cache_ttl)
+            logger.info(f"LLM异步调用成功: {config.llm_provider}/{config.model_name}")
+            return result
+            
+        except Exception as e:
+            logger.error(f"LLM异步调用失败: {str(e)}")
+            raise LLMError(f"LLM调用失败: {str(e)}")
+    
+    async def _afetch_with_lock(self, prompt: str, cache_key: str, cache_ttl: int, **kwargs) -> str:
+        """_fetch_with_lock的异步版本"""
+        if not config.llm_distributed_lock or self.async_redis_client is None:
+            return await self._afetch(prompt, cache_key, cache_ttl, **kwargs)
+        
+        lock = self.async_redis_client.lock(f"llm_lock:{cache_key}", timeout=config.llm_lock_timeout)
+        if await lock.acquire(blocking=False):
+            try:
+                return await self._afetch(prompt, cache_key, cache_ttl, **kwargs)
+            finally:
+                try:
+                    await lock.release()
+                except LockError:
+                    pass
+        
+        deadline = time.time() + config.llm_lock_timeout
+        while time.time() < deadline:
+            await asyncio.sleep(config.llm_lock_poll_interval)
+            cached_result = await self.cache.aget_remote(cache_key)
+            if cached_result is not None:
+                logger.info(f"LLM跨进程合并命中: {cache_key[:16]}")
+                return cached_result
+            if not await self.async_redis_client.exists(lock.name):
+                break
+        
+        return await self._afetch(prompt, cache_key, cache_ttl, **kwargs)
+    
+    def invoke_many(self, prompts: List[str], max_concurrency: int = None, cache_ttl: int = 3600,
+                    return_exceptions: bool = False, **kwargs) -> List[Any]:
+        """批量LLM调用，按输入顺序返回结果；先查缓存并合并重复提示词，仅对未命中部分并发调用"""
+        max_concurrency = max_concurrency or config.llm_batch_concurrency
+        results: Dict[str, Any] = {}
+        
+        # 批内去重，再统一查缓存
+        for prompt in dict.fromkeys(prompts):
+            cached_result = self.cache.get(self._cache_key(prompt))
+            if cached_result is not None:
+                self._cache_hit(prompt, cached_result)
+                results[prompt] = cached_result
+        
+        pending = [p for p in dict.fromkeys(prompts) if p not in results]
+        logger.info(f"批量LLM调用: {len(prompts)}条, 缓存命中{len(results)}条, 待调用{len(pending)}条")
+        
+        def run(prompt: str) -> Any:
+            try:
+                return self.invoke(prompt, cache_ttl=cache_ttl, **kwargs)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+        
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(pending))) as executor:
+                # 工作线程沿用调用方的用量统计上下文（会话、调用位置）
+                contexts = [contextvars.copy_context() for _ in pending]
+                for prompt, result in zip(pending, executor.map(lambda ctx, p: ctx.run(run, p), contexts, pending)):
+                    results[prompt] = result
+        
+        return [results[prompt] for prompt in prompts]
+    
+    async def ainvoke_many(self, prompts: List[str], max_concurrency: int = None, cache_ttl: int = 3600,
+                           return_exceptions: bool = False, **kwargs) -> List[Any]:
+        """invoke_many的异步版本"""
+        max_concurrency = max_concurrency or config.llm_batch_concurrency
+        results: Dict[str, Any] = {}
+        
+        for prompt in dict.fromkeys(prompts):
+            cached_result = await self.cache.aget(self._cache_key(prompt))
+            if cached_result is not None:
+                await self._acache_hit(prompt, cached_result)
+                results[prompt] = cached_result
+        
+        pending = [p for p in dict.fromkeys(prompts) if p not in results]
+        logger.info(f"批量LLM调用: {len(prompts)}条, 缓存命中{len(results)}条, 待调用{len(pending)}条")
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(prompt: str) -> Any:
+            async with semaphore:
+                return await self.ainvoke(prompt, cache_ttl=cache_ttl, **kwargs)
+        
+        outputs = await asyncio.gather(*[run(p) for p in pending], return_exceptions=return_exceptions)
+        results.update(zip(pending, outputs))
+        
+        return [results[prompt] for prompt in prompts]
+    
+    def _tools_cache_key(self, prompt: str, tools: List[Dict[str, Any]]) -> str:
+        """工具调用的缓存键包含工具定义，工具变化后不会命中旧结果"""
+        digest = hashlib.md5((prompt + json.dumps(tools, sort_keys=True, ensure_ascii=False)).encode()).hexdigest()
+        return f"llm_tools:{config.llm_provider}:{config.model_name}:{digest}"
+    
+    @staticmethod
+    def _parse_tool_calls(prompt: str, response: Any) -> Dict[str, Any]:
+        """提取回复文本和结构化的工具调用并记录用量，参数不是合法JSON时保留原始字符串"""
+        get_usage_tracker().record_response(config.model_name, prompt, response)
+        message = response.choices[0].message
+        tool_calls = []
+        for call in message.tool_calls or []:
+            try:
+                arguments = json.loads(call.function.arguments or "{}")
+            except ValueError:
+                arguments = call.function.arguments
+            tool_calls.append({"id": call.id, "name": call.function.name, "arguments": arguments})
+        return {"content": _split_answer(message)[1], "tool_calls": tool_calls}
+    
+    def invoke_tools(self, prompt: str, tools: List[Dict[str, Any]], cache_ttl: int = 3600, **kwargs) -> Dict[str, Any]:
+        """原生工具调用：工具定义通过tools参数发送，返回{"content": 回复文本, "tool_calls": [...]}，一次可返回多个工具调用"""
+        cache_key = self._tools_cache_key(prompt, tools)
+        cached_result = self.cache.get(cache_key)
+        if cached_result is not None:
+            logger.info(f"LLM缓存命中: {cache_key[:16]}")
+            self._cache_hit(prompt, cached_result, tools=True)
+            return json.loads(cached_result)
+        
+        return _singleflight.do(cache_key, lambda: self._fetch_tools(prompt, tools, cache_key, cache_ttl, **kwargs))
+    
+    def _fetch_tools(self, prompt: str, tools: List[Dict[str, Any]], cache_key: str, cache_ttl: int, **kwargs) -> Dict[str, Any]:
+        """调用LLM获取工具调用并写入缓存"""
+        try:
+            result = self._parse_tool_calls(prompt, self._create(self._build_request(prompt, tools=tools, **kwargs)))
+            
+            self.cache.set(cache_key, json.dumps(result, ensure_ascii=False), cache_ttl)
+            logger.info(f"LLM工具调用成功: {len(result['tool_calls'])}个调用")
+            return result
+            
+        except Exception as e:
+            logger.error(f"LLM工具调用失败: {str(e)}")
+            raise LLMError(f"LLM调用失败: {str(e)}")
+    
+    async def ainvoke_tools(self, prompt: str, tools: List[Dict[str, Any]], cache_ttl: int = 3600, **kwargs) -> Dict[str, Any]:
+        """invoke_tools的异步版本"""
+        cache_key = self._tools_cache_key(prompt, tools)
+        cached_result = await self.cache.aget(cache_key)
+        if cached_result is not None:
+            logger.info(f"LLM缓存命中: {cache_key[:16]}")
+            await self._acache_hit(prompt, cached_result, tools=True)
+            return json.loads(cached_result)
+        
+        return await _async_singleflight.do(cache_key, lambda: self._afetch_tools(prompt, tools, cache_key, cache_ttl, **kwargs))
+    
+    async def _afetch_tools(self, prompt: str, tools: List[Dict[str, Any]], cache_key: str, cache_ttl: int, **kwargs) -> Dict[str, Any]:
+        """_fetch_tools的异步版本"""
+        try:
+            result = self._parse_tool_calls(prompt, await self._acreate(self._build_request(prompt, tools=tools, **kwargs)))
+            
+            await self.cache.aset(cache_key, json.dumps(result, ensure_ascii=False), cache_ttl)
+            logger.info(f"LLM异步工具调用成功: {len(result['tool_calls'])}个调用")
+            return result
+            
+        except Exception as e:
+            logger.error(f"LLM异步工具调用失败: {str(e)}")
+            raise LLMError(f"LLM调用失败: {str(e)}")
+    
+    def stream(self, prompt: str, cache_ttl: int = 3600, semantic_key: str = None, **kwargs) -> Iterator[str]:
+        """流式LLM调用，逐个产出token，完整结束后写入与invoke相同的缓存键"""
+        cache_key = self._cache_key(prompt)
+        
+        # 缓存命中时通过同一个迭代器回放缓存内容
+        cached_result = self._cached_answer(prompt, cache_key, semantic_key)
+        if cached_result is not None:
+            yield cached_result
+            return
+        
+        try:
+            response = self._create(self._build_request(prompt, stream=True, **kwargs))
+        except Exception as e:
+            logger.error(f"LLM流式调用失败: {str(e)}")
+            raise LLMError(f"LLM调用失败: {str(e)}")
+        
+        answer = _StreamAnswer(prompt)
+        with response:
+            try:
+                for chunk in response:
+                    delta = answer.feed(chunk)
+                    if delta:
+                        yield delta
+                delta = answer.flush()
+                if delta:
+                    yield delta
+            except Exception as e:
+                logger.error(f"LLM流式调用中断: {str(e)}")
+                raise LLMError(f"LLM流式调用中断: {str(e)}")
+        
+        # 仅在流完整结束后写入缓存，调用方提前退出时不缓存半截内容
+        result = answer.finish()
+        self.cache.set(cache_key, result, cache_ttl)
+        self._remember_prompt(prompt, cache_key, semantic_key)
+        logger.info(f"LLM流式调用成功: {config.llm_provider}/{config.model_name}")
+    
+    async def astream(self, prompt: str, cache_ttl: int = 3600, semantic_key: str = None, **kwargs) -> AsyncIterator[str]:
+        """异步流式LLM调用，行为与stream一致"""
+        cache_key = self._cache_key(prompt)
+        
+        cached_result = await self._acached_answer(prompt, cache_key, semantic_key)
+        if cached_result is not None:
+            yield cached_result
+            return
+        
+        try:
+            response = await self._acreate(self._build_request(prompt, stream=True, **kwargs))
+        except Exception as e:
+            logger.error(f"LLM异步流式调用失败: {str(e)}")
+            raise LLMError(f"LLM调用失败: {str(e)}")
+        
+        answer = _StreamAnswer(prompt)
+        try:
+            async for chunk in response:
+                delta = answer.feed(chunk)
+                if delta:
+                    yield delta
+            delta = answer.flush()
+            if delta:
+                yield delta
+        except Exception as e:
+            logger.error(f"LLM异步流式调用中断: {str(e)}")
+            raise LLMError(f"LLM流式调用中断: {str(e)}")
+        finally:
+            await response.close()
+        
+        result = answer.finish()
+        await self.cache.aset(cache_key, result, cache_ttl)
+        self._remember_prompt(prompt, cache_key, semantic_key)
+        logger.info(f"LLM异步流式调用成功: {config.llm_provider}/{config.model_name}")
+    
     def parse_response(self, response: str) -> Dict[str, Any]:
         """解析LLM响应，处理格式错误"""
         try:
+            # 思考内容中的花括号会干扰JSON提取，先去掉
+            if config.llm_strip_reasoning:
+                response = split_reasoning(response)[1]
+            
             # 提取JSON部分
             json_start = response.find("{")
             json_end = response.rfind("}") + 1
@@ -81,13 +680,62 @@ class LLMClient:
             logger.error(f"解析失败，原始响应: {response}")
             return {"action": "error", "message": str(e)}
     
-    def get_provider_info(self) -> Dict[str, str]:
-        """获取当前Provider信息"""
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        stats = {
+            **self.cache.get_stats(),
+            "coalesced": _singleflight.coalesced + _async_singleflight.coalesced
+        }
+        if self.semantic_cache is not None:
+            stats.update(self.semantic_cache.get_stats())
+        return stats
+    
+    def get_usage_stats(self, recent: int = 0) -> Dict[str, Any]:
+        """获取token用量与成本统计"""
+        return get_usage_tracker().snapshot(recent=recent)
+    
+    def get_reliability_stats(self) -> Dict[str, Any]:
+        """获取延迟、重试和对冲统计"""
         return {
+            **_latency_stats.snapshot(),
+            "retries": _retry_policy.retries,
+            "hedged": _hedger.hedged,
+            "hedge_wins": _hedger.hedge_wins
+        }
+    
+    def get_provider_info(self) -> Dict[str, Any]:
+        """获取当前Provider信息"""
+        if self.router is not None:
+            return {
+                "provider": config.llm_provider,
+                "model": config.model_name,
+                "backends": self.router.get_stats(),
+                "reliability": self.get_reliability_stats()
+            }
+        info = {
             "provider": config.llm_provider,
             "model": config.model_name,
             "base_url": getattr(config, 'siliconflow_base_url', '') if config.llm_provider == "siliconflow" else "https://api.openai.com/v1"
         }
+        if config.llm_cassette_mode == "replay":
+            info["replay"] = get_cassette_player().get_stats()
+        return info
+
+# 全局LLM客户端实例，首次使用时才创建，避免import时建立连接
+_llm_client: Optional[LLMClient] = None
+_llm_client_lock = threading.Lock()
+
+def get_llm_client() -> LLMClient:
+    """获取全局LLM客户端"""
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = LLMClient()
+    return _llm_client
 
-# 全局LLM客户端实例
-llm_client = LLMClient()
\ No newline at end of file
+def __getattr__(name: str):
+    # 兼容 from core.llm import llm_client
+    if name == "llm_client":
+        return get_llm_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
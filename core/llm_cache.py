@@ -0,0 +1,178 @@
+"""
+Mofy Agent Framework - LLM响应缓存
+进程内LRU(L1) + Redis(L2)两级缓存，大响应在Redis中压缩存储
+"""
+
+import time
+import zlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+# 压缩格式标记，普通UTF-8文本不会以\x00开头，可与历史未压缩缓存共存
+_ZLIB_MAGIC = b"\x00zl"
+_ZSTD_MAGIC = b"\x00zs"
+
+def compress_value(value: str, min_bytes: int = 1024) -> bytes:
+    """超过阈值的响应压缩后写入Redis，优先使用zstd"""
+    data = value.encode()
+    if len(data) < min_bytes:
+        return data
+    if zstd is not None:
+        return _ZSTD_MAGIC + zstd.ZstdCompressor(level=3).compress(data)
+    return _ZLIB_MAGIC + zlib.compress(data, 6)
+
+def decompress_value(data: bytes) -> str:
+    """还原compress_value的结果，兼容未压缩的历史数据"""
+    if data.startswith(_ZSTD_MAGIC):
+        if zstd is None:
+            raise RuntimeError("缓存数据使用zstd压缩，但未安装zstandard")
+        return zstd.ZstdDecompressor().decompress(data[len(_ZSTD_MAGIC):]).decode()
+    if data.startswith(_ZLIB_MAGIC):
+        return zlib.decompress(data[len(_ZLIB_MAGIC):]).decode()
+    return data.decode()
+
+class LRUCache:
+    """按字节数限制容量的线程安全LRU缓存"""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._data: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        """获取缓存，过期条目视为未命中"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires, size = item
+            if time.time() >= expires:
+                del self._data[key]
+                self.size_bytes -= size
+                return None
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: str, ttl: float):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        size = len(key) + len(value.encode())
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size_bytes -= old[2]
+            self._data[key] = (value, time.time() + ttl, size)
+            self.size_bytes += size
+            
+            while self.size_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.size_bytes -= evicted_size
+    
+    def delete(self, key: str):
+        """删除缓存"""
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size_bytes -= old[2]
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+            self.size_bytes = 0
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+class LLMResponseCache:
+    """LLM响应两级缓存，redis_client为None时只使用L1"""
+    
+    def __init__(self, redis_client, async_redis_client, l1: LRUCache,
+                 l1_ttl: float = 300, compress_min_bytes: int = 1024):
+        self.redis_client = redis_client
+        self.async_redis_client = async_redis_client
+        self.l1 = l1
+        self.l1_ttl = l1_ttl
+        self.compress_min_bytes = compress_min_bytes
+        self.stats = {"l1_hits": 0, "l1_misses": 0, "l2_hits": 0, "l2_misses": 0}
+    
+    def _get_l1(self, key: str) -> Optional[str]:
+        value = self.l1.get(key)
+        self.stats["l1_hits" if value is not None else "l1_misses"] += 1
+        return value
+    
+    def _promote(self, key: str, data: Optional[bytes]) -> Optional[str]:
+        """L2命中时回填L1"""
+        if not data:
+            self.stats["l2_misses"] += 1
+            return None
+        self.stats["l2_hits"] += 1
+        value = decompress_value(data)
+        self.l1.set(key, value, self.l1_ttl)
+        return value
+    
+    def get(self, key: str) -> Optional[str]:
+        """依次查询L1、L2缓存"""
+        value = self._get_l1(key)
+        if value is not None or self.redis_client is None:
+            return value
+        return self._promote(key, self.redis_client.get(key))
+    
+    def set(self, key: str, value: str, ttl: int):
+        """同时写入L1、L2缓存"""
+        self.l1.set(key, value, min(ttl, self.l1_ttl))
+        if self.redis_client is not None:
+            self.redis_client.setex(key, ttl, compress_value(value, self.compress_min_bytes))
+    
+    def get_remote(self, key: str) -> Optional[str]:
+        """仅查询L2缓存，用于等待其他进程写入结果"""
+        if self.redis_client is None:
+            return None
+        data = self.redis_client.get(key)
+        if not data:
+            return None
+        value = decompress_value(data)
+        self.l1.set(key, value, self.l1_ttl)
+        return value
+    
+    async def aget(self, key: str) -> Optional[str]:
+        """get的异步版本"""
+        value = self._get_l1(key)
+        if value is not None or self.async_redis_client is None:
+            return value
+        return self._promote(key, await self.async_redis_client.get(key))
+    
+    async def aset(self, key: str, value: str, ttl: int):
+        """set的异步版本"""
+        self.l1.set(key, value, min(ttl, self.l1_ttl))
+        if self.async_redis_client is not None:
+            await self.async_redis_client.setex(key, ttl, compress_value(value, self.compress_min_bytes))
+    
+    async def aget_remote(self, key: str) -> Optional[str]:
+        """get_remote的异步版本"""
+        if self.async_redis_client is None:
+            return None
+        data = await self.async_redis_client.get(key)
+        if not data:
+            return None
+        value = decompress_value(data)
+        self.l1.set(key, value, self.l1_ttl)
+        return value
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各级缓存命中统计"""
+        return {
+            **self.stats,
+            "l1_entries": len(self.l1),
+            "l1_bytes": self.l1.size_bytes,
+            "l1_max_bytes": self.l1.max_bytes
+        }
@@ -0,0 +1,35 @@
+"""
+Mofy Agent Framework - 事件循环本地对象
+异步Redis连接池、httpx客户端等绑定在创建它们的事件循环上，关闭该循环后再使用会报"Event loop is closed"，
+因此每个事件循环各自持有一份
+"""
+
+import asyncio
+import threading
+from typing import Any, Callable, Dict
+
+class LoopLocal:
+    """按当前运行的事件循环惰性创建对象，新建时清理已关闭事件循环的对象；
+    属性访问转发给当前事件循环的对象，可以直接替代进程共享的异步客户端"""
+    
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        # 连接对象本身引用事件循环，弱引用键无法释放，改为在新建时清理
+        self._instances: Dict[asyncio.AbstractEventLoop, Any] = {}
+        self._lock = threading.Lock()
+    
+    def get(self) -> Any:
+        """当前事件循环的对象，必须在事件循环中调用"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            instance = self._instances.get(loop)
+            if instance is None:
+                for closed in [l for l in self._instances if l.is_closed()]:
+                    del self._instances[closed]
+                instance = self._instances[loop] = self._factory()
+            return instance
+    
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
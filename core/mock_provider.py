@@ -0,0 +1,302 @@
+"""
+Mofy Agent Framework - 模拟LLM Provider
+离线、可复现的OpenAI兼容客户端：按脚本或模板返回响应，支持延迟分布和错误注入，用于基准测试和压测
+"""
+
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from string import Template
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
+from openai import APITimeoutError, InternalServerError, RateLimitError
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from loguru import logger
+from .config import config
+from .tokenizer import estimate_tokens
+from .router import _ClientView
+
+_MOCK_REQUEST = httpx.Request("POST", "http://mock.local/v1/chat/completions")
+
+def _user_message(prompt: str) -> str:
+    match = re.search(r"用户消息:\s*(.*)", prompt)
+    return match.group(1).strip() if match else prompt.strip().splitlines()[-1]
+
+def _pick_tool(message: str) -> Tuple[str, Dict[str, Any]]:
+    """含算式时使用计算器，否则使用搜索"""
+    expression = re.sub(r"[^\d+\-*/().% ]", "", message).strip()
+    if re.search(r"\d\s*[+\-*/%]\s*\d", expression):
+        return "calculator", {"expression": expression}
+    return "search", {"query": message}
+
+def default_tool_calls(prompt: str, tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """原生工具调用模式下的内置模板：从请求提供的工具中选择一个调用"""
+    names = [tool["function"]["name"] for tool in tools]
+    message = _user_message(prompt)
+    tool, arguments = _pick_tool(message)
+    if tool not in names:
+        if not names:
+            return []
+        # 未提供内置工具时，把用户消息填入第一个工具的第一个必选参数
+        tool = names[0]
+        required = tools[0]["function"]["parameters"].get("required", [])
+        arguments = {required[0]: message} if required else {}
+    return [{"name": tool, "arguments": json.dumps(arguments, ensure_ascii=False)}]
+
+def default_response(prompt: str) -> str:
+    """内置模板：按提示词类型生成任务计划、失败分析或最终回复"""
+    if "任务计划" in prompt:
+        message = _user_message(prompt)
+        tool, parameters = _pick_tool(message)
+        plan = {
+            "intent": f"处理用户请求: {message}",
+            "tasks": [{"id": "t1", "type": tool, "tool": tool, "parameters": parameters, "priority": 5}]
+        }
+        # 融合模式的提示词要求回复模板
+        if "reply_template" in prompt:
+            plan["reply_template"] = "已为您处理完成。${t1}"
+        return json.dumps(plan, ensure_ascii=False)
+    
+    if "失败类型" in prompt:
+        return json.dumps({"type": "工具失败", "reason": "模拟失败", "suggestion": "重试"}, ensure_ascii=False)
+    
+    history = prompt.split("任务执行历史:", 1)[-1].strip().splitlines()
+    summary = history[0] if history else prompt.strip()[:100]
+    return f"已为您处理完成。{summary}"
+
+def make_completion(request: Dict[str, Any], content: Optional[str],
+                    tool_calls: List[Dict[str, Any]] = None) -> ChatCompletion:
+    """按请求参数构造非流式响应，tool_calls为[{"name", "arguments"}]"""
+    prompt_tokens = estimate_tokens(request["messages"][-1]["content"])
+    completion_tokens = estimate_tokens(content or "") + sum(
+        estimate_tokens(call["name"] + call["arguments"]) for call in tool_calls or []
+    )
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = [
+            {"id": f"call_{i}", "type": "function",
+             "function": {"name": call["name"], "arguments": call["arguments"]}}
+            for i, call in enumerate(tool_calls)
+        ]
+    return ChatCompletion(
+        id=f"chatcmpl-mock-{int(time.time() * 1000)}",
+        object="chat.completion",
+        created=int(time.time()),
+        model=request.get("model", "mock"),
+        choices=[{
+            "index": 0,
+            "message": message,
+            "finish_reason": "tool_calls" if tool_calls else "stop"
+        }],
+        usage={
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    )
+
+def make_chunks(request: Dict[str, Any], content: str, chunk_chars: int = 8) -> List[ChatCompletionChunk]:
+    """把回答切分为流式chunk"""
+    size = max(1, chunk_chars)
+    pieces = [content[i:i + size] for i in range(0, len(content), size)]
+    created = int(time.time())
+    return [
+        ChatCompletionChunk(
+            id=f"chatcmpl-mock-{created}",
+            object="chat.completion.chunk",
+            created=created,
+            model=request.get("model", "mock"),
+            choices=[{"index": 0, "delta": {"content": piece},
+                      "finish_reason": "stop" if i == len(pieces) - 1 else None}]
+        )
+        for i, piece in enumerate(pieces)
+    ]
+
+class MockScript:
+    """脚本化响应：按顺序匹配正则，响应模板可引用$prompt、$message和命名分组"""
+    
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = []
+        for rule in rules:
+            response = rule["response"]
+            if not isinstance(response, str):
+                response = json.dumps(response, ensure_ascii=False)
+            self.rules.append((re.compile(rule.get("pattern", ".*"), re.S), Template(response)))
+    
+    @classmethod
+    def load(cls, path: str) -> "MockScript":
+        """从JSON列表或JSONL文件加载规则"""
+        with open(path, encoding="utf-8") as f:
+            text = f.read().strip()
+        if text.startswith("["):
+            rules = json.loads(text)
+        else:
+            rules = [json.loads(line) for line in text.splitlines() if line.strip()]
+        return cls(rules)
+    
+    def respond(self, prompt: str) -> Optional[str]:
+        """返回第一条匹配规则的响应，无匹配时返回None"""
+        for pattern, template in self.rules:
+            match = pattern.search(prompt)
+            if match:
+                return template.safe_substitute(prompt=prompt, message=_user_message(prompt), **match.groupdict())
+        return None
+
+class LatencyModel:
+    """延迟分布：fixed、uniform(0~2倍均值)、normal或lognormal(latency_ms为中位数)"""
+    
+    def __init__(self, distribution: str = "lognormal", latency_ms: float = 200,
+                 sigma: float = 0.5, rng: random.Random = None):
+        if distribution not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"不支持的延迟分布: {distribution}")
+        self.distribution = distribution
+        self.latency = latency_ms / 1000
+        self.sigma = sigma
+        self.rng = rng or random.Random()
+    
+    def sample(self) -> float:
+        """采样一次延迟（秒）"""
+        if self.distribution == "fixed":
+            return self.latency
+        if self.distribution == "uniform":
+            return self.rng.uniform(0, 2 * self.latency)
+        if self.distribution == "normal":
+            return max(0.0, self.rng.gauss(self.latency, self.sigma * self.latency))
+        return self.latency * self.rng.lognormvariate(0, self.sigma)
+
+class MockStream:
+    """同步流式响应，接口与openai.Stream一致"""
+    
+    def __init__(self, chunks: List[ChatCompletionChunk], chunk_delay: float):
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+    
+    def __iter__(self):
+        for chunk in self.chunks:
+            time.sleep(self.chunk_delay)
+            yield chunk
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def close(self):
+        pass
+
+class MockAsyncStream:
+    """异步流式响应，接口与openai.AsyncStream一致"""
+    
+    def __init__(self, chunks: List[ChatCompletionChunk], chunk_delay: float):
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+    
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.chunk_delay)
+            yield chunk
+    
+    async def close(self):
+        pass
+
+class MockBackend:
+    """离线模拟后端，client/async_client与OpenAI客户端接口一致"""
+    
+    def __init__(self, script: MockScript = None, latency: LatencyModel = None,
+                 error_rate: float = 0.0, error_types: List[str] = None,
+                 stream_chunk_chars: int = 8, stream_chunk_delay: float = 0.01, seed: int = None):
+        self.rng = random.Random(seed)
+        self.script = script
+        # 延迟采样与错误注入共用同一随机源，相同seed下结果可复现
+        self.latency = latency or LatencyModel()
+        self.latency.rng = self.rng
+        self.error_rate = error_rate
+        self.error_types = error_types or ["500", "429", "timeout"]
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_delay = stream_chunk_delay
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.client = _ClientView(self.create)
+        self.async_client = _ClientView(self.acreate)
+    
+    def _make_error(self, error_type: str) -> Exception:
+        if error_type == "timeout":
+            return APITimeoutError(request=_MOCK_REQUEST)
+        if error_type == "429":
+            return RateLimitError("模拟限流", response=httpx.Response(429, request=_MOCK_REQUEST), body=None)
+        return InternalServerError("模拟服务端错误", response=httpx.Response(500, request=_MOCK_REQUEST), body=None)
+    
+    def _plan(self, kwargs: Dict[str, Any]) -> Tuple[Optional[str], float, Optional[Exception]]:
+        """决定本次调用的响应内容、延迟和注入的错误，内容为None时返回工具调用"""
+        prompt = kwargs["messages"][-1]["content"]
+        with self._lock:
+            self.calls += 1
+            latency = self.latency.sample()
+            error = None
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.errors += 1
+                error = self._make_error(self.rng.choice(self.error_types))
+        
+        content = self.script.respond(prompt) if self.script else None
+        if content is None and (not kwargs.get("tools") or kwargs.get("stream")):
+            content = default_response(prompt)
+        return content, latency, error
+    
+    def _response(self, kwargs: Dict[str, Any], content: Optional[str]) -> ChatCompletion:
+        if content is None:
+            return make_completion(kwargs, None, default_tool_calls(kwargs["messages"][-1]["content"], kwargs["tools"]))
+        return make_completion(kwargs, content)
+    
+    def create(self, **kwargs) -> Any:
+        """模拟chat.completions.create"""
+        content, latency, error = self._plan(kwargs)
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        if kwargs.get("stream"):
+            return MockStream(make_chunks(kwargs, content, self.stream_chunk_chars), self.stream_chunk_delay)
+        return self._response(kwargs, content)
+    
+    async def acreate(self, **kwargs) -> Any:
+        """create的异步版本"""
+        content, latency, error = self._plan(kwargs)
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        if kwargs.get("stream"):
+            return MockAsyncStream(make_chunks(kwargs, content, self.stream_chunk_chars), self.stream_chunk_delay)
+        return self._response(kwargs, content)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """调用与注入错误统计"""
+        return {"calls": self.calls, "errors": self.errors}
+
+_mock_backend: Optional[MockBackend] = None
+_mock_backend_lock = threading.Lock()
+
+def get_mock_backend() -> MockBackend:
+    """获取按MOCK_*配置创建的全局模拟后端"""
+    global _mock_backend
+    if _mock_backend is None:
+        with _mock_backend_lock:
+            if _mock_backend is None:
+                script = MockScript.load(config.mock_script_file) if config.mock_script_file else None
+                _mock_backend = MockBackend(
+                    script=script,
+                    latency=LatencyModel(
+                        distribution=config.mock_latency_distribution,
+                        latency_ms=config.mock_latency_ms,
+                        sigma=config.mock_latency_sigma
+                    ),
+                    error_rate=config.mock_error_rate,
+                    error_types=[t.strip() for t in config.mock_error_types.split(",") if t.strip()],
+                    stream_chunk_delay=config.mock_stream_chunk_ms / 1000,
+                    seed=config.mock_seed
+                )
+                logger.info(f"使用模拟LLM Provider: 延迟分布{config.mock_latency_distribution}, 错误率{config.mock_error_rate}")
+    return _mock_backend
@@ -0,0 +1,347 @@
+"""
+Mofy Agent Framework - 任务计划缓存
+把LLM生成的任务计划按"屏蔽实体后的消息"存为模板，结构相同的新消息直接填入新的槽位值复用，
+执行中工具连续失败的模板会被淘汰
+"""
+
+import re
+import time
+import copy
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Iterable, Callable
+from loguru import logger
+from .config import config
+
+_TRAILING_PUNCT = "？?。.!！~"
+_REFERENCE_PATTERN = re.compile(r"\$\{[^}]+\}")  # 依赖任务输出的引用，原样保留
+_SLOT_KEY = "$slot"
+_TEXT_KEY = "$text"  # 含槽位取值的描述文本（意图、任务类型），存为字面文本与槽位编号交替的列表
+
+def normalize_message(message: str) -> str:
+    """轻量归一化：合并空白、去掉结尾标点；保留大小写和内部标点，槽位值需要原样取出"""
+    return re.sub(r"\s+", " ", message).strip().rstrip(_TRAILING_PUNCT).strip()
+
+def _leaves(value: Any) -> Iterable[Any]:
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from _leaves(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _leaves(item)
+    else:
+        yield value
+
+def _slot_text(value: Any) -> Optional[str]:
+    """可作为槽位的参数值对应的文本，布尔值和空值不作为槽位"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str) and value.strip():
+        return value.strip()
+    return None
+
+_NUMBER_PATTERN = r"[-+]?\d+(?:\.\d+)?"
+_EXPRESSION_PATTERN = r"[\d\s+\-*/().]+?"
+
+def slot_pattern(value: Any) -> str:
+    """槽位取值的正则字符类：数值只接受数字，算式只接受数字和运算符，其余为任意文本
+    
+    新消息中的槽位必须与学习时的取值属于同一类，否则"计算1+2"学到的模板会把任意文本当作算式
+    """
+    if isinstance(value, int):
+        return r"[-+]?\d+"
+    if isinstance(value, float):
+        return _NUMBER_PATTERN
+    text = str(value).strip()
+    if re.fullmatch(_NUMBER_PATTERN, text):
+        return _NUMBER_PATTERN
+    if re.fullmatch(_EXPRESSION_PATTERN, text):
+        return _EXPRESSION_PATTERN
+    return ".+?"
+
+class PlanTemplate:
+    """计划模板：消息中的实体被替换为槽位，计划参数中对应的值替换为槽位引用"""
+    
+    def __init__(self, key: str, pattern: re.Pattern, plan: Dict[str, Any], slots: int,
+                 prefix: str = "", suffix: str = ""):
+        self.key = key
+        self.pattern = pattern
+        self.plan = plan
+        self.slots = slots
+        # 第一个槽位之前和最后一个槽位之后的固定文本（小写），用于在查找前筛选候选模板
+        self.prefix = prefix
+        self.suffix = suffix
+        self.created_at = time.time()
+        self.last_used = 0  # 最近使用序号，候选模板按它从新到旧尝试
+        self.hits = 0
+        self.failures = 0  # 连续执行失败次数
+    
+    def fill(self, values: List[str]) -> Dict[str, Any]:
+        """用新的槽位值生成计划，数值槽位的取值无法转换时抛出ValueError"""
+        def substitute(value):
+            if isinstance(value, dict):
+                if _TEXT_KEY in value:
+                    return "".join(values[part] if isinstance(part, int) else part for part in value[_TEXT_KEY])
+                if _SLOT_KEY in value:
+                    text = values[value[_SLOT_KEY]]
+                    if value.get("type") == "int":
+                        return int(text)
+                    if value.get("type") == "float":
+                        return float(text)
+                    return text
+                return {k: substitute(v) for k, v in value.items()}
+            if isinstance(value, list):
+                return [substitute(v) for v in value]
+            return value
+        return substitute(copy.deepcopy(self.plan))
+
+def build_template(message: str, plan: Dict[str, Any]) -> Optional[PlanTemplate]:
+    """从消息和LLM计划构造模板；参数取值无法在消息中定位（如由上下文推断）的计划不缓存"""
+    text = normalize_message(message)
+    tasks = plan.get("tasks") or []
+    if not tasks:
+        return None
+    
+    values: Dict[str, Any] = {}  # 槽位文本 -> 计划中的原始取值
+    for task in tasks:
+        for leaf in _leaves(task.get("parameters", {})):
+            if isinstance(leaf, str) and _REFERENCE_PATTERN.search(leaf):
+                continue
+            slot_text = _slot_text(leaf)
+            if slot_text is None:
+                continue
+            if slot_text.lower() not in text.lower():
+                return None
+            values.setdefault(slot_text, leaf)
+    if not values:
+        return None
+    
+    # 长的取值优先匹配，避免"北京"先于"北京南站"被替换
+    alternation = "|".join(re.escape(v) for v in sorted(values, key=len, reverse=True))
+    parts = re.split(f"({alternation})", text, flags=re.IGNORECASE)
+    originals = {value.lower(): leaf for value, leaf in values.items()}
+    slot_index: Dict[str, int] = {}
+    key_parts, regex_parts = [], []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            key_parts.append(part)
+            regex_parts.append(re.escape(part))
+            continue
+        if i > 1 and not parts[i - 1]:
+            return None  # 相邻槽位之间没有分隔，无法可靠提取
+        folded = part.lower()
+        if folded in slot_index:
+            key_parts.append(f"{{{slot_index[folded]}}}")
+            regex_parts.append(f"(?P=s{slot_index[folded]})")
+        else:
+            slot_index[folded] = len(slot_index)
+            key_parts.append(f"{{{slot_index[folded]}}}")
+            regex_parts.append(f"(?P<s{slot_index[folded]}>{slot_pattern(originals[folded])})")
+    
+    # 模板至少要有一定的固定文本，否则会匹配任意消息
+    if len("".join(parts[0::2]).strip()) < 2:
+        return None
+    
+    def mask(value):
+        if isinstance(value, dict):
+            return {k: mask(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [mask(v) for v in value]
+        slot_text = _slot_text(value)
+        if slot_text is not None and slot_text.lower() in slot_index:
+            slot = {_SLOT_KEY: slot_index[slot_text.lower()]}
+            if isinstance(value, int):
+                slot["type"] = "int"
+            elif isinstance(value, float):
+                slot["type"] = "float"
+            return slot
+        return value
+    
+    slot_alternation = "|".join(re.escape(v) for v in sorted(slot_index, key=len, reverse=True))
+    
+    def mask_text(value):
+        """意图、任务类型等描述中的槽位取值同样替换为槽位，命中时填入新值，不沿用原消息的实体"""
+        if not isinstance(value, str):
+            return value
+        pieces = re.split(f"({slot_alternation})", value, flags=re.IGNORECASE)
+        if len(pieces) == 1:
+            return value
+        return {_TEXT_KEY: [slot_index[piece.lower()] if i % 2 else piece for i, piece in enumerate(pieces)]}
+    
+    # 直接回复与具体消息相关不能复用；回复模板只在不含槽位值时保留
+    template_plan = {k: v for k, v in plan.items() if k not in ("source", "confidence", "plan_key", "answer")}
+    reply_template = template_plan.get("reply_template")
+    if isinstance(reply_template, str) and any(value in reply_template.lower() for value in slot_index):
+        del template_plan["reply_template"]
+    if "intent" in template_plan:
+        template_plan["intent"] = mask_text(template_plan["intent"])
+    template_tasks = []
+    for task in tasks:
+        task = {**task, "parameters": mask(task.get("parameters", {}))}
+        if "type" in task:
+            task["type"] = mask_text(task["type"])
+        template_tasks.append(task)
+    template_plan["tasks"] = template_tasks
+    pattern = re.compile("".join(regex_parts), re.IGNORECASE | re.DOTALL)
+    return PlanTemplate("".join(key_parts), pattern, template_plan, len(slot_index),
+                        prefix=parts[0].lower(), suffix=parts[-1].lower())
+
+class PlanCache:
+    """线程安全的计划模板缓存，按最近使用淘汰；模板按固定的前缀和后缀文本建立索引，
+    查找时只对前后缀与消息一致的候选模板做正则匹配，匹配和参数校验在锁外进行"""
+    
+    def __init__(self, max_entries: int = 1000, ttl: int = 86400, max_failures: int = 2):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_failures = max_failures
+        self._templates: "OrderedDict[str, PlanTemplate]" = OrderedDict()
+        # 前缀 -> 后缀 -> {模板键: 模板}
+        self._index: Dict[str, Dict[str, Dict[str, PlanTemplate]]] = {}
+        self._uses = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+    
+    def _touch(self, template: PlanTemplate):
+        """标记为最近使用，调用方需持有锁"""
+        self._uses += 1
+        template.last_used = self._uses
+        self._templates.move_to_end(template.key)
+    
+    def _remove(self, key: str, template: PlanTemplate = None) -> bool:
+        """移除模板及其索引，指定template时只在仍是同一个模板时移除；调用方需持有锁"""
+        current = self._templates.get(key)
+        if current is None or (template is not None and current is not template):
+            return False
+        del self._templates[key]
+        suffixes = self._index[current.prefix]
+        del suffixes[current.suffix][key]
+        if not suffixes[current.suffix]:
+            del suffixes[current.suffix]
+            if not suffixes:
+                del self._index[current.prefix]
+        return True
+    
+    def store(self, message: str, plan: Dict[str, Any]) -> Optional[str]:
+        """缓存LLM生成的计划，返回模板键；不可缓存时返回None"""
+        template = build_template(message, plan)
+        if template is None:
+            return None
+        with self._lock:
+            self._remove(template.key)
+            self._templates[template.key] = template
+            self._index.setdefault(template.prefix, {}).setdefault(template.suffix, {})[template.key] = template
+            self._touch(template)
+            self.stats["stores"] += 1
+            while len(self._templates) > self.max_entries:
+                self._remove(next(iter(self._templates)))
+        return template.key
+    
+    def _candidates(self, text: str) -> List[PlanTemplate]:
+        """前缀和后缀都与消息一致的模板，最近使用的在前；调用方需持有锁"""
+        folded = text.lower()
+        candidates = []
+        for i in range(len(folded) + 1):
+            suffixes = self._index.get(folded[:i])
+            if suffixes is None:
+                continue
+            rest = folded[i:]
+            for j in range(len(rest) + 1):
+                templates = suffixes.get(rest[len(rest) - j:])
+                if templates:
+                    candidates.extend(templates.values())
+        candidates.sort(key=lambda template: template.last_used, reverse=True)
+        return candidates
+    
+    def _match(self, template: PlanTemplate, text: str, tools: Optional[set],
+               validate: Optional[Callable[[str, Dict[str, Any]], Any]]) -> Optional[Dict[str, Any]]:
+        """用模板匹配消息并填入槽位值，不匹配或参数不可用时返回None"""
+        match = template.pattern.fullmatch(text)
+        if not match:
+            return None
+        if tools is not None and any(task.get("tool") and task["tool"] not in tools
+                                     for task in template.plan["tasks"]):
+            return None
+        try:
+            plan = template.fill([match.group(f"s{i}").strip() for i in range(template.slots)])
+            if validate is not None:
+                for task in plan["tasks"]:
+                    if task.get("tool"):
+                        validate(task["tool"], task.get("parameters", {}))
+        except ValueError:
+            return None  # 槽位取值无法转换或不符合工具schema，按未命中处理，交给LLM规划
+        return plan
+    
+    def lookup(self, message: str, tools: Iterable[str] = None,
+               validate: Callable[[str, Dict[str, Any]], Any] = None) -> Optional[Dict[str, Any]]:
+        """查找结构相同的模板并填入新的槽位值；tools限定当前Agent可用的工具，
+        validate(工具名, 参数)按工具schema检查填入后的参数，不符合时抛出ValueError"""
+        text = normalize_message(message)
+        tools = set(tools) if tools is not None else None
+        now = time.time()
+        with self._lock:
+            candidates = self._candidates(text)
+        
+        expired, hit, plan = [], None, None
+        for template in candidates:
+            if now - template.created_at > self.ttl:
+                expired.append(template)
+                continue
+            plan = self._match(template, text, tools, validate)
+            if plan is not None:
+                hit = template
+                break
+        
+        with self._lock:
+            for template in expired:
+                self._remove(template.key, template)
+            if hit is None:
+                self.stats["misses"] += 1
+                return None
+            hit.hits += 1
+            self.stats["hits"] += 1
+            if self._templates.get(hit.key) is hit:
+                self._touch(hit)
+        plan["source"] = "plan_cache"
+        plan["plan_key"] = hit.key
+        return plan
+    
+    def feedback(self, key: str, success: bool):
+        """记录模板计划的执行结果，连续失败达到上限的模板被淘汰"""
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                return
+            if success:
+                template.failures = 0
+                return
+            template.failures += 1
+            if template.failures >= self.max_failures:
+                self._remove(key)
+                self.stats["evictions"] += 1
+                logger.info(f"计划模板执行连续失败，已淘汰: {key}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """计划缓存统计"""
+        with self._lock:
+            stats = {**self.stats, "entries": len(self._templates)}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+_plan_cache: Optional[PlanCache] = None
+_plan_cache_lock = threading.Lock()
+
+def get_plan_cache() -> PlanCache:
+    """获取进程级计划缓存，所有会话共享"""
+    global _plan_cache
+    if _plan_cache is None:
+        with _plan_cache_lock:
+            if _plan_cache is None:
+                _plan_cache = PlanCache(
+                    max_entries=config.plan_cache_max_entries,
+                    ttl=config.plan_cache_ttl,
+                    max_failures=config.plan_cache_max_failures
+                )
+    return _plan_cache
@@ -0,0 +1,88 @@
+"""
+Mofy Agent Framework - 速率限制
+基于令牌桶的每Provider请求数(RPM)与token数(TPM)限制
+"""
+
+import time
+import asyncio
+import threading
+from typing import Dict, Any, Optional
+from .config import config
+from .tokenizer import estimate_tokens
+
+class TokenBucket:
+    """线程安全的令牌桶，rate为每分钟补充量，0表示不限制"""
+    
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _try_acquire(self, amount: float) -> float:
+        """尝试取出令牌，成功返回0，否则返回需要等待的秒数"""
+        if self.capacity <= 0:
+            return 0.0
+        # 单次请求超过桶容量时，等桶满后放行，避免永久阻塞
+        amount = min(amount, self.capacity)
+        
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+    
+    def acquire(self, amount: float = 1):
+        """阻塞直到取得令牌"""
+        while True:
+            wait = self._try_acquire(amount)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+    
+    async def aacquire(self, amount: float = 1):
+        """异步等待直到取得令牌"""
+        while True:
+            wait = self._try_acquire(amount)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+class ProviderRateLimiter:
+    """单个Provider的RPM/TPM限制"""
+    
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+    
+    def acquire(self, tokens: int):
+        """调用前阻塞获取请求和token额度"""
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+    
+    async def aacquire(self, tokens: int):
+        """acquire的异步版本"""
+        await self.requests.aacquire(1)
+        await self.tokens.aacquire(tokens)
+
+def request_tokens(request: Dict[str, Any]) -> int:
+    """估算单次chat.completions请求占用的TPM额度（提示词+预期输出）"""
+    prompt = "".join(m["content"] for m in request.get("messages", []) if isinstance(m.get("content"), str))
+    return estimate_tokens(prompt) + request.get("max_tokens", config.llm_expected_completion_tokens)
+
+_limiters: Dict[str, ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider: str, rpm: Optional[int] = None, tpm: Optional[int] = None) -> ProviderRateLimiter:
+    """获取Provider共享的限流器，未指定额度时从配置的{provider}_rpm/{provider}_tpm读取"""
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = ProviderRateLimiter(
+                rpm=rpm if rpm is not None else getattr(config, f"{provider}_rpm", 0),
+                tpm=tpm if tpm is not None else getattr(config, f"{provider}_tpm", 0)
+            )
+        return _limiters[provider]
@@ -0,0 +1,127 @@
+"""
+Mofy Agent Framework - 推理内容处理
+分离DeepSeek-R1等推理模型输出中的<think>...</think>思考过程与最终回答，支持流式增量过滤
+"""
+
+from typing import Tuple
+from .config import config
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+def _partial_suffix(text: str, tag: str) -> int:
+    """text末尾可能是tag前缀的最长长度，这部分需要等下一个chunk再判断"""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:size]):
+            return size
+    return 0
+
+class ReasoningFilter:
+    """流式过滤器：feed返回可以立即输出的回答文本，思考内容单独累积
+    
+    R1蒸馏模型常省略开头的<think>，直接输出思考内容再接</think>。hold_limit大于0时，
+    流开头的文本先缓存，直到出现第一个标签或累积超过hold_limit个字符才开始输出，
+    缓存期间先出现</think>的，之前的内容全部视为思考内容。
+    """
+    
+    def __init__(self, enabled: bool = True, hold_limit: int = 0):
+        self.enabled = enabled
+        self.hold_limit = hold_limit
+        self._holding = enabled and hold_limit > 0
+        self.in_reasoning = False
+        self._buffer = ""
+        self._strip_leading = False  # 思考块之后的前导空白不输出
+        self._reasoning_parts = []
+    
+    @property
+    def reasoning(self) -> str:
+        return "".join(self._reasoning_parts).strip()
+    
+    def feed_reasoning(self, text: str):
+        """Provider单独返回的推理内容（如reasoning_content字段）；此时回答中不会再有思考块，无需缓存开头"""
+        if text:
+            self._reasoning_parts.append(text)
+            self._holding = False
+    
+    def feed(self, text: str) -> str:
+        """输入一段增量文本，返回其中属于回答的部分"""
+        if not self.enabled:
+            return text
+        self._buffer += text
+        if self._holding and not self._release():
+            return ""
+        answer = []
+        while self._buffer:
+            tag = THINK_CLOSE if self.in_reasoning else THINK_OPEN
+            index = self._buffer.find(tag)
+            if index == -1:
+                keep = _partial_suffix(self._buffer, tag)
+                ready = self._buffer[:len(self._buffer) - keep]
+                self._buffer = self._buffer[len(self._buffer) - keep:]
+                if self.in_reasoning:
+                    self._reasoning_parts.append(ready)
+                else:
+                    answer.append(ready)
+                break
+            
+            if self.in_reasoning:
+                self._reasoning_parts.append(self._buffer[:index])
+                self._strip_leading = True
+            else:
+                answer.append(self._buffer[:index])
+            self._buffer = self._buffer[index + len(tag):]
+            self.in_reasoning = not self.in_reasoning
+        
+        return self._emit("".join(answer))
+    
+    def _release(self) -> bool:
+        """判断流开头缓存的文本能否开始输出，省略了<think>的思考块在这里补上开头标签"""
+        open_index = self._buffer.find(THINK_OPEN)
+        close_index = self._buffer.find(THINK_CLOSE)
+        if close_index != -1 and (open_index == -1 or close_index < open_index):
+            self._buffer = THINK_OPEN + self._buffer
+        elif open_index == -1 and len(self._buffer) <= self.hold_limit:
+            return False
+        self._holding = False
+        return True
+    
+    def flush(self) -> str:
+        """流结束时输出缓冲区剩余内容；未闭合的思考块全部视为思考内容"""
+        if self._holding:
+            self._holding = False
+            return self.feed("") + self.flush()
+        rest, self._buffer = self._buffer, ""
+        if self.in_reasoning:
+            self._reasoning_parts.append(rest)
+            return ""
+        return self._emit(rest)
+    
+    def _emit(self, text: str) -> str:
+        if self._strip_leading:
+            text = text.lstrip()
+            if text:
+                self._strip_leading = False
+        return text
+
+def is_reasoning_model(model: str = None) -> bool:
+    """模型名是否匹配LLM_REASONING_MODELS中的某个片段"""
+    name = (model or config.model_name).lower()
+    return any(part.strip() and part.strip().lower() in name for part in config.llm_reasoning_models.split(","))
+
+def stream_hold_limit(model: str = None) -> int:
+    """流式输出开头的缓存上限：只有推理模型可能省略<think>，其他模型不缓存，开头的<think>由feed正常识别"""
+    return config.llm_reasoning_hold_chars if is_reasoning_model(model) else 0
+
+def split_reasoning(text: str) -> Tuple[str, str]:
+    """把完整回复拆分为(思考内容, 回答)，不含思考块时原样返回"""
+    if THINK_CLOSE not in text and THINK_OPEN not in text:
+        return "", text
+    
+    # R1蒸馏模型常省略开头的<think>，只输出结尾的</think>
+    close_index = text.find(THINK_CLOSE)
+    if close_index != -1 and THINK_OPEN not in text[:close_index]:
+        text = THINK_OPEN + text
+    
+    reasoning_filter = ReasoningFilter()
+    answer = reasoning_filter.feed(text) + reasoning_filter.flush()
+    return reasoning_filter.reasoning, answer.rstrip()
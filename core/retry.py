@@ -0,0 +1,145 @@
+"""
+Mofy Agent Framework - 重试与对冲请求
+指数退避+抖动重试（遵循Retry-After），以及超过p95延迟时发出对冲请求
+"""
+
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Awaitable, Optional
+from openai import APIConnectionError, APITimeoutError, APIStatusError
+from loguru import logger
+
+def is_retryable_error(error: Exception) -> bool:
+    """超时、连接失败、429和5xx属于瞬时错误，其余错误（如参数错误）不重试"""
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """从错误响应头读取Retry-After（支持retry-after-ms、秒数和HTTP日期）"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RetryPolicy:
+    """指数退避重试策略"""
+    
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5,
+                 max_delay: float = 8.0, max_retry_after: float = 60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retries = 0  # 累计重试次数
+    
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """第attempt次失败后的等待时间：优先Retry-After，否则full jitter指数退避"""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+    
+    def call(self, fn: Callable[[], Any]) -> Any:
+        """同步执行并按策略重试"""
+        for attempt in range(self.max_attempts):
+            try:
+                return fn()
+            except Exception as e:
+                if attempt + 1 >= self.max_attempts or not is_retryable_error(e):
+                    raise
+                delay = self.backoff(attempt, e)
+                self.retries += 1
+                logger.warning(f"LLM调用失败，{delay:.2f}秒后第{attempt + 1}次重试: {str(e)}")
+                time.sleep(delay)
+    
+    async def acall(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """异步执行并按策略重试"""
+        for attempt in range(self.max_attempts):
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt + 1 >= self.max_attempts or not is_retryable_error(e):
+                    raise
+                delay = self.backoff(attempt, e)
+                self.retries += 1
+                logger.warning(f"LLM调用失败，{delay:.2f}秒后第{attempt + 1}次重试: {str(e)}")
+                await asyncio.sleep(delay)
+
+class Hedger:
+    """对冲请求：首个请求超过delay仍未返回时再发一个相同请求，取先完成的结果"""
+    
+    def __init__(self, max_workers: int = 32):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+        self.hedged = 0      # 发出对冲请求的次数
+        self.hedge_wins = 0  # 对冲请求先返回的次数
+    
+    def call(self, fn: Callable[[], Any], delay: float) -> Any:
+        """同步对冲；落后的请求在后台线程中执行完后丢弃结果"""
+        primary = self._executor.submit(fn)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        
+        self.hedged += 1
+        hedge = self._executor.submit(fn)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [f for f in done if f.exception() is None]
+            if succeeded:
+                if hedge in succeeded:
+                    self.hedge_wins += 1
+                return succeeded[0].result()
+            # 两个请求都失败时抛出最后一个错误
+            if not pending:
+                return done.pop().result()
+    
+    async def acall(self, fn: Callable[[], Awaitable[Any]], delay: float) -> Any:
+        """异步对冲；落后的请求会被取消"""
+        primary = asyncio.ensure_future(fn())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            
+            self.hedged += 1
+            hedge = asyncio.ensure_future(fn())
+            pending = {primary, hedge}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [t for t in done if t.exception() is None]
+                if succeeded:
+                    if hedge in succeeded:
+                        self.hedge_wins += 1
+                    return succeeded[0].result()
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,217 @@
+"""
+Mofy Agent Framework - 多Provider路由
+同时持有多个OpenAI兼容后端，按滚动延迟和错误率选择最快的健康后端，超时或5xx时自动切换
+"""
+
+import json
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, List, Callable
+from openai import OpenAI, AsyncOpenAI
+from loguru import logger
+from .config import config
+from .exceptions import LLMError
+from .retry import is_retryable_error
+from .rate_limit import get_rate_limiter, request_tokens
+from .loop_local import LoopLocal
+
+class BackendStats:
+    """单个后端的滚动延迟与错误率统计"""
+    
+    def __init__(self, window: int = 100, window_seconds: float = 300,
+                 max_error_rate: float = 0.5, failure_threshold: int = 3, cooldown: float = 30):
+        self.window_seconds = window_seconds
+        self.max_error_rate = max_error_rate
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latencies: deque = deque(maxlen=window)  # (时间, 延迟秒数)
+        self.outcomes: deque = deque(maxlen=window)   # (时间, 是否成功)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, latency: float, success: bool):
+        """记录一次调用结果"""
+        now = time.time()
+        with self._lock:
+            self.outcomes.append((now, success))
+            if success:
+                self.latencies.append((now, latency))
+                self.consecutive_failures = 0
+            else:
+                self.consecutive_failures += 1
+                # 连续失败后熔断一段时间
+                if self.consecutive_failures >= self.failure_threshold:
+                    self.open_until = now + self.cooldown
+    
+    def _recent(self, samples: deque) -> List[Any]:
+        # 过旧的样本不再参与统计，恢复的后端可以重新被探测
+        cutoff = time.time() - self.window_seconds
+        return [value for ts, value in samples if ts >= cutoff]
+    
+    def percentile(self, q: float) -> float:
+        """延迟分位数（秒），无样本时为0"""
+        with self._lock:
+            values = sorted(self._recent(self.latencies))
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(q * len(values)))]
+    
+    def error_rate(self) -> float:
+        """窗口内错误率"""
+        with self._lock:
+            outcomes = self._recent(self.outcomes)
+        if not outcomes:
+            return 0.0
+        return outcomes.count(False) / len(outcomes)
+    
+    def is_healthy(self) -> bool:
+        """未熔断且错误率低于阈值"""
+        return time.time() >= self.open_until and self.error_rate() < self.max_error_rate
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """统计快照"""
+        return {
+            "p50_ms": round(self.percentile(0.5) * 1000, 1),
+            "p95_ms": round(self.percentile(0.95) * 1000, 1),
+            "error_rate": round(self.error_rate(), 3),
+            "healthy": self.is_healthy(),
+            "samples": len(self.outcomes)
+        }
+
+class RouterBackend:
+    """一个OpenAI兼容后端"""
+    
+    def __init__(self, name: str, base_url: str, api_key: str, model: str = None,
+                 timeout: float = None, http_client=None, async_http_client: Callable = None,
+                 rpm: int = None, tpm: int = None):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        # 按后端名共享限流额度，未指定时读取{name}_rpm/{name}_tpm配置，与单Provider模式共用
+        self.rate_limiter = get_rate_limiter(name, rpm, tpm)
+        timeout = timeout or config.llm_router_timeout
+        # 失败直接交给路由切换，不在单个后端内重试
+        self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout,
+                             max_retries=0, http_client=http_client)
+        # async_http_client返回当前事件循环的HTTP客户端，异步客户端在每个事件循环中各建一个
+        self.async_client = LoopLocal(lambda: AsyncOpenAI(
+            api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0,
+            http_client=async_http_client() if async_http_client else None
+        ))
+        self.stats = BackendStats(
+            window=config.llm_router_window,
+            window_seconds=config.llm_router_window_seconds,
+            max_error_rate=config.llm_router_max_error_rate,
+            failure_threshold=config.llm_router_failure_threshold,
+            cooldown=config.llm_router_cooldown
+        )
+
+class _Completions:
+    def __init__(self, create: Callable):
+        self.create = create
+
+class _Chat:
+    def __init__(self, create: Callable):
+        self.completions = _Completions(create)
+
+class _ClientView:
+    """与OpenAI客户端接口一致的视图，LLMClient无需区分单Provider与路由模式"""
+    
+    def __init__(self, create: Callable):
+        self.chat = _Chat(create)
+
+class LLMRouter:
+    """延迟感知的多后端路由"""
+    
+    def __init__(self, backends: List[RouterBackend]):
+        if not backends:
+            raise LLMError("路由模式至少需要一个后端")
+        self.backends = backends
+        self.client = _ClientView(self.create)
+        self.async_client = _ClientView(self.acreate)
+    
+    def ordered_backends(self) -> List[RouterBackend]:
+        """健康后端按p50/p95升序在前，不健康的按错误率排在后面兜底"""
+        healthy = [b for b in self.backends if b.stats.is_healthy()]
+        unhealthy = [b for b in self.backends if b not in healthy]
+        healthy.sort(key=lambda b: (b.stats.percentile(0.5), b.stats.percentile(0.95)))
+        unhealthy.sort(key=lambda b: b.stats.error_rate())
+        return healthy + unhealthy
+    
+    def _request_for(self, backend: RouterBackend, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if backend.model:
+            return {**kwargs, "model": backend.model}
+        return kwargs
+    
+    def create(self, **kwargs) -> Any:
+        """依次尝试后端直到成功"""
+        last_error = None
+        for backend in self.ordered_backends():
+            backend.rate_limiter.acquire(request_tokens(kwargs))
+            start = time.perf_counter()
+            try:
+                response = backend.client.chat.completions.create(**self._request_for(backend, kwargs))
+            except Exception as e:
+                if not is_retryable_error(e):
+                    raise
+                backend.stats.record(time.perf_counter() - start, success=False)
+                logger.warning(f"LLM后端{backend.name}调用失败，切换后端: {str(e)}")
+                last_error = e
+                continue
+            backend.stats.record(time.perf_counter() - start, success=True)
+            return response
+        raise LLMError(f"所有LLM后端均不可用: {str(last_error)}")
+    
+    async def acreate(self, **kwargs) -> Any:
+        """create的异步版本"""
+        last_error = None
+        for backend in self.ordered_backends():
+            await backend.rate_limiter.aacquire(request_tokens(kwargs))
+            start = time.perf_counter()
+            try:
+                response = await backend.async_client.chat.completions.create(**self._request_for(backend, kwargs))
+            except Exception as e:
+                if not is_retryable_error(e):
+                    raise
+                backend.stats.record(time.perf_counter() - start, success=False)
+                logger.warning(f"LLM后端{backend.name}调用失败，切换后端: {str(e)}")
+                last_error = e
+                continue
+            backend.stats.record(time.perf_counter() - start, success=True)
+            return response
+        raise LLMError(f"所有LLM后端均不可用: {str(last_error)}")
+    
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各后端统计"""
+        return {b.name: {"base_url": b.base_url, **b.stats.snapshot()} for b in self.backends}
+
+def load_router_backends(http_client=None, async_http_client: Callable = None) -> List[RouterBackend]:
+    """从LLM_ROUTER_BACKENDS(JSON列表)读取后端；未配置时使用已填写密钥的Provider，
+    async_http_client为返回当前事件循环HTTP客户端的函数"""
+    if config.llm_router_backends:
+        specs = json.loads(config.llm_router_backends)
+    else:
+        specs = []
+        if config.openai_api_key:
+            specs.append({"name": "openai", "base_url": "https://api.openai.com/v1",
+                          "api_key": config.openai_api_key})
+        if config.siliconflow_api_key:
+            specs.append({"name": "siliconflow", "base_url": config.siliconflow_base_url,
+                          "api_key": config.siliconflow_api_key})
+    
+    return [
+        RouterBackend(
+            name=spec.get("name", spec["base_url"]),
+            base_url=spec["base_url"],
+            api_key=spec.get("api_key", "EMPTY"),
+            model=spec.get("model"),
+            timeout=spec.get("timeout"),
+            http_client=http_client,
+            async_http_client=async_http_client,
+            rpm=spec.get("rpm"),
+            tpm=spec.get("tpm")
+        )
+        for spec in specs
+    ]
@@ -0,0 +1,124 @@
+"""
+Mofy Agent Framework - Agent运行时
+进程内共享LLM客户端、记忆管理、工具注册表和反思引擎等重量级组件，
+每个会话只创建轻量的MofyAgent句柄（会话ID、任务调度器和少量状态）
+"""
+
+import time
+import threading
+from typing import Dict, Any, Optional
+from loguru import logger
+from .config import config
+from .llm import LLMClient
+from .intent_router import get_intent_router
+from ..modules.memory import MemoryManager, get_memory_manager
+from ..modules.tools.registry import ToolRegistry
+from ..modules.tools.builtin.calculator import evaluate_expression
+from ..modules.reflection import ReflectionEngine
+
+class AgentRuntime:
+    """共享组件的持有者，所有组件都是线程安全的，可被任意数量的会话同时使用"""
+    
+    def __init__(self, llm_client: LLMClient = None, memory: MemoryManager = None,
+                 tool_registry: ToolRegistry = None):
+        start = time.perf_counter()
+        self.llm_client = llm_client or LLMClient()
+        self.memory = memory or get_memory_manager()
+        self.tool_registry = tool_registry or ToolRegistry()
+        self.reflection_engine = ReflectionEngine(self.llm_client)
+        self.sessions_created = 0
+        self._lock = threading.Lock()
+        
+        # 初始化内置工具
+        self._init_builtin_tools()
+        
+        logger.info(f"Agent运行时初始化完成，耗时{(time.perf_counter() - start) * 1000:.1f}ms")
+    
+    def create_session(self, session_id: str = None) -> "MofyAgent":
+        """创建会话句柄，只分配会话自身的状态"""
+        from .agent import MofyAgent
+        return MofyAgent(session_id, runtime=self)
+    
+    def track_session(self):
+        """记录新建的会话"""
+        with self._lock:
+            self.sessions_created += 1
+    
+    def _init_builtin_tools(self):
+        """注册内置工具，整个运行时只注册一次"""
+        # 示例：计算器工具
+        def calculator(expression: str) -> str:
+            """简单计算器"""
+            try:
+                result = evaluate_expression(expression)
+                return f"计算结果: {result}"
+            except Exception as e:
+                return f"计算错误: {str(e)}"
+        
+        self.tool_registry.register_tool(
+            "calculator",
+            calculator,
+            {
+                "description": "执行数学计算",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "expression": {
+                            "type": "string",
+                            "description": "数学表达式，如 '2+3*4'",
+                            # 只允许数字和四则运算符，不允许乘方
+                            "pattern": r"^(?!.*\*\s*\*)[\d\s+\-*/().]+$"
+                        }
+                    },
+                    "required": ["expression"]
+                }
+            }
+        )
+        
+        # 示例：搜索工具
+        def search(query: str) -> str:
+            """模拟搜索工具"""
+            return f"搜索'{query}'的结果：这里应该是搜索结果内容"
+        
+        self.tool_registry.register_tool(
+            "search",
+            search,
+            {
+                "description": "搜索信息",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": "搜索关键词"
+                        }
+                    },
+                    "required": ["query"]
+                }
+            }
+        )
+        
+        # 内置工具的快速路由规则，只匹配意图明确的整句
+        if config.intent_router:
+            router = get_intent_router()
+            router.add_rule("calculator", r"^(?:请|帮我)?(?:计算|算一下|算)\s*(?P<expression>(?!.*\*\s*\*)[\d\s+\-*/().]+?)\s*(?:等于多少|是多少)?[?？]?$", "calculator")
+            router.add_rule("search", r"^(?:请|帮我)?(?:搜索|查找)\s*(?P<query>[^，。,]+?)[。.]?$", "search")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """运行时统计"""
+        return {
+            "sessions_created": self.sessions_created,
+            "tools": len(self.tool_registry.tools)
+        }
+
+_agent_runtime: Optional[AgentRuntime] = None
+_agent_runtime_lock = threading.Lock()
+
+def get_agent_runtime() -> AgentRuntime:
+    """获取进程级Agent运行时，首次使用时才创建"""
+    global _agent_runtime
+    if _agent_runtime is None:
+        with _agent_runtime_lock:
+            if _agent_runtime is None:
+                _agent_runtime = AgentRuntime()
+    return _agent_runtime
@@ -0,0 +1,148 @@
+"""
+Mofy Agent Framework - 语义缓存
+对提示词做归一化和本地向量化，近似重复的提示词复用已缓存的回答
+"""
+
+import re
+import math
+import zlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Sequence, Union, Tuple
+
+SparseVector = Dict[int, float]
+
+# 时间戳、日期、UUID等每次请求都会变化但不影响语义的片段
+_VOLATILE_PATTERNS = [
+    re.compile(r"\d{4}[-/年]\d{1,2}[-/月]\d{1,2}日?(?:[ tT]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?"),
+    re.compile(r"\b\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?\b"),
+    re.compile(r"\b1\d{9}(?:\.\d+)?\b"),  # Unix时间戳
+    re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b"),
+]
+_PUNCT_PATTERN = re.compile(r"[\s,.;:!?'\"`~，。；：！？、“”‘’（）()\[\]【】{}<>《》…—-]+")
+
+def normalize_prompt(prompt: str) -> str:
+    """归一化提示词：屏蔽时间戳等易变片段，去除空白和标点，统一小写"""
+    text = prompt.lower()
+    for pattern in _VOLATILE_PATTERNS:
+        text = pattern.sub("#", text)
+    return _PUNCT_PATTERN.sub("", text)
+
+class NGramHashEmbedder:
+    """字符n-gram哈希向量化，纯本地计算，对中英文均适用"""
+    
+    def __init__(self, ngram_range: Tuple[int, int] = (2, 3), dimensions: int = 1 << 18):
+        self.ngram_range = ngram_range
+        self.dimensions = dimensions
+    
+    def __call__(self, text: str) -> SparseVector:
+        vector: SparseVector = {}
+        min_n, max_n = self.ngram_range
+        for n in range(min_n, max_n + 1):
+            for i in range(len(text) - n + 1):
+                index = zlib.crc32(text[i:i + n].encode()) % self.dimensions
+                vector[index] = vector.get(index, 0.0) + 1.0
+        # 短文本退化为单字符特征
+        if not vector:
+            for char in text:
+                index = zlib.crc32(char.encode()) % self.dimensions
+                vector[index] = vector.get(index, 0.0) + 1.0
+        return vector
+
+def _to_unit_sparse(vector: Union[SparseVector, Sequence[float]]) -> SparseVector:
+    """统一转为单位长度的稀疏向量，兼容返回稠密列表的自定义向量化函数"""
+    if not isinstance(vector, dict):
+        vector = {i: float(v) for i, v in enumerate(vector) if v}
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    if norm == 0:
+        return {}
+    return {i: v / norm for i, v in vector.items()}
+
+class SemanticCache:
+    """近似重复提示词索引，命中时返回已缓存回答对应的精确缓存键"""
+    
+    def __init__(self, threshold: float = 0.95, max_entries: int = 2000,
+                 embedder: Callable[[str], Union[SparseVector, Sequence[float]]] = None,
+                 probe_features: int = 8):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.probe_features = probe_features
+        self.embedder = embedder or NGramHashEmbedder()
+        self.stats = {"semantic_hits": 0, "semantic_misses": 0}
+        self._entries: "OrderedDict[int, Tuple[str, str, str, SparseVector]]" = OrderedDict()
+        self._postings: Dict[int, set] = {}  # 特征 -> 包含该特征的条目，用于快速近邻检索
+        self._normalized: Dict[Tuple[str, str], int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+    
+    def add(self, prompt: str, cache_key: str, namespace: str = ""):
+        """记录提示词与其精确缓存键"""
+        normalized = normalize_prompt(prompt)
+        vector = _to_unit_sparse(self.embedder(normalized))
+        if not vector:
+            return
+        
+        with self._lock:
+            old_id = self._normalized.get((namespace, normalized))
+            if old_id is not None:
+                self._remove(old_id)
+            
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (namespace, normalized, cache_key, vector)
+            self._normalized[(namespace, normalized)] = entry_id
+            for feature in vector:
+                self._postings.setdefault(feature, set()).add(entry_id)
+            
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+    
+    def lookup(self, prompt: str, namespace: str = "") -> Optional[str]:
+        """查找最相似的已缓存提示词，相似度达到阈值时返回其缓存键"""
+        normalized = normalize_prompt(prompt)
+        vector = _to_unit_sparse(self.embedder(normalized))
+        
+        best_id, best_score = None, 0.0
+        with self._lock:
+            # 高阈值下真正的近似重复必然共享大部分特征，只从已被索引的特征中最稀有的若干个召回候选；
+            # 没有倒排记录的特征（查询独有的n-gram）召回不到任何条目，不能占用探测名额
+            features = sorted((f for f in vector if f in self._postings), key=lambda f: len(self._postings[f]))
+            candidates = set()
+            for feature in features[:self.probe_features]:
+                candidates.update(self._postings.get(feature, ()))
+            
+            for entry_id in candidates:
+                entry_namespace, _, _, stored = self._entries[entry_id]
+                if entry_namespace != namespace:
+                    continue
+                score = sum(weight * stored.get(feature, 0.0) for feature, weight in vector.items())
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+            
+            if best_id is None or best_score < self.threshold:
+                self.stats["semantic_misses"] += 1
+                return None
+            
+            self.stats["semantic_hits"] += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id][2]
+    
+    def discard(self, cache_key: str):
+        """移除指向已失效缓存键的条目"""
+        with self._lock:
+            for entry_id in [i for i, entry in self._entries.items() if entry[2] == cache_key]:
+                self._remove(entry_id)
+    
+    def _remove(self, entry_id: int):
+        namespace, normalized, _, vector = self._entries.pop(entry_id)
+        self._normalized.pop((namespace, normalized), None)
+        for feature in vector:
+            postings = self._postings.get(feature)
+            if postings is not None:
+                postings.discard(entry_id)
+                if not postings:
+                    del self._postings[feature]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取语义缓存统计"""
+        return {**self.stats, "semantic_entries": len(self._entries)}
@@ -0,0 +1,279 @@
+"""
+Mofy Agent Framework - HTTP服务
+基于aiohttp的异步HTTP入口：对话（支持SSE逐段输出）、状态和指标接口，
+对话请求经过准入控制，keep-alive可配置，收到SIGTERM/SIGINT后先排空进行中的请求再退出
+"""
+
+import json
+import time
+import uuid
+import signal
+import asyncio
+from typing import Dict, Any, Optional
+from aiohttp import web
+from loguru import logger
+from .config import config
+from .exceptions import AdmissionError
+from .admission import AdmissionController, estimate_turn_latency
+from .intent_router import get_intent_router
+from .plan_cache import get_plan_cache
+from .session import SessionManager, get_session_manager
+from .hash_ring import ConsistentHashRing
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+def _json(data: Any, status: int = 200, headers: Dict[str, str] = None) -> web.Response:
+    return web.json_response(data, status=status, headers=headers, dumps=_dumps)
+
+class AgentServer:
+    """Agent的HTTP服务，一个进程内所有连接共享同一个SessionManager"""
+    
+    def __init__(self, manager: SessionManager = None, host: str = None, port: int = None,
+                 max_concurrency: int = None, keepalive_timeout: float = None, drain_timeout: float = None,
+                 admission: AdmissionController = None, node: str = None):
+        self._manager = manager
+        self.host = host or config.server_host
+        self.port = port if port is not None else config.server_port
+        self.max_concurrency = max_concurrency or config.server_max_concurrency
+        self.keepalive_timeout = keepalive_timeout if keepalive_timeout is not None else config.server_keepalive_timeout
+        self.drain_timeout = drain_timeout if drain_timeout is not None else config.server_drain_timeout
+        self.node = node  # 多进程模式下本进程在一致性哈希环上的节点名
+        self.draining = False
+        self.inflight = 0  # 进行中的请求数，排空时等待归零
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.admission = admission or AdmissionController(
+            max_inflight=self.max_concurrency,
+            max_inflight_per_tenant=config.admission_tenant_max_inflight,
+            max_queue=config.admission_max_queue,
+            max_queue_time=config.admission_max_queue_time,
+            latency_probe=lambda: estimate_turn_latency(self.manager.runtime)
+        )
+        self._runner: Optional[web.AppRunner] = None
+        self._sweeper: Optional[asyncio.Task] = None
+        self.started_at = time.time()
+        self.stats = {"requests": 0, "chats": 0, "streams": 0, "errors": 0, "rejected": 0}
+    
+    @property
+    def manager(self) -> SessionManager:
+        # 延迟到第一次请求时创建，避免导入本模块就初始化LLM客户端和Redis连接
+        if self._manager is None:
+            self._manager = get_session_manager()
+        return self._manager
+    
+    def build_app(self) -> web.Application:
+        """创建aiohttp应用"""
+        app = web.Application(middlewares=[self._track_request])
+        app.router.add_post("/chat", self.handle_chat)
+        app.router.add_get("/status", self.handle_status)
+        app.router.add_get("/status/{session_id}", self.handle_session_status)
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.router.add_get("/health", self.handle_health)
+        if self.node:
+            app.router.add_post("/internal/rebalance", self.handle_rebalance)
+        return app
+    
+    @web.middleware
+    async def _track_request(self, request: web.Request, handler):
+        """统计进行中的请求；排空期间的新对话请求直接返回503并关闭连接"""
+        self.stats["requests"] += 1
+        if self.draining and request.path == "/chat":
+            self.stats["rejected"] += 1
+            response = _json({"error": "服务正在关闭"}, status=503)
+            response.force_close()
+            return response
+        
+        self.inflight += 1
+        self._idle.clear()
+        try:
+            response = await handler(request)
+            if self.draining:
+                response.force_close()  # 排空期间不再复用连接，客户端会重连到其他实例
+            return response
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.inflight -= 1
+            if self.inflight == 0:
+                self._idle.set()
+    
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        """POST /chat {"session_id", "message", "stream", "tenant", "priority"}
+        
+        stream为true或Accept为text/event-stream时以SSE逐段返回；租户也可由X-Tenant-ID请求头指定，
+        priority数值越小越先被放行，默认5
+        """
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return _json({"error": "请求体必须是JSON"}, status=400)
+        if not isinstance(body, dict):
+            return _json({"error": "请求体必须是JSON对象"}, status=400)
+        message = body.get("message")
+        if not isinstance(message, str) or not message.strip():
+            return _json({"error": "缺少message"}, status=400)
+        session_id = str(body.get("session_id") or request.headers.get("X-Session-ID") or uuid.uuid4())
+        stream = bool(body.get("stream")) or "text/event-stream" in request.headers.get("Accept", "")
+        tenant = str(body.get("tenant") or request.headers.get("X-Tenant-ID") or "default")
+        try:
+            priority = int(body.get("priority", 5))
+        except (TypeError, ValueError):
+            return _json({"error": "priority必须是整数"}, status=400)
+        
+        try:
+            async with self.admission.admit(tenant, priority):
+                if stream:
+                    return await self._stream_chat(request, session_id, message)
+                self.stats["chats"] += 1
+                reply = await self.manager.process_message(session_id, message)
+                return _json({"session_id": session_id, "reply": reply})
+        except AdmissionError as e:
+            self.stats["rejected"] += 1
+            return _json({"error": str(e)}, status=e.status_code, headers={"Retry-After": str(e.retry_after)})
+    
+    async def _stream_chat(self, request: web.Request, session_id: str, message: str) -> web.StreamResponse:
+        """以SSE输出回复：每段一个data事件，结束时发送done事件"""
+        self.stats["streams"] += 1
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream; charset=utf-8",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 关闭反向代理缓冲，保证逐段到达客户端
+        })
+        if self.draining:
+            response.force_close()
+        await response.prepare(request)
+        
+        chunks = self.manager.stream_message(session_id, message)
+        try:
+            async for chunk in chunks:
+                await response.write(f"data: {_dumps({'delta': chunk})}\n\n".encode("utf-8"))
+            await response.write(f"event: done\ndata: {_dumps({'session_id': session_id})}\n\n".encode("utf-8"))
+        except ConnectionResetError:
+            logger.debug(f"客户端已断开，停止输出: {session_id}")
+        finally:
+            await chunks.aclose()
+        return response
+    
+    async def handle_status(self, request: web.Request) -> web.Response:
+        """GET /status 服务状态"""
+        return _json({
+            "status": "draining" if self.draining else "ok",
+            "uptime": time.time() - self.started_at,
+            "inflight": self.inflight,
+            "max_concurrency": self.max_concurrency,
+            "admission": self.admission.get_stats(),
+            "sessions": self.manager.get_stats()
+        })
+    
+    async def handle_session_status(self, request: web.Request) -> web.Response:
+        """GET /status/{session_id} 会话状态，已换出或不存在的会话不会被加载"""
+        session_id = request.match_info["session_id"]
+        agent = self.manager.peek(session_id)
+        if agent is None:
+            return _json({"session_id": session_id, "active": False})
+        return _json({**agent.get_status(), "active": True})
+    
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """GET /metrics 服务、会话、LLM用量与缓存、工具调用指标"""
+        runtime = self.manager.runtime
+        return _json({
+            "server": {**self.stats, "inflight": self.inflight, "draining": self.draining},
+            "admission": self.admission.get_stats(),
+            "sessions": self.manager.get_stats(),
+            "runtime": runtime.get_stats(),
+            "usage": runtime.llm_client.get_usage_stats(),
+            "cache": runtime.llm_client.get_cache_stats(),
+            "reliability": runtime.llm_client.get_reliability_stats(),
+            "tools": runtime.tool_registry.get_metrics(),
+            "intent_router": get_intent_router().get_stats() if config.intent_router else {},
+            "plan_cache": get_plan_cache().get_stats() if config.plan_cache else {}
+        })
+    
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """GET /health 负载均衡健康检查，排空期间返回503使实例尽快被摘除"""
+        if self.draining:
+            return _json({"status": "draining"}, status=503)
+        return _json({"status": "ok"})
+    
+    async def handle_rebalance(self, request: web.Request) -> web.Response:
+        """POST /internal/rebalance {"nodes"}：工作进程增减后换出不再归属本进程的会话"""
+        ring = ConsistentHashRing((await request.json())["nodes"])
+        if self._manager is None:
+            return _json({"node": self.node, "evicted": 0})  # 尚未处理过会话
+        evicted = await asyncio.to_thread(self.manager.evict_where, lambda session_id: ring.get_node(session_id) != self.node)
+        return _json({"node": self.node, "evicted": evicted})
+    
+    async def _sweep_sessions(self):
+        """定期换出空闲会话，不依赖新请求触发"""
+        while True:
+            await asyncio.sleep(self.manager.sweep_interval)
+            try:
+                await asyncio.to_thread(self.manager.evict_idle)
+            except Exception as e:
+                logger.error(f"空闲会话清理失败: {str(e)}")
+    
+    async def start(self):
+        """开始监听"""
+        self._runner = web.AppRunner(self.build_app(), keepalive_timeout=self.keepalive_timeout,
+                                     handle_signals=False, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self._sweeper = asyncio.create_task(self._sweep_sessions())
+        logger.info(f"Mofy HTTP服务已启动: http://{self.host}:{self.port}，最大并发{self.max_concurrency}")
+    
+    async def drain(self) -> bool:
+        """进入排空状态并等待进行中的请求完成，超时返回False"""
+        self.draining = True
+        logger.info(f"开始排空，进行中的请求{self.inflight}个，最长等待{self.drain_timeout}秒")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.drain_timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"排空超时，仍有{self.inflight}个请求未完成")
+            return False
+    
+    async def stop(self):
+        """排空后关闭监听和所有连接"""
+        await self.drain()
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+        # 会话换出到StateStore，重启或由其他进程接管后可以恢复
+        if self._manager is not None:
+            try:
+                await asyncio.to_thread(self._manager.evict_all)
+            except Exception as e:
+                logger.error(f"退出前换出会话失败: {str(e)}")
+        logger.info("Mofy HTTP服务已停止")
+    
+    async def run(self):
+        """启动服务直到收到SIGTERM/SIGINT，然后优雅退出"""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass  # Windows不支持，依赖KeyboardInterrupt退出
+        
+        await self.start()
+        try:
+            await stop_event.wait()
+        finally:
+            await self.stop()
+
+def serve(host: str = None, port: int = None, workers: int = None):
+    """以阻塞方式运行HTTP服务，workers大于1时以多进程模式运行"""
+    workers = workers or config.server_workers
+    if workers > 1:
+        from .workers import run_workers
+        run_workers(host, port, workers)
+        return
+    try:
+        asyncio.run(AgentServer(host=host, port=port).run())
+    except KeyboardInterrupt:
+        pass
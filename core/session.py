@@ -0,0 +1,249 @@
+"""
+Mofy Agent Framework - 会话管理
+常驻内存的只有活跃会话：空闲超时或超出上限的会话换出到StateStore（Redis），
+下一条消息到达时透明恢复；快照读写不持有锁，异步路径中在线程池执行
+"""
+
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+from collections import OrderedDict, Counter
+from typing import Dict, Any, Optional, AsyncIterator, Callable, List, Tuple
+from loguru import logger
+from .config import config
+from .runtime import AgentRuntime, get_agent_runtime
+from ..modules.state import StateStore
+
+class SessionManager:
+    """按会话ID获取Agent，负责空闲会话的换出与恢复"""
+    
+    def __init__(self, runtime: AgentRuntime = None, store: StateStore = None,
+                 idle_timeout: int = None, max_active: int = None, snapshot_ttl: int = None,
+                 sweep_interval: int = None):
+        self.runtime = runtime or get_agent_runtime()
+        self.store = store or StateStore()
+        self.idle_timeout = idle_timeout if idle_timeout is not None else config.session_idle_timeout
+        self.max_active = max_active if max_active is not None else config.session_max_active
+        self.snapshot_ttl = snapshot_ttl if snapshot_ttl is not None else config.session_snapshot_ttl
+        self.sweep_interval = sweep_interval if sweep_interval is not None else config.session_sweep_interval
+        self._sessions: "OrderedDict[str, Any]" = OrderedDict()  # 按最近使用排序
+        self._inflight: Counter = Counter()  # 正在处理消息的会话不会被换出
+        self._evict_on_release = set()  # 需要换出但仍在处理消息的会话，处理结束后换出
+        self._pending: Dict[str, Future] = {}  # 正在换入或换出的会话，快照读写在锁外进行
+        self._last_sweep = time.time()
+        self._lock = threading.RLock()
+        self.stats = {"created": 0, "evicted": 0, "rehydrated": 0}
+    
+    def get(self, session_id: str, acquire: bool = False):
+        """获取会话，已换出的会话从快照恢复，不存在时新建；acquire为True时同时登记为处理中"""
+        while True:
+            agent, pending, owner = self._claim(session_id, acquire)
+            if agent is not None:
+                return agent
+            if owner:
+                self._load(session_id, pending)
+            else:
+                pending.result()  # 等待同一会话正在进行的换入或换出完成后重试
+    
+    async def aget(self, session_id: str, acquire: bool = False):
+        """get的异步版本，快照读写在线程池中执行，不阻塞事件循环"""
+        while True:
+            agent, pending, owner = self._claim(session_id, acquire)
+            if agent is not None:
+                return agent
+            if owner:
+                await asyncio.to_thread(self._load, session_id, pending)
+            else:
+                # pending由其他调用方完成，本请求取消时不能连带取消它
+                await asyncio.shield(asyncio.wrap_future(pending))
+    
+    def _claim(self, session_id: str, acquire: bool) -> Tuple[Any, Optional[Future], bool]:
+        """在锁内查找会话，返回(会话, 进行中的换入/换出, 是否由调用方负责换入)"""
+        with self._lock:
+            agent = self._sessions.get(session_id)
+            if agent is not None:
+                self._sessions.move_to_end(session_id)
+                if acquire:
+                    self._inflight[session_id] += 1
+                return agent, None, False
+            pending = self._pending.get(session_id)
+            if pending is not None:
+                return None, pending, False
+            pending = self._pending[session_id] = Future()
+            return None, pending, True
+    
+    def _load(self, session_id: str, pending: Future):
+        """在锁外读取快照并创建会话，登记后按上限换出其他会话；快照读取后即删除，同一会话只能有一个加载者"""
+        try:
+            agent = self.runtime.create_session(session_id)
+            snapshot = self.store.load_snapshot(session_id)
+            if snapshot:
+                agent.restore_snapshot(snapshot)
+                agent.last_active = time.time()  # 避免刚恢复的会话在同一轮清理中再次被换出
+        except BaseException:
+            with self._lock:
+                del self._pending[session_id]
+            pending.set_result(None)
+            raise
+        
+        with self._lock:
+            if snapshot:
+                self.stats["rehydrated"] += 1
+                logger.debug(f"会话已恢复: {session_id}")
+            else:
+                self.stats["created"] += 1
+            self._sessions[session_id] = agent
+            del self._pending[session_id]
+            victims = self._select_victims(keep=session_id)
+        pending.set_result(None)
+        self._save_detached(victims)
+    
+    async def process_message(self, session_id: str, message: str) -> str:
+        """在指定会话中处理消息"""
+        agent = await self.aget(session_id, acquire=True)
+        try:
+            return await agent.process_message(message)
+        finally:
+            if self._release(session_id):
+                await asyncio.to_thread(self.evict, session_id)
+    
+    async def stream_message(self, session_id: str, message: str) -> AsyncIterator[str]:
+        """在指定会话中流式处理消息，输出结束或中断前会话不会被换出"""
+        agent = await self.aget(session_id, acquire=True)
+        try:
+            async for chunk in agent.stream_message(message):
+                yield chunk
+        finally:
+            if self._release(session_id):
+                await asyncio.to_thread(self.evict, session_id)
+    
+    def process_message_sync(self, session_id: str, message: str) -> str:
+        """process_message的同步版本"""
+        agent = self.get(session_id, acquire=True)
+        try:
+            return agent.process_message_sync(message)
+        finally:
+            if self._release(session_id):
+                self.evict(session_id)
+    
+    def peek(self, session_id: str):
+        """返回常驻内存的会话，不加载快照也不新建"""
+        with self._lock:
+            return self._sessions.get(session_id)
+    
+    def _release(self, session_id: str) -> bool:
+        """结束一次处理，返回会话是否等待处理结束后换出（由调用方在锁外换出）"""
+        with self._lock:
+            self._inflight[session_id] -= 1
+            if self._inflight[session_id] > 0:
+                return False
+            del self._inflight[session_id]
+            if session_id in self._evict_on_release:
+                self._evict_on_release.discard(session_id)
+                return True
+            return False
+    
+    def _detach(self, session_id: str) -> Optional[Tuple[str, Any, Future]]:
+        """锁内调用：把会话移出内存并占位，快照写完前对该会话的get会等待；处理中的会话不移出"""
+        agent = self._sessions.get(session_id)
+        if agent is None or self._inflight.get(session_id):
+            return None
+        del self._sessions[session_id]
+        pending = self._pending[session_id] = Future()
+        return session_id, agent, pending
+    
+    def _save_detached(self, detached: List[Tuple[str, Any, Future]]) -> int:
+        """在锁外把移出的会话写入StateStore，返回换出数量；写入失败的会话放回内存并记录日志，不影响触发换出的请求"""
+        evicted = 0
+        for session_id, agent, pending in detached:
+            try:
+                self.store.save_snapshot(session_id, agent.to_snapshot(), ttl=self.snapshot_ttl)
+                agent.memory.drop_local(session_id)
+            except Exception as e:
+                logger.error(f"会话换出失败，保留在内存中: {session_id}: {str(e)}")
+                with self._lock:
+                    self._sessions[session_id] = agent
+                    self._sessions.move_to_end(session_id, last=False)
+                    del self._pending[session_id]
+            else:
+                with self._lock:
+                    del self._pending[session_id]
+                    self.stats["evicted"] += 1
+                evicted += 1
+                logger.debug(f"会话已换出: {session_id}")
+            pending.set_result(None)
+        return evicted
+    
+    def evict(self, session_id: str) -> bool:
+        """把会话换出到StateStore，正在处理消息的会话不换出"""
+        with self._lock:
+            detached = self._detach(session_id)
+        return detached is not None and self._save_detached([detached]) == 1
+    
+    def _idle_victims(self, now: float) -> List[Tuple[str, Any, Future]]:
+        """锁内调用：移出所有空闲超时的会话"""
+        self._last_sweep = now
+        idle = [
+            session_id for session_id, agent in self._sessions.items()
+            if now - agent.last_active > self.idle_timeout
+        ]
+        return [detached for detached in map(self._detach, idle) if detached]
+    
+    def evict_idle(self, now: float = None) -> int:
+        """换出所有空闲超时的会话，返回换出数量"""
+        with self._lock:
+            victims = self._idle_victims(now or time.time())
+        evicted = self._save_detached(victims)
+        if evicted:
+            logger.info(f"换出{evicted}个空闲会话，当前活跃{len(self._sessions)}个")
+        return evicted
+    
+    def evict_where(self, predicate: Callable[[str], bool]) -> int:
+        """换出所有满足条件的会话，正在处理消息的会话在处理结束后换出；返回立即换出的数量"""
+        with self._lock:
+            victims = []
+            for session_id in [s for s in self._sessions if predicate(s)]:
+                if self._inflight.get(session_id):
+                    self._evict_on_release.add(session_id)
+                else:
+                    victims.append(self._detach(session_id))
+        evicted = self._save_detached(victims)
+        if evicted:
+            logger.info(f"换出{evicted}个会话，当前活跃{len(self._sessions)}个")
+        return evicted
+    
+    def evict_all(self) -> int:
+        """换出所有会话，用于进程退出或会话迁移"""
+        return self.evict_where(lambda session_id: True)
+    
+    def _select_victims(self, keep: str) -> List[Tuple[str, Any, Future]]:
+        """锁内调用：定期清理空闲会话；活跃会话超出上限时移出最久未使用的会话，keep为当前请求的会话"""
+        victims = []
+        if time.time() - self._last_sweep > self.sweep_interval:
+            victims.extend(self._idle_victims(time.time()))
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_active:
+                break
+            if session_id != keep:
+                detached = self._detach(session_id)
+                if detached:
+                    victims.append(detached)
+        return victims
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """会话统计"""
+        with self._lock:
+            return {**self.stats, "active": len(self._sessions), "inflight": len(self._inflight)}
+
+_session_manager: Optional[SessionManager] = None
+_session_manager_lock = threading.Lock()
+
+def get_session_manager() -> SessionManager:
+    """获取进程级会话管理器"""
+    global _session_manager
+    if _session_manager is None:
+        with _session_manager_lock:
+            if _session_manager is None:
+                _session_manager = SessionManager()
+    return _session_manager
@@ -0,0 +1,84 @@
+"""
+Mofy Agent Framework - 请求合并
+相同key的并发调用只执行一次上游请求，其余调用方等待并共享结果
+"""
+
+import asyncio
+import threading
+from typing import Dict, Any, Callable, Awaitable, Tuple
+
+class _Call:
+    """一次进行中的调用"""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+class SingleFlight:
+    """线程级请求合并"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.coalesced = 0  # 被合并（未发起上游调用）的请求数
+    
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """执行fn，相同key的并发调用等待第一个调用的结果"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+        
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+class AsyncSingleFlight:
+    """协程级请求合并"""
+    
+    def __init__(self):
+        self._calls: Dict[Tuple[int, str], asyncio.Task] = {}
+        self.coalesced = 0
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行fn，相同key的并发调用等待第一个调用的结果"""
+        loop = asyncio.get_running_loop()
+        # Task绑定事件循环，按循环隔离
+        call_key = (id(loop), key)
+        
+        task = self._calls.get(call_key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # 上游调用在独立的Task中执行，发起方被取消时不会连带取消其他等待方
+            task = loop.create_task(fn())
+            self._calls[call_key] = task
+            task.add_done_callback(lambda done: self._finish(call_key, done))
+        # shield防止某个等待方被取消时连带取消共享的Task
+        return await asyncio.shield(task)
+    
+    def _finish(self, call_key: Tuple[int, str], task: asyncio.Task):
+        if self._calls.get(call_key) is task:
+            del self._calls[call_key]
+        # 等待方都已取消时避免"exception was never retrieved"警告
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,164 @@
+"""
+Mofy Agent Framework - Token预算
+可插拔的分词计数器、模型上下文窗口，以及按优先级填充token预算的上下文构建器
+"""
+
+import re
+from typing import Dict, List
+from .config import config
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+# 常用模型的上下文窗口（token）
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "deepseek-ai/DeepSeek-R1-Distill-Qwen-32B": 32768,
+    "Qwen/Qwen2.5-72B-Instruct": 32768,
+    "meta-llama/Llama-3.1-70B-Instruct": 131072,
+    "01-ai/Yi-1.5-34B-Chat": 4096,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+def get_context_window(model: str = None) -> int:
+    """获取模型上下文窗口，CONTEXT_WINDOW配置优先"""
+    if config.context_window:
+        return config.context_window
+    return MODEL_CONTEXT_WINDOWS.get(model or config.model_name, DEFAULT_CONTEXT_WINDOW)
+
+class ApproxTokenizer:
+    """快速本地近似计数：中日韩字符每字1个token，其余字符每4个约1个token"""
+    
+    def count(self, text: str) -> int:
+        cjk = len(_CJK_PATTERN.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截断到不超过max_tokens"""
+        if self.count(text) <= max_tokens:
+            return text
+        budget = max_tokens * 4  # 以1/4 token为单位计数
+        used = 0
+        for i, char in enumerate(text):
+            used += 4 if _CJK_PATTERN.match(char) else 1
+            if used > budget:
+                return text[:i]
+        return text
+
+class TiktokenTokenizer:
+    """基于tiktoken的精确计数（需安装tiktoken）"""
+    
+    def __init__(self, model: str = None):
+        # 延迟导入，避免拖慢冷启动
+        try:
+            import tiktoken
+        except ImportError:
+            raise ImportError("使用tiktoken分词需要先安装: pip install tiktoken")
+        try:
+            self.encoding = tiktoken.encoding_for_model(model or config.model_name)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+    
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+_tokenizers: Dict[str, object] = {"approx": ApproxTokenizer()}
+
+def register_tokenizer(name: str, tokenizer):
+    """注册自定义分词器，需实现count(text)和truncate(text, max_tokens)"""
+    _tokenizers[name] = tokenizer
+
+def get_tokenizer(name: str = None):
+    """获取分词器，默认使用TOKENIZER配置"""
+    name = name or config.tokenizer
+    if name not in _tokenizers and name == "tiktoken":
+        _tokenizers[name] = TiktokenTokenizer()
+    return _tokenizers.get(name, _tokenizers["approx"])
+
+def estimate_tokens(text: str) -> int:
+    """使用当前分词器估算token数"""
+    return get_tokenizer().count(text)
+
+class ContextResult:
+    """上下文构建结果"""
+    
+    def __init__(self, text: str, used_tokens: int, dropped_tokens: int,
+                 budget: int, sections: Dict[str, Dict[str, int]]):
+        self.text = text
+        self.used_tokens = used_tokens
+        self.dropped_tokens = dropped_tokens
+        self.budget = budget
+        self.sections = sections
+    
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "used_tokens": self.used_tokens,
+            "dropped_tokens": self.dropped_tokens,
+            "budget": self.budget,
+            "sections": self.sections
+        }
+
+class ContextBuilder:
+    """按优先级填充token预算：先加入的分段优先，放不下的条目计入丢弃"""
+    
+    def __init__(self, max_tokens: int, tokenizer=None):
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.used_tokens = 0
+        self.dropped_tokens = 0
+        self._parts: List[str] = []
+        self._sections: Dict[str, Dict[str, int]] = {}
+    
+    def add_section(self, title: str, items: List[str]):
+        """加入一个分段，条目按顺序尽量放入"""
+        stats = {"items": 0, "dropped_items": 0, "tokens": 0}
+        self._sections[title] = stats
+        if not items:
+            return
+        
+        separator = "\n\n" if self._parts else ""
+        header = f"{separator}{title}:"
+        header_tokens = self.tokenizer.count(header)
+        lines = []
+        used = header_tokens
+        
+        for item in items:
+            line = f"\n- {item}"
+            cost = self.tokenizer.count(line)
+            if self.used_tokens + used + cost <= self.max_tokens:
+                lines.append(line)
+                used += cost
+                stats["items"] += 1
+            else:
+                self.dropped_tokens += cost
+                stats["dropped_items"] += 1
+        
+        if lines:
+            self._parts.append(header + "".join(lines))
+            self.used_tokens += used
+            stats["tokens"] = used
+    
+    def build(self) -> ContextResult:
+        return ContextResult(
+            text="".join(self._parts),
+            used_tokens=self.used_tokens,
+            dropped_tokens=self.dropped_tokens,
+            budget=self.max_tokens,
+            sections=self._sections
+        )
+
+def context_budget(template: str = "", model: str = None) -> int:
+    """上下文可用预算 = 模型窗口 - 提示词模板 - 预留输出，可用MEMORY_CONTEXT_MAX_TOKENS进一步封顶"""
+    tokenizer = get_tokenizer()
+    budget = get_context_window(model) - tokenizer.count(template) - config.context_reserve_tokens
+    if config.memory_context_max_tokens:
+        budget = min(budget, config.memory_context_max_tokens)
+    return max(0, budget)
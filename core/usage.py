@@ -0,0 +1,195 @@
+"""
+Mofy Agent Framework - Token用量与成本统计
+按调用、模型、会话和调用位置（意图分析、最终回复、反思等）汇总token用量与估算成本
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, List
+from .config import config
+from .tokenizer import estimate_tokens
+
+# 常用模型价格（美元/百万token）：输入、命中Provider缓存的输入、输出
+MODEL_PRICING: Dict[str, Dict[str, float]] = {
+    "gpt-4o": {"input": 2.5, "cached_input": 1.25, "output": 10.0},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.6},
+    "gpt-4-turbo": {"input": 10.0, "cached_input": 10.0, "output": 30.0},
+    "gpt-3.5-turbo": {"input": 0.5, "cached_input": 0.5, "output": 1.5},
+}
+
+# 当前调用所属的会话和调用位置，随线程/协程上下文传递
+_usage_context: ContextVar[Dict[str, str]] = ContextVar("mofy_usage_context", default={})
+
+@contextmanager
+def usage_scope(session_id: str = None, call_site: str = None):
+    """标记作用域内LLM调用的会话和调用位置，未指定的字段沿用外层作用域"""
+    scope = dict(_usage_context.get())
+    if session_id is not None:
+        scope["session_id"] = session_id
+    if call_site is not None:
+        scope["call_site"] = call_site
+    token = _usage_context.set(scope)
+    try:
+        yield
+    finally:
+        _usage_context.reset(token)
+
+def _load_pricing() -> Dict[str, Dict[str, float]]:
+    pricing = dict(MODEL_PRICING)
+    if config.llm_pricing:
+        pricing.update(json.loads(config.llm_pricing))
+    return pricing
+
+def estimate_cost(pricing: Dict[str, Dict[str, float]], model: str, prompt_tokens: int,
+                  completion_tokens: int, cached_tokens: int = 0) -> float:
+    """估算一次调用的成本，未配置价格的模型按0计"""
+    price = pricing.get(model)
+    if not price:
+        return 0.0
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    return (
+        (prompt_tokens - cached_tokens) * price.get("input", 0.0)
+        + cached_tokens * price.get("cached_input", price.get("input", 0.0))
+        + completion_tokens * price.get("output", 0.0)
+    ) / 1_000_000
+
+def _empty_bucket() -> Dict[str, Any]:
+    return {
+        "calls": 0,             # 实际调用Provider的次数
+        "cache_hits": 0,        # 本地缓存命中次数
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "reasoning_tokens": 0,  # 输出中属于思考过程的token，已包含在completion_tokens中
+        "cached_tokens": 0,     # Provider侧提示词缓存命中的token
+        "saved_tokens": 0,      # 本地缓存命中节省的token（估算）
+        "cost": 0.0,
+        "saved_cost": 0.0
+    }
+
+class UsageTracker:
+    """线程安全的用量汇总"""
+    
+    def __init__(self, max_sessions: int = 10000, recent_calls: int = 200):
+        self.max_sessions = max_sessions
+        self.pricing = _load_pricing()
+        self.total = _empty_bucket()
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+        self.by_call_site: Dict[str, Dict[str, Any]] = {}
+        self.by_session: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.recent: deque = deque(maxlen=recent_calls)
+        self._lock = threading.Lock()
+    
+    def _buckets(self, model: str, scope: Dict[str, str]) -> List[Dict[str, Any]]:
+        buckets = [
+            self.total,
+            self.by_model.setdefault(model, _empty_bucket()),
+            self.by_call_site.setdefault(scope.get("call_site", "other"), _empty_bucket())
+        ]
+        session_id = scope.get("session_id")
+        if session_id:
+            if session_id not in self.by_session:
+                self.by_session[session_id] = _empty_bucket()
+                # 只保留最近活跃的会话，避免长期运行时无限增长
+                while len(self.by_session) > self.max_sessions:
+                    self.by_session.popitem(last=False)
+            self.by_session.move_to_end(session_id)
+            buckets.append(self.by_session[session_id])
+        return buckets
+    
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int,
+               cached_tokens: int = 0, estimated: bool = False, reasoning_tokens: int = 0):
+        """记录一次实际的Provider调用"""
+        scope = _usage_context.get()
+        cost = estimate_cost(self.pricing, model, prompt_tokens, completion_tokens, cached_tokens)
+        with self._lock:
+            for bucket in self._buckets(model, scope):
+                bucket["calls"] += 1
+                bucket["prompt_tokens"] += prompt_tokens
+                bucket["completion_tokens"] += completion_tokens
+                bucket["reasoning_tokens"] += reasoning_tokens
+                bucket["cached_tokens"] += cached_tokens
+                bucket["cost"] += cost
+            self.recent.append({
+                "ts": round(time.time(), 3),
+                "model": model,
+                "session_id": scope.get("session_id"),
+                "call_site": scope.get("call_site", "other"),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "reasoning_tokens": reasoning_tokens,
+                "cached_tokens": cached_tokens,
+                "cost": cost,
+                "estimated": estimated
+            })
+    
+    def record_response(self, model: str, prompt: str, response: Any, reasoning: str = ""):
+        """从响应的usage字段记录用量，Provider未返回usage时按文本估算；reasoning为已分离的思考内容"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            self.record(model, estimate_tokens(prompt),
+                        estimate_tokens(response.choices[0].message.content or ""), estimated=True,
+                        reasoning_tokens=estimate_tokens(reasoning) if reasoning else 0)
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        completion_details = getattr(usage, "completion_tokens_details", None)
+        reasoning_tokens = getattr(completion_details, "reasoning_tokens", None)
+        if reasoning_tokens is None:
+            reasoning_tokens = estimate_tokens(reasoning) if reasoning else 0
+        self.record(getattr(response, "model", None) or model, usage.prompt_tokens,
+                    usage.completion_tokens, cached_tokens, reasoning_tokens=reasoning_tokens)
+    
+    def record_cache_hit(self, model: str, prompt: str, result: str):
+        """记录一次本地缓存命中及其节省的token"""
+        scope = _usage_context.get()
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(result)
+        saved_cost = estimate_cost(self.pricing, model, prompt_tokens, completion_tokens)
+        with self._lock:
+            for bucket in self._buckets(model, scope):
+                bucket["cache_hits"] += 1
+                bucket["saved_tokens"] += prompt_tokens + completion_tokens
+                bucket["saved_cost"] += saved_cost
+    
+    def session_snapshot(self, session_id: str) -> Dict[str, Any]:
+        """单个会话的用量"""
+        with self._lock:
+            return dict(self.by_session.get(session_id) or _empty_bucket())
+    
+    def snapshot(self, recent: int = 0) -> Dict[str, Any]:
+        """用量快照，recent>0时附带最近的单次调用记录"""
+        with self._lock:
+            snapshot = {
+                "total": dict(self.total),
+                "by_model": {k: dict(v) for k, v in self.by_model.items()},
+                "by_call_site": {k: dict(v) for k, v in self.by_call_site.items()},
+                "sessions": len(self.by_session)
+            }
+            if recent:
+                snapshot["recent"] = list(self.recent)[-recent:]
+        return snapshot
+    
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self.total = _empty_bucket()
+            self.by_model.clear()
+            self.by_call_site.clear()
+            self.by_session.clear()
+            self.recent.clear()
+
+_usage_tracker: Optional[UsageTracker] = None
+_usage_tracker_lock = threading.Lock()
+
+def get_usage_tracker() -> UsageTracker:
+    """获取进程级用量统计"""
+    global _usage_tracker
+    if _usage_tracker is None:
+        with _usage_tracker_lock:
+            if _usage_tracker is None:
+                _usage_tracker = UsageTracker(max_sessions=config.usage_max_sessions)
+    return _usage_tracker
@@ -0,0 +1,349 @@
+"""
+Mofy Agent Framework - 多进程工作模式
+主进程导入框架后预先fork出N个工作进程，每个工作进程在本机端口上运行AgentServer；
+主进程对外监听，按会话ID的一致性哈希把请求转发到固定的工作进程，会话的短期记忆和状态始终留在同一进程内。
+SIGTTIN/SIGTTOU增减工作进程，归属变化的会话经StateStore换出后才发布新的哈希环，由新的归属进程按需恢复
+"""
+
+import os
+import json
+import time
+import uuid
+import signal
+import socket
+import asyncio
+import multiprocessing
+from collections import Counter
+from typing import Dict, Optional, Callable, Awaitable, Tuple
+import aiohttp
+from aiohttp import web
+from loguru import logger
+from .config import config
+from .hash_ring import ConsistentHashRing
+
+# 只在相邻两跳之间有意义的请求/响应头，转发时去掉
+_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "upgrade",
+                "proxy-connection", "te", "trailer", "host"}
+
+def _worker_main(node: str, host: str, port: int, inherited: Optional[socket.socket]):
+    """工作进程入口"""
+    if inherited is not None:
+        inherited.close()  # fork继承的主进程监听socket，工作进程不接受外部连接
+    for sig in (signal.SIGTTIN, signal.SIGTTOU):
+        signal.signal(sig, signal.SIG_IGN)
+    
+    from .server import AgentServer
+    logger.info(f"工作进程{node}启动，pid {os.getpid()}")
+    try:
+        asyncio.run(AgentServer(host=host, port=port, node=node).run())
+    except KeyboardInterrupt:
+        pass
+
+class WorkerPool:
+    """工作进程的启动、监控和扩缩容，以及按会话亲和性转发请求的前端"""
+    
+    def __init__(self, workers: int = None, host: str = None, port: int = None, base_port: int = None,
+                 drain_timeout: float = None, keepalive_timeout: float = None):
+        self.workers = workers or config.server_workers
+        self.host = host or config.server_host
+        self.port = port if port is not None else config.server_port
+        self.base_port = base_port or config.server_worker_base_port
+        self.drain_timeout = drain_timeout if drain_timeout is not None else config.server_drain_timeout
+        self.keepalive_timeout = keepalive_timeout if keepalive_timeout is not None else config.server_keepalive_timeout
+        self.worker_host = "127.0.0.1"  # 使用IP字面量，转发时不经过DNS解析线程
+        self.ring = ConsistentHashRing()
+        self.ports: Dict[str, int] = {}
+        self.processes: Dict[str, multiprocessing.Process] = {}
+        self.draining = False
+        self.inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._scaling = asyncio.Lock()
+        self._proxying: Counter = Counter()  # 各会话正在转发中的请求数
+        self._pending_handoff: Optional[Tuple[Callable[[str], bool], asyncio.Event]] = None  # 迁移中的会话判定及完成事件
+        self._client: Optional[aiohttp.ClientSession] = None
+        self._listen_socket: Optional[socket.socket] = None
+        self.stats = {"proxied": 0, "upstream_errors": 0, "respawned": 0, "rebalanced": 0}
+    
+    # ---------- 工作进程管理 ----------
+    
+    def _next_node(self) -> str:
+        index = 0
+        while f"worker-{index}" in self.ports:
+            index += 1
+        return f"worker-{index}"
+    
+    def _spawn(self, node: str) -> multiprocessing.Process:
+        """fork工作进程，端口由节点编号决定，重启的进程沿用原端口和哈希环位置"""
+        port = self.ports.setdefault(node, self.base_port + int(node.rsplit("-", 1)[1]))
+        process = multiprocessing.get_context("fork").Process(
+            target=_worker_main, args=(node, self.worker_host, port, self._listen_socket), name=f"mofy-{node}"
+        )
+        process.start()
+        self.processes[node] = process
+        return process
+    
+    async def _wait_ready(self, node: str, timeout: float = 30) -> bool:
+        """等待工作进程的健康检查通过"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.processes[node].is_alive():
+                return False
+            try:
+                async with self._client.get(self._url(node, "/health")) as response:
+                    if response.status == 200:
+                        return True
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+        return False
+    
+    async def _rebalance(self, ring: ConsistentHashRing):
+        """通知新哈希环上的所有工作进程，换出不再属于自己的会话"""
+        nodes = list(ring.nodes)
+        
+        async def notify(node):
+            try:
+                async with self._client.post(self._url(node, "/internal/rebalance"), json={"nodes": nodes}) as response:
+                    return (await response.json()).get("evicted", 0)
+            except (aiohttp.ClientError, ValueError) as e:
+                logger.warning(f"通知{node}迁移会话失败: {str(e)}")
+                return 0
+        evicted = await asyncio.gather(*(notify(node) for node in nodes))
+        self.stats["rebalanced"] += sum(evicted)
+        logger.info(f"会话迁移完成，{len(nodes)}个工作进程共换出{sum(evicted)}个会话")
+    
+    async def _handoff(self, ring: ConsistentHashRing, transfer: Callable[[], Awaitable]):
+        """切换到新的哈希环：归属变化的会话暂停转发，等进行中的请求结束后由transfer让原归属进程写入快照，
+        最后才发布新环，新归属进程不会在快照写入前为这些会话新建空会话"""
+        def moving(session_id: str) -> bool:
+            return self.ring.get_node(session_id) != ring.get_node(session_id)
+        done = asyncio.Event()
+        self._pending_handoff = (moving, done)
+        try:
+            deadline = time.monotonic() + self.drain_timeout
+            while any(moving(session_id) for session_id in self._proxying):
+                if time.monotonic() > deadline:
+                    logger.warning("等待迁移会话的进行中请求超时，这些会话将在请求结束后换出")
+                    break
+                await asyncio.sleep(0.05)
+            await transfer()
+            self.ring = ring
+        finally:
+            self._pending_handoff = None
+            done.set()
+    
+    async def add_worker(self) -> Optional[str]:
+        """扩容一个工作进程：就绪后原归属进程先换出迁移到新进程的会话，再把新进程加入哈希环"""
+        async with self._scaling:
+            node = self._next_node()
+            self._spawn(node)
+            if not await self._wait_ready(node):
+                logger.error(f"工作进程{node}启动失败")
+                await self._terminate(node)
+                return None
+            ring = ConsistentHashRing(self.ring.nodes + [node])
+            await self._handoff(ring, lambda: self._rebalance(ring))
+            logger.info(f"工作进程{node}已加入，当前{len(self.ring)}个")
+            return node
+    
+    async def remove_worker(self) -> Optional[str]:
+        """缩容编号最大的工作进程：它排空并把会话换出到StateStore后，再从哈希环移除"""
+        async with self._scaling:
+            if len(self.ring) <= 1:
+                logger.warning("至少保留一个工作进程")
+                return None
+            node = max(self.ring.nodes, key=lambda n: int(n.rsplit("-", 1)[1]))
+            ring = ConsistentHashRing([n for n in self.ring.nodes if n != node])
+            await self._handoff(ring, lambda: self._terminate(node))
+            logger.info(f"工作进程{node}已移除，当前{len(self.ring)}个")
+            return node
+    
+    async def _terminate(self, node: str):
+        """SIGTERM让工作进程排空后退出，超时则强制结束"""
+        process = self.processes.pop(node, None)
+        self.ports.pop(node, None)
+        if process is None:
+            return
+        if process.is_alive():
+            process.terminate()
+            await asyncio.to_thread(process.join, self.drain_timeout + 10)
+        if process.is_alive():
+            logger.warning(f"工作进程{node}未能按时退出，强制结束")
+            process.kill()
+            await asyncio.to_thread(process.join, 5)
+    
+    async def _supervise(self):
+        """意外退出的工作进程按原编号重启，哈希环不变，会话从快照恢复"""
+        while True:
+            await asyncio.sleep(1)
+            if self.draining or self._scaling.locked():
+                continue
+            for node, process in list(self.processes.items()):
+                if not process.is_alive():
+                    logger.error(f"工作进程{node}异常退出(code {process.exitcode})，正在重启")
+                    self._spawn(node)
+                    self.stats["respawned"] += 1
+    
+    # ---------- 请求转发 ----------
+    
+    def _url(self, node: str, path: str) -> str:
+        return f"http://{self.worker_host}:{self.ports[node]}{path}"
+    
+    def _session_id(self, request: web.Request, body: bytes) -> Optional[str]:
+        """请求所属的会话：优先取请求头和路径，只有对话请求才解析请求体"""
+        session_id = request.headers.get("X-Session-ID") or request.match_info.get("session_id")
+        if session_id:
+            return session_id
+        if request.path == "/chat" and body:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                return None
+            if isinstance(data, dict) and data.get("session_id"):
+                return str(data["session_id"])
+        return None
+    
+    def build_app(self) -> web.Application:
+        """创建转发前端"""
+        app = web.Application(middlewares=[self._track_request])
+        app.router.add_get("/health", self.handle_health)
+        app.router.add_get("/status", self.handle_aggregate)
+        app.router.add_get("/metrics", self.handle_aggregate)
+        app.router.add_get("/status/{session_id}", self.handle_proxy)
+        app.router.add_post("/chat", self.handle_proxy)
+        return app
+    
+    @web.middleware
+    async def _track_request(self, request: web.Request, handler):
+        if self.draining and request.path == "/chat":
+            response = web.json_response({"error": "服务正在关闭"}, status=503, headers={"Retry-After": "1"})
+            response.force_close()
+            return response
+        self.inflight += 1
+        self._idle.clear()
+        try:
+            return await handler(request)
+        finally:
+            self.inflight -= 1
+            if self.inflight == 0:
+                self._idle.set()
+    
+    async def handle_proxy(self, request: web.Request) -> web.StreamResponse:
+        """按会话ID转发到归属的工作进程，响应（包括SSE）逐段透传"""
+        body = await request.read()
+        session_id = self._session_id(request, body)
+        if session_id is None:
+            # 新会话在前端分配ID，保证后续请求能路由到同一进程
+            session_id = str(uuid.uuid4())
+        while self._pending_handoff is not None and self._pending_handoff[0](session_id):
+            await self._pending_handoff[1].wait()  # 会话正在迁移，等新哈希环发布后再转发
+        node = self.ring.get_node(session_id)
+        if node is None:
+            return web.json_response({"error": "没有可用的工作进程"}, status=503, headers={"Retry-After": "1"})
+        
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in _HOP_HEADERS}
+        headers["X-Session-ID"] = session_id
+        self.stats["proxied"] += 1
+        self._proxying[session_id] += 1
+        try:
+            async with self._client.request(request.method, self._url(node, request.path_qs),
+                                            data=body, headers=headers) as upstream:
+                response = web.StreamResponse(status=upstream.status, headers={
+                    k: v for k, v in upstream.headers.items() if k.lower() not in _HOP_HEADERS
+                })
+                if self.draining:
+                    response.force_close()
+                await response.prepare(request)
+                async for chunk in upstream.content.iter_any():
+                    await response.write(chunk)
+                await response.write_eof()
+                return response
+        except aiohttp.ClientError as e:
+            self.stats["upstream_errors"] += 1
+            logger.warning(f"转发到{node}失败: {str(e)}")
+            return web.json_response({"error": "工作进程不可用"}, status=503, headers={"Retry-After": "1"})
+        finally:
+            self._proxying[session_id] -= 1
+            if self._proxying[session_id] <= 0:
+                del self._proxying[session_id]
+    
+    async def handle_aggregate(self, request: web.Request) -> web.Response:
+        """GET /status、/metrics 汇总所有工作进程"""
+        async def fetch(node):
+            try:
+                async with self._client.get(self._url(node, request.path)) as response:
+                    return node, await response.json()
+            except (aiohttp.ClientError, ValueError) as e:
+                return node, {"error": str(e)}
+        results = await asyncio.gather(*(fetch(node) for node in list(self.ring.nodes)))
+        return web.json_response({
+            "router": {**self.stats, "inflight": self.inflight, "draining": self.draining,
+                       "workers": len(self.ring)},
+            "workers": dict(results)
+        }, dumps=lambda data: json.dumps(data, ensure_ascii=False, default=str))
+    
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """GET /health 排空中或没有存活的工作进程时返回503"""
+        alive = sum(1 for node in self.ring.nodes if self.processes.get(node) and self.processes[node].is_alive())
+        if self.draining or not alive:
+            return web.json_response({"status": "draining" if self.draining else "no_workers"}, status=503)
+        return web.json_response({"status": "ok", "workers": alive})
+    
+    # ---------- 生命周期 ----------
+    
+    async def run(self):
+        """启动工作进程和转发前端，直到收到SIGTERM/SIGINT；SIGTTIN/SIGTTOU增减工作进程"""
+        self._listen_socket = socket.create_server((self.host, self.port), reuse_port=hasattr(socket, "SO_REUSEPORT"))
+        self._client = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=5),
+            connector=aiohttp.TCPConnector(limit=0)
+        )
+        
+        # 预先fork所有工作进程，此时主进程还没有事件循环以外的线程和连接
+        for _ in range(self.workers):
+            self._spawn(self._next_node())
+        for node in list(self.processes):
+            if await self._wait_ready(node):
+                self.ring.add_node(node)
+            else:
+                logger.error(f"工作进程{node}启动失败")
+        
+        runner = web.AppRunner(self.build_app(), keepalive_timeout=self.keepalive_timeout,
+                               handle_signals=False, access_log=None)
+        await runner.setup()
+        await web.SockSite(runner, self._listen_socket).start()
+        logger.info(f"Mofy HTTP服务已启动: http://{self.host}:{self.port}，{len(self.ring)}个工作进程")
+        
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+        loop.add_signal_handler(signal.SIGINT, stop_event.set)
+        loop.add_signal_handler(signal.SIGTTIN, lambda: asyncio.ensure_future(self.add_worker()))
+        loop.add_signal_handler(signal.SIGTTOU, lambda: asyncio.ensure_future(self.remove_worker()))
+        supervisor = asyncio.create_task(self._supervise())
+        
+        try:
+            await stop_event.wait()
+        finally:
+            self.draining = True
+            supervisor.cancel()
+            logger.info(f"开始排空，进行中的请求{self.inflight}个")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"排空超时，仍有{self.inflight}个请求未完成")
+            # 工作进程各自排空并把会话换出到StateStore
+            await asyncio.gather(*(self._terminate(node) for node in list(self.processes)))
+            await self._client.close()
+            await runner.cleanup()
+            logger.info("Mofy HTTP服务已停止")
+
+def run_workers(host: str = None, port: int = None, workers: int = None):
+    """以阻塞方式运行多进程HTTP服务"""
+    if not hasattr(os, "fork"):
+        raise RuntimeError("多进程工作模式需要支持fork的平台")
+    try:
+        asyncio.run(WorkerPool(workers=workers, host=host, port=port).run())
+    except KeyboardInterrupt:
+        pass
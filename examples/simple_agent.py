@@ -62,7 +62,7 @@ def main():
                 continue
             
             # 处理用户消息
-            response = agent.process_message(user_input)
+            response = agent.process_message_sync(user_input)
             print(f"助手: {response}")
             print()
             
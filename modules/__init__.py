@@ -3,16 +3,20 @@ Mofy Agent Framework - 功能模块
 包含任务调度、记忆管理、工具系统等核心功能模块
 """
 
-from .scheduler import TaskScheduler
-from .memory import MemoryManager
-from .tools import ToolRegistry
-from .reflection import ReflectionEngine
-from .state import ConversationState
+import importlib
 
-__all__ = [
-    "TaskScheduler",
-    "MemoryManager", 
-    "ToolRegistry",
-    "ReflectionEngine",
-    "ConversationState"
-]
\ No newline at end of file
+# 导出名 -> 所在子模块，首次访问时才导入，导入单个子模块时不会连带加载LLM客户端等重量级依赖
+_EXPORTS = {
+    "TaskScheduler": ".scheduler",
+    "MemoryManager": ".memory",
+    "ToolRegistry": ".tools",
+    "ReflectionEngine": ".reflection",
+    "ConversationState": ".state",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,55 +4,108 @@ Mofy Agent Framework - 记忆管理模块
 """
 
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from collections import deque
+from itertools import islice
+from typing import List, Dict, Any, Optional, Deque
 import json
+import threading
 import redis
+import redis.asyncio as aioredis
 from loguru import logger
 from ..core.config import config
 from ..core.exceptions import MemoryError
+from ..core.tokenizer import ContextBuilder, ContextResult, context_budget
+from ..core.loop_local import LoopLocal
 
 class MemoryManager:
     """记忆管理器，支持多级存储"""
     
     def __init__(self):
-        self.short_term: List[Dict[str, Any]] = []  # 内存中的短期记忆
-        self.long_term: Dict[str, Any] = {}         # 长期记忆
+        # 会话ID -> 按时间顺序的短期记忆，每个会话最多保留short_term_memory_max_entries条
+        self.short_term: Dict[str, Deque[Dict[str, Any]]] = {}
+        # 会话ID -> {key: 长期记忆}，另按key索引所属会话
+        self.long_term: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._long_term_sessions: Dict[str, str] = {}
+        # 会话换出/恢复在线程池中进行，读写short_term和long_term时需持有此锁
+        self._lock = threading.RLock()
         self.redis_client = None
+        self.async_redis_client = None  # 异步处理路径使用，连接在首次使用时建立
         
         if config.redis_url:
             try:
                 self.redis_client = redis.Redis.from_url(config.redis_url)
                 self.redis_client.ping()
+                # 异步连接绑定事件循环，每个事件循环各建一个客户端
+                self.async_redis_client = LoopLocal(lambda: aioredis.Redis.from_url(config.redis_url))
             except Exception as e:
                 raise MemoryError(f"Redis连接失败: {str(e)}")
     
+    def _add_long_term(self, session_id: str, content: str, key: str) -> Dict[str, str]:
+        """结构化知识存入内存中的长期记忆，返回需要同步到Redis的数据"""
+        data = {
+            "content": content,
+            "session_id": session_id,
+            "updated_at": datetime.now().isoformat()
+        }
+        with self._lock:
+            # 同一key由其他会话写入时从原会话移除
+            owner = self._long_term_sessions.get(key)
+            if owner is not None and owner != session_id:
+                self.long_term[owner].pop(key, None)
+                if not self.long_term[owner]:
+                    del self.long_term[owner]
+            self.long_term.setdefault(session_id, {})[key] = data
+            self._long_term_sessions[key] = session_id
+        return dict(data)
+    
+    def _add_short_term(self, session_id: str, content: str) -> Dict[str, Any]:
+        """对话内容存入内存中的短期记忆，并清理该会话的过期记录"""
+        experience = {
+            "session_id": session_id,
+            "content": content,
+            "timestamp": datetime.now().timestamp()
+        }
+        with self._lock:
+            memories = self.short_term.get(session_id)
+            if memories is None:
+                memories = self.short_term[session_id] = deque(maxlen=config.short_term_memory_max_entries)
+            memories.append(experience)
+            self._trim_short_term(session_id, experience["timestamp"])
+        return experience
+    
+    def _trim_short_term(self, session_id: str, now: float) -> Optional[Deque[Dict[str, Any]]]:
+        """从队首移除会话已过期的短期记忆，会话没有剩余记录时删除，调用方需持有锁"""
+        memories = self.short_term.get(session_id)
+        if memories is None:
+            return None
+        while memories and now - memories[0]["timestamp"] >= config.short_term_memory_ttl:
+            memories.popleft()
+        if not memories:
+            del self.short_term[session_id]
+            return None
+        return memories
+    
+    def _local_recent(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """按时间倒序获取进程内最近的短期记忆"""
+        with self._lock:
+            memories = self._trim_short_term(session_id, datetime.now().timestamp())
+            if memories is None:
+                return []
+            return list(islice(reversed(memories), limit))
+    
     def add_experience(self, session_id: str, content: str, is_structured: bool = False, key: str = None):
         """添加经验到记忆系统"""
         try:
             if is_structured and key:
                 # 结构化知识存入长期记忆
-                self.long_term[key] = {
-                    "content": content,
-                    "session_id": session_id,
-                    "updated_at": datetime.now().isoformat()
-                }
+                data = self._add_long_term(session_id, content, key)
                 
                 # 如果启用Redis，也存入Redis
                 if self.redis_client:
-                    redis_key = f"long_term:{key}"
-                    self.redis_client.hset(redis_key, mapping={
-                        "content": content,
-                        "session_id": session_id,
-                        "updated_at": datetime.now().isoformat()
-                    })
+                    self.redis_client.hset(f"long_term:{key}", mapping=data)
             else:
                 # 对话内容存入短期记忆
-                experience = {
-                    "session_id": session_id,
-                    "content": content,
-                    "timestamp": datetime.now().timestamp()
-                }
-                self.short_term.append(experience)
+                experience = self._add_short_term(session_id, content)
                 
                 # 如果启用Redis，也存入Redis
                 if self.redis_client:
@@ -60,25 +113,56 @@ class MemoryManager:
                     self.redis_client.lpush(redis_key, json.dumps(experience))
                     self.redis_client.expire(redis_key, config.short_term_memory_ttl)
                 
-                # 清理过期短期记忆
-                self._clean_short_term()
+        except Exception as e:
+            raise MemoryError(f"添加记忆失败: {str(e)}")
+    
+    async def aadd_experience(self, session_id: str, content: str, is_structured: bool = False, key: str = None):
+        """add_experience的异步版本，Redis写入不阻塞事件循环"""
+        try:
+            if is_structured and key:
+                data = self._add_long_term(session_id, content, key)
+                if self.async_redis_client:
+                    await self.async_redis_client.hset(f"long_term:{key}", mapping=data)
+            else:
+                experience = self._add_short_term(session_id, content)
+                if self.async_redis_client:
+                    # lpush和expire合并为一次往返
+                    redis_key = f"short_term:{session_id}"
+                    async with self.async_redis_client.pipeline(transaction=False) as pipe:
+                        pipe.lpush(redis_key, json.dumps(experience))
+                        pipe.expire(redis_key, config.short_term_memory_ttl)
+                        await pipe.execute()
                 
         except Exception as e:
             raise MemoryError(f"添加记忆失败: {str(e)}")
     
+    def _recent_memories(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """按时间倒序获取最近的短期记忆"""
+        # 从内存获取
+        memories = self._local_recent(session_id, limit)
+        
+        # 如果内存中没有且启用Redis，从Redis获取
+        if not memories and self.redis_client:
+            redis_key = f"short_term:{session_id}"
+            cached_data = self.redis_client.lrange(redis_key, 0, limit - 1)
+            memories = [json.loads(data) for data in cached_data]
+        
+        return memories
+    
+    async def _arecent_memories(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """_recent_memories的异步版本"""
+        memories = self._local_recent(session_id, limit)
+        
+        if not memories and self.async_redis_client:
+            cached_data = await self.async_redis_client.lrange(f"short_term:{session_id}", 0, limit - 1)
+            memories = [json.loads(data) for data in cached_data]
+        
+        return memories
+    
     def get_short_term(self, session_id: str, limit: int = 10) -> str:
         """获取短期记忆"""
         try:
-            # 从内存获取
-            memories = [m for m in self.short_term if m["session_id"] == session_id]
-            memories = sorted(memories, key=lambda x: x["timestamp"], reverse=True)[:limit]
-            
-            # 如果内存中没有且启用Redis，从Redis获取
-            if not memories and self.redis_client:
-                redis_key = f"short_term:{session_id}"
-                cached_data = self.redis_client.lrange(redis_key, 0, limit - 1)
-                memories = [json.loads(data) for data in cached_data]
-            
+            memories = self._recent_memories(session_id, limit)
             return "\n".join([f"- {m['content']}" for m in memories])
             
         except Exception as e:
@@ -88,8 +172,10 @@ class MemoryManager:
         """获取长期记忆"""
         try:
             # 先从内存获取
-            if key in self.long_term:
-                return self.long_term[key]
+            with self._lock:
+                session_id = self._long_term_sessions.get(key)
+                if session_id is not None:
+                    return self.long_term[session_id][key]
             
             # 如果内存中没有且启用Redis，从Redis获取
             if self.redis_client:
@@ -107,49 +193,121 @@ class MemoryManager:
         except Exception as e:
             raise MemoryError(f"获取长期记忆失败: {str(e)}")
     
-    def get_relevant_memory(self, session_id: str, query: str) -> str:
-        """获取与查询相关的记忆片段"""
+    def _build_context(self, session_id: str, recent_dialog: List[Dict[str, Any]], query: str,
+                       max_tokens: Optional[int], slots: Optional[Dict[str, Dict]]) -> ContextResult:
+        """按token预算组装上下文，优先级：最近对话 > 相关长期记忆 > 槽位信息；
+        未指定预算时只扣除查询本身，上下文要套入提示词模板时应由调用方按渲染后的模板计算"""
+        if max_tokens is None:
+            max_tokens = context_budget(query)
+        builder = ContextBuilder(max_tokens)
+        
+        # L1: 短期记忆，越新的对话越优先
+        builder.add_section("最近对话", [m["content"] for m in recent_dialog])
+        
+        # L2: 本会话的长期记忆（简单关键词匹配），越新的记忆越优先
+        words = [word for word in query.lower().split() if len(word) > 2]
+        with self._lock:
+            long_term = list(self.long_term.get(session_id, {}).items())
+        relevant_long_term = [
+            (key, data) for key, data in long_term
+            if any(word in data["content"].lower() for word in words)
+        ]
+        relevant_long_term.sort(key=lambda item: item[1].get("updated_at", ""), reverse=True)
+        builder.add_section("相关记忆", [f"{key}: {data['content']}" for key, data in relevant_long_term])
+        
+        # L3: 槽位信息
+        if slots:
+            builder.add_section("已收集信息", [
+                f"{slot}: {data['value']} (可信度: {data['confidence']:.2f})"
+                for slot, data in slots.items()
+            ])
+        
+        result = builder.build()
+        if result.dropped_tokens:
+            logger.debug(f"上下文超出预算: 使用{result.used_tokens}/{max_tokens} tokens，丢弃{result.dropped_tokens} tokens")
+        return result
+    
+    def build_context(self, session_id: str, query: str, max_tokens: int = None,
+                      slots: Dict[str, Dict] = None, recent_limit: int = 20) -> ContextResult:
+        """按token预算构建上下文，优先级：最近对话 > 相关长期记忆 > 槽位信息"""
         try:
-            # L1: 短期记忆
-            recent_dialog = self.get_short_term(session_id, limit=5)
+            recent_dialog = self._recent_memories(session_id, recent_limit)
+            return self._build_context(session_id, recent_dialog, query, max_tokens, slots)
             
-            # L2: 长期记忆（简单关键词匹配）
-            relevant_long_term = []
-            for key, data in self.long_term.items():
-                if any(word in data["content"].lower() for word in query.lower().split() if len(word) > 2):
-                    relevant_long_term.append(f"- {key}: {data['content']}")
-            
-            # 拼接上下文，控制长度
-            context_parts = []
-            if recent_dialog:
-                context_parts.append(f"最近对话:\n{recent_dialog}")
-            
-            if relevant_long_term:
-                context_parts.append(f"相关记忆:\n" + "\n".join(relevant_long_term[:3]))
-            
-            context = "\n\n".join(context_parts)
+        except Exception as e:
+            raise MemoryError(f"构建上下文失败: {str(e)}")
+    
+    async def abuild_context(self, session_id: str, query: str, max_tokens: int = None,
+                             slots: Dict[str, Dict] = None, recent_limit: int = 20) -> ContextResult:
+        """build_context的异步版本"""
+        try:
+            recent_dialog = await self._arecent_memories(session_id, recent_limit)
+            return self._build_context(session_id, recent_dialog, query, max_tokens, slots)
             
-            # 确保上下文不超过2000字符
-            return context[:2000] if len(context) > 2000 else context
+        except Exception as e:
+            raise MemoryError(f"构建上下文失败: {str(e)}")
+    
+    def get_relevant_memory(self, session_id: str, query: str, max_tokens: int = None) -> str:
+        """获取与查询相关的记忆片段，长度受token预算控制"""
+        try:
+            return self.build_context(session_id, query, max_tokens=max_tokens).text
             
         except Exception as e:
             raise MemoryError(f"获取相关记忆失败: {str(e)}")
     
     def _clean_short_term(self):
-        """清理过期短期记忆"""
+        """清理所有会话的过期短期记忆"""
         now = datetime.now().timestamp()
-        self.short_term = [
-            item for item in self.short_term
-            if now - item["timestamp"] < config.short_term_memory_ttl
-        ]
+        with self._lock:
+            for session_id in list(self.short_term):
+                self._trim_short_term(session_id, now)
+    
+    def export_session(self, session_id: str) -> List[Dict[str, Any]]:
+        """导出会话在进程内的短期记忆，用于会话换出"""
+        with self._lock:
+            return list(self.short_term.get(session_id, ()))
+    
+    def import_session(self, memories: List[Dict[str, Any]]):
+        """恢复换出时导出的短期记忆，已过期的记录会被清理"""
+        imported: Dict[str, List[Dict[str, Any]]] = {}
+        for memory in memories:
+            imported.setdefault(memory["session_id"], []).append(memory)
+        now = datetime.now().timestamp()
+        with self._lock:
+            for session_id, items in imported.items():
+                items = sorted([*self.short_term.get(session_id, ()), *items], key=lambda m: m["timestamp"])
+                self.short_term[session_id] = deque(items, maxlen=config.short_term_memory_max_entries)
+                self._trim_short_term(session_id, now)
+    
+    def drop_local(self, session_id: str):
+        """只释放进程内的短期记忆，Redis中的数据保留"""
+        with self._lock:
+            self.short_term.pop(session_id, None)
     
     def clear_session(self, session_id: str):
         """清理指定会话的记忆"""
-        self.short_term = [m for m in self.short_term if m["session_id"] != session_id]
+        with self._lock:
+            self.short_term.pop(session_id, None)
         
         if self.redis_client:
             # 清理Redis中的相关数据
             self.redis_client.delete(f"short_term:{session_id}")
 
-# 全局记忆管理器实例
-memory_manager = MemoryManager()
\ No newline at end of file
+# 全局记忆管理器实例，首次使用时才创建并连接Redis
+_memory_manager: Optional[MemoryManager] = None
+_memory_manager_lock = threading.Lock()
+
+def get_memory_manager() -> MemoryManager:
+    """获取全局记忆管理器"""
+    global _memory_manager
+    if _memory_manager is None:
+        with _memory_manager_lock:
+            if _memory_manager is None:
+                _memory_manager = MemoryManager()
+    return _memory_manager
+
+def __getattr__(name: str):
+    # 兼容 from modules.memory import memory_manager
+    if name == "memory_manager":
+        return get_memory_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
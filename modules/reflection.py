@@ -3,6 +3,7 @@ import json
 import re
 from loguru import logger
 from ..core.llm import LLMClient
+from ..core.usage import usage_scope
 from ..core.exceptions import MofyException
 
 class ReflectionEngine:
@@ -29,7 +30,8 @@ class ReflectionEngine:
 
 请严格按照JSON格式输出，不要添加任何额外内容。"""
 
-            response = self.llm.invoke(prompt)
+            with usage_scope(call_site="reflection"):
+                response = self.llm.invoke(prompt)
             
             # 尝试解析JSON响应
             json_start = response.find("{")
@@ -4,7 +4,8 @@ Mofy Agent Framework - 任务调度器
 """
 
 from enum import Enum
-from typing import List, Dict, Any, Optional
+from collections import deque
+from typing import List, Dict, Any, Optional, Set, Deque
 import time
 from loguru import logger
 
@@ -14,37 +15,79 @@ class TaskStatus(Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+_UNFINISHED = (TaskStatus.PENDING, TaskStatus.EXECUTING)
+
 class TaskScheduler:
     """任务调度器：Agent的大脑中枢"""
     
-    def __init__(self, max_retries: int = 3):
+    def __init__(self, max_retries: int = 3, max_history: int = 100):
         self.task_queue: List[Dict[str, Any]] = []
         self.max_retries = max_retries
-        self.completed_tasks: List[Dict[str, Any]] = []
+        # 只保留最近结束的任务，长期运行的会话不会无限增长
+        self.completed_tasks: Deque[Dict[str, Any]] = deque(maxlen=max_history)
+        self.task_counter = 0  # 任务ID序号，换出恢复后继续递增避免ID冲突
         
-    def add_task(self, task_type: str, parameters: Dict[str, Any], priority: int = 5):
-        """添加任务到队列，支持优先级排序"""
+    def add_task(self, task_type: str, parameters: Dict[str, Any], priority: int = 5, tool: str = None,
+                 depends_on: List[str] = None) -> str:
+        """添加任务到队列，支持优先级排序，返回任务ID"""
         task = {
-            "task_id": f"task_{len(self.task_queue) + 1}",
+            "task_id": f"task_{self.task_counter + 1}",
             "type": task_type,
+            "tool": tool,
             "params": parameters,
+            "depends_on": list(depends_on or []),  # 需要先完成的任务ID
             "priority": priority,
             "status": TaskStatus.PENDING,
             "retries": 0,
             "created_at": time.time()
         }
+        self.task_counter += 1
         self.task_queue.append(task)
         # 按优先级排序（1最高，10最低）
         self.task_queue.sort(key=lambda x: x["priority"])
         logger.info(f"任务已添加: {task['task_id']} (优先级: {priority})")
+        return task["task_id"]
+    
+    def set_dependencies(self, task_id: str, depends_on: List[str]):
+        """设置任务依赖，用于依赖指向后添加的任务的情况"""
+        for task in self.task_queue:
+            if task["task_id"] == task_id:
+                task["depends_on"] = list(depends_on)
+                return True
+        return False
         
     def get_next_task(self) -> Optional[Dict[str, Any]]:
-        """获取下一个待执行任务"""
+        """获取下一个依赖已满足的待执行任务"""
+        ready = self.get_ready_tasks(limit=1)
+        return ready[0] if ready else None
+    
+    def get_ready_tasks(self, limit: int = None) -> List[Dict[str, Any]]:
+        """获取所有依赖已完成的待执行任务（按优先级）并标记为执行中；依赖失败的任务直接标记为失败"""
+        statuses = {task["task_id"]: task["status"] for task in self.task_queue}
+        
+        # 依赖失败会沿依赖链传递，直到没有新的失败任务
+        changed = True
+        while changed:
+            changed = False
+            for task in self.task_queue:
+                if task["status"] != TaskStatus.PENDING:
+                    continue
+                failed = [d for d in task["depends_on"] if statuses.get(d) == TaskStatus.FAILED]
+                if failed:
+                    self.complete_task(task["task_id"], f"依赖任务失败: {', '.join(failed)}", success=False)
+                    statuses[task["task_id"]] = TaskStatus.FAILED
+                    changed = True
+        
+        ready = []
         for task in self.task_queue:
-            if task["status"] == TaskStatus.PENDING:
+            if limit is not None and len(ready) >= limit:
+                break
+            if task["status"] == TaskStatus.PENDING and all(
+                statuses.get(d) == TaskStatus.COMPLETED for d in task["depends_on"]
+            ):
                 task["status"] = TaskStatus.EXECUTING
-                return task
-        return None
+                ready.append(task)
+        return ready
     
     def complete_task(self, task_id: str, result: Any, success: bool = True):
         """标记任务完成"""
@@ -58,6 +101,44 @@ class TaskScheduler:
                 return True
         return False
     
+    def _required_ids(self) -> Set[str]:
+        """未完成任务所依赖的任务ID"""
+        return {
+            dep for task in self.task_queue if task["status"] in _UNFINISHED
+            for dep in task["depends_on"]
+        }
+    
+    def prune_finished(self) -> int:
+        """从队列中移除已结束的任务（仍可在completed_tasks中查看），未完成任务依赖的除外；返回移除数量"""
+        required = self._required_ids()
+        before = len(self.task_queue)
+        self.task_queue = [
+            task for task in self.task_queue
+            if task["status"] in _UNFINISHED or task["task_id"] in required
+        ]
+        return before - len(self.task_queue)
+    
+    def export_pending(self) -> Dict[str, Any]:
+        """导出尚未完成的任务及其依赖的已结束任务（不含结果），用于会话换出"""
+        required = self._required_ids()
+        tasks = []
+        for task in self.task_queue:
+            if task["status"] in _UNFINISHED:
+                tasks.append({**task, "status": task["status"].value})
+            elif task["task_id"] in required:
+                tasks.append({**task, "status": task["status"].value, "result": None})
+        return {"task_counter": self.task_counter, "tasks": tasks}
+    
+    def import_pending(self, data: Dict[str, Any]):
+        """恢复export_pending导出的任务，换出时正在执行的任务重新排队"""
+        self.task_counter = max(self.task_counter, data.get("task_counter", 0))
+        for task in data.get("tasks", []):
+            status = TaskStatus(task["status"])
+            if status == TaskStatus.EXECUTING:
+                status = TaskStatus.PENDING
+            self.task_queue.append({**task, "status": status})
+        self.task_queue.sort(key=lambda x: x["priority"])
+    
     def retry_task(self, task_id: str) -> bool:
         """重试失败的任务"""
         for task in self.task_queue:
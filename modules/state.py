@@ -6,6 +6,7 @@ from datetime import datetime
 from loguru import logger
 from ..core.config import config
 from ..core.exceptions import StateError
+from ..core.tokenizer import get_tokenizer
 
 class ConversationState:
     """对话状态管理"""
@@ -54,8 +55,8 @@ class ConversationState:
         """获取最近的对话步骤"""
         return self.steps[-limit:] if limit > 0 else self.steps
     
-    def to_context(self) -> str:
-        """转换为上下文字符串，控制长度"""
+    def to_context(self, max_tokens: int = None) -> str:
+        """转换为上下文字符串，长度受token预算控制"""
         context_parts = []
         
         context_parts.append(f"会话ID: {self.session_id}")
@@ -70,9 +71,12 @@ class ConversationState:
         
         result = "\n".join(context_parts)
         
-        # 控制上下文长度不超过500字符
-        if len(result) > 500:
-            result = result[:500] + "...[上下文已截断]"
+        # 控制上下文不超过token预算
+        if max_tokens is None:
+            max_tokens = config.state_context_max_tokens
+        tokenizer = get_tokenizer()
+        if tokenizer.count(result) > max_tokens:
+            result = tokenizer.truncate(result, max_tokens) + "...[上下文已截断]"
         
         return result
     
@@ -88,24 +92,46 @@ class ConversationState:
     def is_expired(self, max_age: int = 86400) -> bool:
         """检查会话是否过期"""
         return self.get_age() > max_age
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为可JSON编码的字典"""
+        return {
+            "intent": self.intent,
+            "steps": self.steps,
+            "slots": self.slots,
+            "last_active": self.last_active,
+            "created_at": self.created_at
+        }
+    
+    @classmethod
+    def from_dict(cls, session_id: str, data: Dict[str, Any]) -> "ConversationState":
+        """从to_dict的结果恢复"""
+        state = cls(session_id)
+        state.intent = data.get("intent") or None
+        state.steps = data.get("steps") or []
+        state.slots = data.get("slots") or {}
+        state.last_active = float(data.get("last_active") or state.last_active)
+        state.created_at = float(data.get("created_at") or state.created_at)
+        return state
 
 class StateStore:
     """状态存储管理器"""
     
     def __init__(self, redis_url: str = None):
+        self.prefix = "agent_state:"
+        self.snapshot_prefix = "agent_session:"
+        self.memory_store = {}
         try:
             self.redis_client = redis.Redis.from_url(redis_url or config.redis_url) if redis_url or config.redis_url else None
-            self.prefix = "agent_state:"
         except Exception as e:
             logger.warning(f"Redis连接失败，使用内存存储: {e}")
             self.redis_client = None
-            self.memory_store = {}
     
     def save_state(self, state: ConversationState, ttl: int = 86400):
         """保存状态"""
         try:
             state_data = {
-                "intent": state.intent,
+                "intent": state.intent or "",
                 "steps": json.dumps(state.steps),
                 "slots": json.dumps(state.slots),
                 "last_active": state.last_active,
@@ -134,27 +160,25 @@ class StateStore:
                 if not data:
                     return ConversationState(session_id)
                 
-                return ConversationState(
-                    session_id=session_id,
-                    intent=data.get(b"intent", b"").decode(),
-                    steps=json.loads(data.get(b"steps", b"[]")),
-                    slots=json.loads(data.get(b"slots", b"{}")),
-                    last_active=float(data.get(b"last_active", b"0").decode()),
-                    created_at=float(data.get(b"created_at", b"0").decode())
-                )
+                return ConversationState.from_dict(session_id, {
+                    "intent": data.get(b"intent", b"").decode(),
+                    "steps": json.loads(data.get(b"steps", b"[]")),
+                    "slots": json.loads(data.get(b"slots", b"{}")),
+                    "last_active": data.get(b"last_active", b"0").decode(),
+                    "created_at": data.get(b"created_at", b"0").decode()
+                })
             else:
                 data = self.memory_store.get(session_id)
                 if not data:
                     return ConversationState(session_id)
                 
-                return ConversationState(
-                    session_id=session_id,
-                    intent=data.get("intent"),
-                    steps=json.loads(data.get("steps", "[]")),
-                    slots=json.loads(data.get("slots", "{}")),
-                    last_active=data.get("last_active", 0),
-                    created_at=data.get("created_at", 0)
-                )
+                return ConversationState.from_dict(session_id, {
+                    "intent": data.get("intent"),
+                    "steps": json.loads(data.get("steps", "[]")),
+                    "slots": json.loads(data.get("slots", "{}")),
+                    "last_active": data.get("last_active", 0),
+                    "created_at": data.get("created_at", 0)
+                })
                 
         except Exception as e:
             logger.error(f"加载状态失败: {e}")
@@ -177,6 +201,40 @@ class StateStore:
             logger.error(f"删除状态失败: {e}")
             return False
     
+    def save_snapshot(self, session_id: str, snapshot: Dict[str, Any], ttl: int = 86400):
+        """保存被换出会话的完整快照（状态、待执行任务、最近记忆）"""
+        try:
+            data = json.dumps(snapshot, ensure_ascii=False)
+            if self.redis_client:
+                self.redis_client.set(self.snapshot_prefix + session_id, data, ex=ttl)
+            else:
+                self.memory_store[self.snapshot_prefix + session_id] = {"snapshot": data, "created_at": time.time()}
+            
+        except Exception as e:
+            logger.error(f"保存会话快照失败: {e}")
+            raise StateError(f"保存会话快照失败: {e}")
+    
+    def load_snapshot(self, session_id: str, delete: bool = True) -> Optional[Dict[str, Any]]:
+        """加载会话快照，默认加载后删除，不存在时返回None"""
+        try:
+            key = self.snapshot_prefix + session_id
+            if self.redis_client:
+                if delete:
+                    pipe = self.redis_client.pipeline()
+                    pipe.get(key)
+                    pipe.delete(key)
+                    data = pipe.execute()[0]
+                else:
+                    data = self.redis_client.get(key)
+            else:
+                entry = self.memory_store.pop(key, None) if delete else self.memory_store.get(key)
+                data = entry["snapshot"] if entry else None
+            return json.loads(data) if data else None
+            
+        except Exception as e:
+            logger.error(f"加载会话快照失败: {e}")
+            return None
+    
     def cleanup_expired(self, max_age: int = 86400):
         """清理过期状态"""
         try:
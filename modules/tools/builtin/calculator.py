@@ -3,8 +3,34 @@ Mofy Agent Framework - 计算器工具
 提供基本的数学计算功能
 """
 
+import ast
+import operator
 from ..base import BaseTool
 
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv
+}
+_UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+def evaluate_expression(expression: str):
+    """只计算数字的加减乘除，不支持乘方（9**9**9**9这类表达式会长时间占满CPU），其他语法一律拒绝"""
+    def visit(node):
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return node.value
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            return _BINARY_OPERATORS[type(node.op)](visit(node.left), visit(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+            return _UNARY_OPERATORS[type(node.op)](visit(node.operand))
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            raise ValueError("不支持乘方运算")
+        raise ValueError("表达式只能包含数字和加减乘除")
+    
+    return visit(ast.parse(expression.strip(), mode="eval").body)
+
 class CalculatorTool(BaseTool):
     """计算器工具"""
     
@@ -27,13 +53,7 @@ class CalculatorTool(BaseTool):
     def execute(self, expression: str) -> str:
         """执行数学计算"""
         try:
-            # 安全的数学表达式计算
-            allowed_chars = set("0123456789+-*/().() ")
-            if not all(c in allowed_chars for c in expression):
-                return "错误：表达式包含非法字符"
-            
-            # 使用eval计算（在生产环境中应使用更安全的方法）
-            result = eval(expression)
+            result = evaluate_expression(expression)
             return f"计算结果: {result}"
             
         except Exception as e:
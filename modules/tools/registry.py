@@ -8,9 +8,34 @@ import re
 import json
 import time
 import asyncio
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from loguru import logger
 from contextlib import contextmanager
-from ..core.config import config
+from ...core.config import config
+
+_REFERENCE_PATTERN = re.compile(r"\$\{[^}]+\}")
+_JSON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict
+}
+
+# 同步执行路径共用的工具线程池，首次使用时创建
+_tool_executor: ThreadPoolExecutor = None
+_tool_executor_lock = threading.Lock()
+
+def _get_tool_executor() -> ThreadPoolExecutor:
+    global _tool_executor
+    if _tool_executor is None:
+        with _tool_executor_lock:
+            if _tool_executor is None:
+                _tool_executor = ThreadPoolExecutor(thread_name_prefix="mofy-tool")
+    return _tool_executor
 
 class ToolRegistry:
     """工具注册和执行系统"""
@@ -19,9 +44,14 @@ class ToolRegistry:
         self.tools: Dict[str, Callable] = {}
         self.schemas: Dict[str, Dict] = {}  # 工具参数schema
         self.metrics: Dict[str, Dict] = {}  # 工具调用指标
+        self._metrics_lock = threading.Lock()  # 注册表由所有会话共享，工具在多个线程中执行
+        # 每个事件循环各自的工具并发信号量（asyncio.Semaphore不能跨事件循环使用）
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._thread_semaphores: Dict[str, threading.BoundedSemaphore] = {}  # 同步执行路径使用
+        self._thread_semaphores_lock = threading.Lock()
         
     def register_tool(self, name: str, func: Callable, schema: Dict):
-        """注册工具并验证参数schema"""
+        """注册工具并验证参数schema，schema中可用max_concurrency限制该工具的并发数"""
         if "parameters" not in schema:
             raise ValueError(f"工具{name}缺少parameters定义")
         
@@ -30,6 +60,20 @@ class ToolRegistry:
         self.metrics[name] = {"calls": 0, "success": 0, "failures": 0, "total_time": 0}
         logger.info(f"✅ 工具注册成功: {name}")
     
+    def to_openai_tools(self) -> List[Dict[str, Any]]:
+        """转换为原生工具调用所需的tools参数"""
+        return [
+            {
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": schema.get("description", ""),
+                    "parameters": schema["parameters"]
+                }
+            }
+            for name, schema in self.schemas.items()
+        ]
+    
     def execute_tool(self, tool_name: str, params: str) -> str:
         """执行工具调用，支持智能参数解析"""
         if tool_name not in self.tools:
@@ -53,41 +97,128 @@ class ToolRegistry:
             logger.error(f"工具执行失败 {tool_name}: {str(e)}")
             return f"[{tool_name}执行失败] {str(e)}"
     
-    async def batch_execute_tools(self, tasks: List[Dict]) -> List[str]:
-        """并行执行多个工具任务"""
-        async_tasks = []
-        for task in tasks:
-            tool_name = task["tool"]
-            params = task["params"]
-            async_tasks.append(
-                asyncio.create_task(
-                    asyncio.to_thread(
-                        self._execute_with_timeout,
-                        tool_name=tool_name,
-                        params=self._parse_parameters(tool_name, params),
-                        timeout=config.tool_timeout
-                    )
+    def _semaphore(self, tool_name: str) -> asyncio.Semaphore:
+        """当前事件循环中该工具的并发信号量"""
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if tool_name not in semaphores:
+            limit = self.schemas[tool_name].get("max_concurrency") or config.tool_max_concurrency
+            semaphores[tool_name] = asyncio.Semaphore(limit)
+        return semaphores[tool_name]
+    
+    async def aexecute_tool(self, tool_name: str, params: Any) -> Any:
+        """在线程池中执行单个工具并返回原始结果，失败时抛出异常；超时由asyncio控制（信号超时只能用于主线程）"""
+        if tool_name not in self.tools:
+            raise ValueError(f"工具不存在: {tool_name}")
+        
+        try:
+            parsed_params = self._parse_parameters(tool_name, params)
+            # 排队等待并发名额的时间不计入超时和耗时
+            async with self._semaphore(tool_name):
+                start_time = time.time()
+                result = await asyncio.wait_for(
+                    asyncio.to_thread(self.tools[tool_name], **parsed_params),
+                    timeout=config.tool_timeout
                 )
-            )
+        except asyncio.TimeoutError:
+            self._record_metrics(tool_name, 0, success=False)
+            raise TimeoutError(f"工具{tool_name}执行超时（{config.tool_timeout}秒）")
+        except Exception:
+            self._record_metrics(tool_name, 0, success=False)
+            raise
         
+        self._record_metrics(tool_name, (time.time() - start_time) * 1000, success=True)
+        return result
+    
+    def _thread_semaphore(self, tool_name: str) -> threading.BoundedSemaphore:
+        """同步执行路径中该工具的并发信号量"""
+        with self._thread_semaphores_lock:
+            if tool_name not in self._thread_semaphores:
+                limit = self.schemas[tool_name].get("max_concurrency") or config.tool_max_concurrency
+                self._thread_semaphores[tool_name] = threading.BoundedSemaphore(limit)
+            return self._thread_semaphores[tool_name]
+    
+    def run_tool(self, tool_name: str, params: Any) -> Any:
+        """aexecute_tool的同步版本，不依赖事件循环：在工具线程池中执行并返回原始结果，失败时抛出异常"""
+        if tool_name not in self.tools:
+            raise ValueError(f"工具不存在: {tool_name}")
+        
+        try:
+            parsed_params = self._parse_parameters(tool_name, params)
+            with self._thread_semaphore(tool_name):
+                start_time = time.time()
+                future = _get_tool_executor().submit(self.tools[tool_name], **parsed_params)
+                result = future.result(timeout=config.tool_timeout)
+        except FutureTimeoutError:
+            self._record_metrics(tool_name, 0, success=False)
+            raise TimeoutError(f"工具{tool_name}执行超时（{config.tool_timeout}秒）")
+        except Exception:
+            self._record_metrics(tool_name, 0, success=False)
+            raise
+        
+        self._record_metrics(tool_name, (time.time() - start_time) * 1000, success=True)
+        return result
+    
+    async def batch_execute_tools(self, tasks: List[Dict]) -> List[str]:
+        """并行执行多个工具任务，单个任务失败不影响其他任务"""
         # 并行执行并收集结果
-        results = await asyncio.gather(*async_tasks, return_exceptions=True)
+        results = await asyncio.gather(
+            *(self.aexecute_tool(task["tool"], task["params"]) for task in tasks),
+            return_exceptions=True
+        )
         
         # 处理结果
         final_results = []
         for i, result in enumerate(results):
             if isinstance(result, Exception):
+                logger.error(f"工具执行失败 {tasks[i]['tool']}: {str(result)}")
                 final_results.append(f"任务{i+1}失败: {str(result)}")
             else:
                 final_results.append(f"任务{i+1}结果: {result}")
         
         return final_results
     
-    def _parse_parameters(self, tool_name: str, params: str) -> Dict[str, Any]:
+    def validate_parameters(self, tool_name: str, parameters: Dict[str, Any]) -> bool:
+        """按工具schema验证结构化参数，不符合时抛出ValueError；支持required、type、enum和pattern，
+        引用其他任务输出的取值（${任务编号}）要到执行前才能确定，只检查是否存在"""
+        if tool_name not in self.schemas:
+            raise ValueError(f"工具不存在: {tool_name}")
+        schema = self.schemas[tool_name]["parameters"]
+        properties = schema.get("properties", {})
+        
+        for param in schema.get("required", []):
+            if param not in parameters:
+                raise ValueError(f"缺少必填参数: {param}")
+        
+        for param, value in parameters.items():
+            if param not in properties:
+                if schema.get("additionalProperties") is False:
+                    raise ValueError(f"未知参数: {param}")
+                continue
+            if isinstance(value, str) and _REFERENCE_PATTERN.search(value):
+                continue
+            spec = properties[param]
+            expected_type = spec.get("type")
+            if expected_type in _JSON_TYPES and (
+                not isinstance(value, _JSON_TYPES[expected_type])
+                or (expected_type in ("integer", "number") and isinstance(value, bool))
+            ):
+                raise ValueError(f"参数 {param} 应为{expected_type}类型")
+            if "enum" in spec and value not in spec["enum"]:
+                raise ValueError(f"参数 {param} 取值不在允许范围内")
+            if "pattern" in spec and isinstance(value, str) and not re.search(spec["pattern"], value):
+                raise ValueError(f"参数 {param} 格式不正确")
+        
+        return True
+    
+    def _parse_parameters(self, tool_name: str, params: Any) -> Dict[str, Any]:
         """智能参数解析，支持多种格式"""
         schema = self.schemas[tool_name]
         required_params = schema["parameters"].get("required", [])
         
+        # 已结构化的参数（如任务计划中的parameters对象）直接使用
+        if isinstance(params, dict):
+            return params
+        
         # 尝试JSON解析（优先）
         try:
             return json.loads(params)
@@ -138,12 +269,13 @@ class ToolRegistry:
         if tool_name not in self.metrics:
             return
         
-        self.metrics[tool_name]["calls"] += 1
-        if success:
-            self.metrics[tool_name]["success"] += 1
-        else:
-            self.metrics[tool_name]["failures"] += 1
-        self.metrics[tool_name]["total_time"] += exec_time
+        with self._metrics_lock:
+            self.metrics[tool_name]["calls"] += 1
+            if success:
+                self.metrics[tool_name]["success"] += 1
+            else:
+                self.metrics[tool_name]["failures"] += 1
+            self.metrics[tool_name]["total_time"] += exec_time
     
     def get_metrics(self, tool_name: str = None) -> Dict:
         """获取工具调用指标"""
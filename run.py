@@ -180,6 +180,10 @@ def main():
                        default="simple", help="运行示例类型")
     parser.add_argument("--test", action="store_true", help="运行测试")
     parser.add_argument("--docker-setup", action="store_true", help="设置Docker开发环境")
+    parser.add_argument("--serve", action="store_true", help="启动HTTP服务")
+    parser.add_argument("--host", default=None, help="HTTP服务监听地址，默认读取SERVER_HOST")
+    parser.add_argument("--port", type=int, default=None, help="HTTP服务端口，默认读取SERVER_PORT")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，默认读取SERVER_WORKERS")
     
     args = parser.parse_args()
     
@@ -187,6 +191,11 @@ def main():
         setup_docker()
         return
     
+    if args.serve:
+        from core.server import serve
+        serve(args.host, args.port, args.workers)
+        return
+    
     if args.test:
         print("运行测试...")
         os.system(f"python -m pytest tests/ -v")
@@ -0,0 +1,97 @@
+import sys
+import os
+import time
+import asyncio
+import unittest
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.admission import AdmissionController, estimate_turn_latency
+from core.exceptions import AdmissionError
+from test_agent import make_offline_runtime
+
+class TestAdmissionController(unittest.IsolatedAsyncioTestCase):
+    """准入控制测试"""
+    
+    async def test_priority_queue(self):
+        """测试名额满时按优先级放行，同优先级先到先得"""
+        controller = AdmissionController(max_inflight=1, max_queue_time=5)
+        await controller.acquire("a")
+        order = []
+        
+        async def request(name, priority):
+            async with controller.admit(name, priority):
+                order.append(name)
+        tasks = [asyncio.create_task(request(name, priority))
+                 for name, priority in [("low", 9), ("normal-1", 5), ("high", 1), ("normal-2", 5)]]
+        await asyncio.sleep(0.01)
+        self.assertEqual(controller.get_stats()["queue_depth"], 4)
+        
+        controller.release("a")
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["high", "normal-1", "normal-2", "low"])
+        self.assertEqual(controller.inflight, 0)
+    
+    async def test_tenant_limit_and_queue_timeout(self):
+        """测试租户超出上限返回429，排队超时返回503，均带Retry-After"""
+        controller = AdmissionController(max_inflight=1, max_inflight_per_tenant=1, max_queue_time=0.05)
+        await controller.acquire("a")
+        
+        with self.assertRaises(AdmissionError) as ctx:
+            await controller.acquire("a")
+        self.assertEqual((ctx.exception.status_code, ctx.exception.retry_after), (429, 1))
+        
+        with self.assertRaises(AdmissionError) as ctx:
+            await controller.acquire("b")
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(controller.get_stats()["queue_timeouts"], 1)
+        
+        controller.release("a")
+        self.assertEqual((controller.inflight, controller.get_stats()["tenants"]), (0, 0))
+    
+    async def test_latency_driven_shedding(self):
+        """测试按实时延迟估算的排队时间超过上限时立即拒绝，队列满时挤掉低优先级请求"""
+        latency = {"seconds": 1.0}
+        controller = AdmissionController(max_inflight=2, max_queue=1, max_queue_time=3,
+                                         latency_probe=lambda: latency["seconds"])
+        await controller.acquire()
+        await controller.acquire()
+        
+        low = asyncio.create_task(controller.acquire("low", 9))
+        await asyncio.sleep(0.01)
+        high = asyncio.create_task(controller.acquire("high", 1))
+        await asyncio.sleep(0.01)
+        with self.assertRaises(AdmissionError):
+            await low
+        self.assertEqual(controller.get_stats()["shed"], 1)
+        
+        # LLM变慢后预计排队 2 × 4s / 2 = 4s，超过3s上限，不再排队直接拒绝
+        latency["seconds"] = 4.0
+        with self.assertRaises(AdmissionError) as ctx:
+            await controller.acquire("late", 5)
+        self.assertEqual((ctx.exception.status_code, ctx.exception.retry_after), (503, 4))
+        
+        controller.release()
+        await high
+        self.assertEqual(controller.get_stats()["queue_depth"], 0)
+
+class TestTurnLatency(unittest.TestCase):
+    """处理时间估算测试"""
+    
+    def test_uses_real_tool_metrics(self):
+        """测试按工具注册表记录的真实耗时（毫秒）换算为秒"""
+        runtime = make_offline_runtime()
+        runtime.tool_registry.register_tool("sleep", lambda: time.sleep(0.05) or "ok", {"parameters": {"type": "object"}})
+        asyncio.run(runtime.tool_registry.aexecute_tool("sleep", {}))
+        
+        latency = estimate_turn_latency(runtime)
+        self.assertGreaterEqual(latency, 0.05)
+        self.assertLess(latency, 1.0)
+        
+        controller = AdmissionController(max_inflight=1, max_queue_time=1,
+                                         latency_probe=lambda: estimate_turn_latency(runtime))
+        self.assertLess(controller._expected_wait(5), 1.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,21 @@
 import sys
 import os
+import asyncio
+import time
+import threading
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.agent import MofyAgent
+from core.config import config
+from core.llm import LLMClient
+from core.runtime import AgentRuntime
+from core.tokenizer import estimate_tokens, get_context_window
+from modules.memory import MemoryManager
+from modules.tools.registry import ToolRegistry
 import unittest
+from unittest.mock import AsyncMock, patch
 
 class TestMofyAgent(unittest.TestCase):
     """Mofy Agent测试类"""
@@ -24,13 +34,13 @@ class TestMofyAgent(unittest.TestCase):
     
     def test_simple_message(self):
         """测试简单消息处理"""
-        response = self.agent.process_message("你好")
+        response = asyncio.run(self.agent.process_message("你好"))
         self.assertIsInstance(response, str)
         self.assertTrue(len(response) > 0)
     
     def test_calculation(self):
         """测试计算功能"""
-        response = self.agent.process_message("帮我计算 2+3")
+        response = asyncio.run(self.agent.process_message("帮我计算 2+3"))
         self.assertIsInstance(response, str)
     
     def test_agent_status(self):
@@ -41,5 +51,212 @@ class TestMofyAgent(unittest.TestCase):
         self.assertIn("completed_tasks", status)
         self.assertIn("tool_metrics", status)
 
+def make_offline_runtime(responses=()) -> AgentRuntime:
+    """构造不连接Redis和真实Provider的运行时，LLM依次返回responses"""
+    llm_client = LLMClient.__new__(LLMClient)
+    llm_client.ainvoke = AsyncMock(side_effect=responses)
+    memory = MemoryManager.__new__(MemoryManager)
+    memory.short_term = {}
+    memory.long_term = {}
+    memory._long_term_sessions = {}
+    memory._lock = threading.RLock()
+    memory.redis_client = None
+    memory.async_redis_client = None
+    return AgentRuntime(llm_client=llm_client, memory=memory, tool_registry=ToolRegistry())
+
+def make_offline_agent(responses):
+    """在离线运行时上创建会话"""
+    return make_offline_runtime(responses).create_session("test-session")
+
+class TestAsyncPipeline(unittest.TestCase):
+    """异步处理流程测试"""
+    
+    def test_tools_executed_in_batch(self):
+        """测试任务计划中的工具并行执行，结果汇总后生成回复"""
+        plan = """{"intent": "计算并搜索", "tasks": [
+            {"type": "计算", "tool": "calculator", "parameters": {"expression": "2+3"}, "priority": 1},
+            {"type": "搜索", "tool": "search", "parameters": {"query": "Python"}, "priority": 2},
+            {"type": "未知", "tool": "missing", "parameters": {}, "priority": 3}
+        ]}"""
+        agent = make_offline_agent([plan, "结果是5"])
+        
+        response = asyncio.run(agent.process_message("计算2+3并搜索Python"))
+        
+        self.assertEqual(response, "结果是5")
+        final_prompt = agent.llm_client.ainvoke.await_args_list[1].args[0]
+        self.assertIn("任务: 计算, 结果: 计算结果: 5", final_prompt)
+        self.assertIn("搜索'Python'的结果", final_prompt)
+        self.assertIn("任务: 未知, 失败: 工具不存在: missing", final_prompt)
+        self.assertEqual(agent.tool_registry.get_metrics("calculator")["success"], 1)
+        self.assertEqual(len(agent.memory.export_session(agent.session_id)), 2)
+    
+    def test_independent_tasks_run_concurrently(self):
+        """测试独立任务并发执行，依赖任务等待并接收前置任务的输出"""
+        plan = """{"intent": "查询天气", "tasks": [
+            {"id": "t1", "type": "天气", "tool": "weather", "parameters": {"city": "北京"}},
+            {"id": "t2", "type": "天气", "tool": "weather", "parameters": {"city": "上海"}},
+            {"id": "t3", "type": "天气", "tool": "weather", "parameters": {"city": "广州"}},
+            {"id": "t4", "type": "汇总", "tool": "search", "parameters": {"query": "${t1}|${t3}"}, "depends_on": ["t1", "t3"]}
+        ]}"""
+        agent = make_offline_agent([plan, "汇总完成"])
+        
+        def weather(city: str) -> str:
+            time.sleep(0.3)
+            return f"{city}晴"
+        agent.tool_registry.register_tool("weather", weather, {
+            "parameters": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]}
+        })
+        
+        start = time.monotonic()
+        asyncio.run(agent.process_message("北京、上海、广州的天气"))
+        self.assertLess(time.monotonic() - start, 0.8)
+        
+        final_prompt = agent.llm_client.ainvoke.await_args_list[1].args[0]
+        self.assertIn("搜索'北京晴|广州晴'的结果", final_prompt)
+    
+    def test_per_tool_concurrency_limit(self):
+        """测试工具声明的max_concurrency限制同时执行的调用数"""
+        plan = """{"intent": "查询天气", "tasks": [
+            {"id": "t1", "type": "天气", "tool": "weather", "parameters": {"city": "北京"}},
+            {"id": "t2", "type": "天气", "tool": "weather", "parameters": {"city": "上海"}}
+        ]}"""
+        agent = make_offline_agent([plan, "完成"])
+        agent.tool_registry.register_tool("weather", lambda city: time.sleep(0.2) or city, {
+            "max_concurrency": 1,
+            "parameters": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]}
+        })
+        
+        start = time.monotonic()
+        asyncio.run(agent.process_message("北京、上海的天气"))
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+    
+    def test_failed_dependency_skips_dependents(self):
+        """测试前置任务失败时依赖它的任务不再执行"""
+        plan = """{"intent": "计算", "tasks": [
+            {"id": "a", "type": "计算", "tool": "missing", "parameters": {}},
+            {"id": "b", "type": "搜索", "tool": "search", "parameters": {"query": "${a}"}, "depends_on": ["a"]}
+        ]}"""
+        agent = make_offline_agent([plan, "完成"])
+        
+        asyncio.run(agent.process_message("计算"))
+        
+        final_prompt = agent.llm_client.ainvoke.await_args_list[1].args[0]
+        self.assertIn("任务: 搜索, 失败: 依赖任务失败", final_prompt)
+        self.assertEqual(agent.tool_registry.get_metrics("search")["calls"], 0)
+    
+    def test_sync_plan_inside_running_loop(self):
+        """测试同步执行任务计划不创建事件循环，在事件循环内调用也能并发执行工具"""
+        agent = make_offline_agent([])
+        agent.llm_client.invoke = lambda prompt, **kwargs: "完成"
+        agent.tool_registry.register_tool("weather", lambda city: time.sleep(0.3) or f"{city}晴", {
+            "parameters": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]}
+        })
+        plan = {"intent": "查询天气", "tasks": [
+            {"id": "t1", "type": "天气", "tool": "weather", "parameters": {"city": "北京"}},
+            {"id": "t2", "type": "天气", "tool": "weather", "parameters": {"city": "上海"}}
+        ]}
+        
+        async def run_in_loop():
+            return agent._execute_task_plan(plan)
+        
+        start = time.monotonic()
+        self.assertEqual(asyncio.run(run_in_loop()), "完成")
+        self.assertLess(time.monotonic() - start, 0.55)
+        self.assertEqual(agent.tool_registry.get_metrics("weather")["success"], 2)
+    
+    def test_intent_prompt_fits_context_window(self):
+        """测试上下文预算扣除了提示词模板，渲染后的意图分析提示词加上预留输出不超过模型窗口"""
+        agent = make_offline_agent(['{"intent": "闲聊", "tasks": []}'])
+        for i in range(30):
+            agent.memory.add_experience(agent.session_id, f"用户: 第{i}条历史消息，" + "很长的内容" * 20)
+        
+        with patch.object(config, "context_window", 800), patch.object(config, "context_reserve_tokens", 100), \
+                patch.object(config, "memory_context_max_tokens", 0):
+            asyncio.run(agent.process_message("你好"))
+            prompt = agent.llm_client.ainvoke.await_args_list[0].args[0]
+            self.assertLessEqual(estimate_tokens(prompt) + config.context_reserve_tokens, get_context_window())
+        self.assertGreater(agent.last_context["dropped_tokens"], 0)
+        self.assertGreater(agent.last_context["used_tokens"], 0)
+    
+    def test_intent_router_skips_planning_call(self):
+        """测试本地意图路由命中时不调用LLM做意图分析"""
+        with patch.object(config, "intent_router", True):
+            agent = make_offline_agent(["结果是14"])
+            response = asyncio.run(agent.process_message("帮我计算 2+3*4"))
+        
+        self.assertEqual(response, "结果是14")
+        self.assertEqual(agent.llm_client.ainvoke.await_count, 1)
+        self.assertIn("计算结果: 14", agent.llm_client.ainvoke.await_args.args[0])
+    
+    def test_calculator_rejects_power(self):
+        """测试计算器拒绝乘方：路由规则不匹配、参数校验不通过，工具本身也不会计算9**9**9**9"""
+        with patch.object(config, "intent_router", True):
+            agent = make_offline_agent(['{"intent": "计算", "tasks": []}'])
+            asyncio.run(agent.process_message("帮我计算 9**9**9**9"))
+        self.assertEqual(agent.llm_client.ainvoke.await_count, 1)
+        
+        registry = agent.tool_registry
+        with self.assertRaises(ValueError):
+            registry.validate_parameters("calculator", {"expression": "9 * * 9"})
+        self.assertIn("不支持乘方", registry.run_tool("calculator", {"expression": "9**9**9**9"}))
+        self.assertIn("计算错误", registry.run_tool("calculator", {"expression": "__import__('os')"}))
+        self.assertEqual(registry.run_tool("calculator", {"expression": "(1+2)*-3/2"}), "计算结果: -4.5")
+    
+    def test_plan_cache_reuses_llm_plan(self):
+        """测试结构相同的消息复用缓存的计划模板"""
+        plan = """{"intent": "搜索", "tasks": [{"type": "搜索", "tool": "search", "parameters": {"query": "Python"}}]}"""
+        with patch.object(config, "plan_cache", True):
+            agent = make_offline_agent([plan, "第一次", "第二次"])
+            asyncio.run(agent.process_message("帮我在网上找找Python的资料"))
+            response = asyncio.run(agent.process_message("帮我在网上找找Rust的资料"))
+        
+        self.assertEqual(response, "第二次")
+        self.assertEqual(agent.llm_client.ainvoke.await_count, 3)
+        self.assertIn("搜索'Rust'的结果", agent.llm_client.ainvoke.await_args.args[0])
+    
+    def test_plan_cache_rejects_code_in_expression(self):
+        """测试算式模板不会把任意代码作为计算器参数，按未命中交给LLM规划"""
+        plan = """{"intent": "计算", "tasks": [{"type": "计算", "tool": "calculator", "parameters": {"expression": "1+2"}}]}"""
+        with patch.object(config, "plan_cache", True):
+            agent = make_offline_agent([plan, "结果是3", """{"intent": "闲聊", "tasks": []}"""])
+            asyncio.run(agent.process_message("帮我算算1+2"))
+            response = asyncio.run(agent.process_message("帮我算算__import__('os').getpid()"))
+        
+        self.assertEqual(response, "我理解了您的需求，但没有找到合适的工具来处理。")
+        self.assertEqual(agent.llm_client.ainvoke.await_count, 3)
+        self.assertEqual(agent.tool_registry.get_metrics("calculator")["calls"], 1)
+    
+    def test_fused_mode_skips_final_reply(self):
+        """测试融合模式下工具输出套入回复模板，失败时仍由LLM总结"""
+        plan = """{"intent": "计算", "tasks": [{"id": "t1", "tool": "calculator", "parameters": {"expression": "6*7"}}],
+                   "reply_template": "${t1}，还有其他问题吗？"}"""
+        failing = """{"intent": "计算", "tasks": [{"id": "t1", "tool": "missing", "parameters": {}}],
+                      "reply_template": "${t1}"}"""
+        with patch.object(config, "fused_plan_answer", True):
+            agent = make_offline_agent([plan, """{"tasks": [], "answer": "你好！"}""", failing, "抱歉，计算失败"])
+            self.assertEqual(asyncio.run(agent.process_message("6乘7等于多少")), "计算结果: 42，还有其他问题吗？")
+            self.assertEqual(asyncio.run(agent.process_message("你好")), "你好！")
+            self.assertEqual(agent.llm_client.ainvoke.await_count, 2)
+            self.assertEqual(asyncio.run(agent.process_message("算一下")), "抱歉，计算失败")
+
+class TestAgentRuntime(unittest.TestCase):
+    """共享运行时测试"""
+    
+    def test_sessions_share_components(self):
+        """测试会话共享重量级组件，只持有各自的调度器，创建开销很小"""
+        runtime = make_offline_runtime()
+        
+        start = time.perf_counter()
+        sessions = [runtime.create_session() for _ in range(5000)]
+        self.assertLess(time.perf_counter() - start, 1.0)
+        
+        first, second = sessions[0], sessions[1]
+        self.assertIs(first.llm_client, second.llm_client)
+        self.assertIs(first.memory, second.memory)
+        self.assertIs(first.tool_registry, second.tool_registry)
+        self.assertIsNot(first.scheduler, second.scheduler)
+        self.assertNotEqual(first.session_id, second.session_id)
+        self.assertEqual(runtime.get_stats(), {"sessions_created": 5000, "tools": 2})
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,74 @@
+import sys
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 框架内部使用..core/..modules相对导入，必须作为mofy包的子模块导入
+PACKAGE = "mofy"
+
+# 冷启动导入时间预算（毫秒），可通过环境变量按机器性能调整
+IMPORT_BUDGET_MS = float(os.getenv("MOFY_IMPORT_BUDGET_MS", "1500"))
+
+def measure_import(module: str, log_file: str = None):
+    """在全新解释器中用 -X importtime 测量mofy.<module>的累计导入耗时（微秒）"""
+    module = f"{PACKAGE}.{module}"
+    package_root = tempfile.mkdtemp()
+    # 仓库目录即mofy包，通过符号链接挂到临时目录下，与安装后的包结构一致
+    os.symlink(PROJECT_ROOT, os.path.join(package_root, PACKAGE))
+    env = dict(os.environ)
+    # 指向不可用的Redis且不配置密钥：import阶段不允许建立连接或校验密钥
+    env.update({
+        "REDIS_URL": "redis://127.0.0.1:1/0",
+        "OPENAI_API_KEY": "",
+        "SILICONFLOW_API_KEY": "",
+        "LOG_FILE": log_file or os.path.join(tempfile.gettempdir(), "mofy_import_time.log"),
+        "PYTHONPATH": package_root
+    })
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=package_root, env=env, capture_output=True, text=True, timeout=60
+        )
+    finally:
+        shutil.rmtree(package_root)
+    
+    cumulative_us = None
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and line.rsplit("|", 1)[-1].strip() == module:
+            cumulative_us = int(line.split("|")[1])
+    return proc, cumulative_us
+
+class TestImportTime(unittest.TestCase):
+    """导入耗时与导入副作用测试"""
+    
+    def assert_cold_import(self, module: str, log_file: str = None):
+        proc, cumulative_us = measure_import(module, log_file)
+        self.assertEqual(proc.returncode, 0, f"导入{module}失败:\n{proc.stderr[-2000:]}")
+        self.assertIsNotNone(cumulative_us, f"未找到{module}的importtime记录")
+        self.assertLess(cumulative_us / 1000, IMPORT_BUDGET_MS,
+                        f"{module}导入耗时{cumulative_us / 1000:.0f}ms，超出预算{IMPORT_BUDGET_MS:.0f}ms")
+    
+    def test_llm_import(self):
+        """测试导入LLM模块不创建客户端"""
+        self.assert_cold_import("core.llm")
+    
+    def test_memory_import(self):
+        """测试导入记忆模块不连接Redis"""
+        self.assert_cold_import("modules.memory")
+    
+    def test_cache_import(self):
+        """测试导入缓存模块不连接Redis"""
+        self.assert_cold_import("utils.cache")
+    
+    def test_logger_import(self):
+        """测试导入日志模块不初始化日志文件"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_file = os.path.join(tmp_dir, "mofy.log")
+            self.assert_cold_import("utils.logger", log_file)
+            self.assertFalse(os.path.exists(log_file))
+
+if __name__ == "__main__":
+    unittest.main()
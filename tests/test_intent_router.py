@@ -0,0 +1,71 @@
+import sys
+import os
+import unittest
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.intent_router import IntentRouter, NGramIntentClassifier
+
+def weather_plan(city: str) -> dict:
+    """LLM生成的天气查询计划"""
+    return {"intent": "查询天气", "tasks": [{"type": "天气", "tool": "weather", "parameters": {"city": city}}]}
+
+class TestIntentRouter(unittest.TestCase):
+    """本地意图路由测试"""
+    
+    def test_rule_extracts_parameters(self):
+        """测试规则命中时由命名分组生成任务参数"""
+        router = IntentRouter(threshold=0.6, classifier=NGramIntentClassifier())
+        router.add_rule("calculator", r"^计算\s*(?P<expression>[\d\s+\-*/().]+)$", "calculator")
+        
+        plan = router.route("计算 2+3*4", tools=["calculator"])
+        self.assertEqual(plan["tasks"][0]["parameters"], {"expression": "2+3*4"})
+        self.assertEqual(plan["source"], "rule")
+        self.assertIsNone(router.route("计算 2+3*4", tools=["search"]))
+    
+    def test_classifier_learns_from_plans(self):
+        """测试分类器从LLM计划学习后直接为同类消息生成计划"""
+        router = IntentRouter(threshold=0.6, classifier=NGramIntentClassifier(min_examples=3))
+        for city in ["北京", "上海", "广州"]:
+            router.observe(f"查询{city}天气", weather_plan(city))
+        router.observe("搜索Python教程", {"tasks": [{"tool": "search", "parameters": {"query": "Python教程"}}]})
+        
+        plan = router.route("查询深圳天气？")
+        self.assertEqual(plan["tasks"][0]["tool"], "weather")
+        self.assertEqual(plan["tasks"][0]["parameters"], {"city": "深圳"})
+        self.assertEqual(plan["source"], "classifier")
+        
+        # 与已学类别不相似的消息交给LLM
+        self.assertIsNone(router.route("给我讲个笑话"))
+        stats = router.get_stats()
+        self.assertEqual(stats["classifier_hits"], 1)
+        self.assertEqual(stats["fallbacks"], 1)
+        self.assertEqual(stats["fast_path_rate"], 0.5)
+
+    def test_classifier_rejects_values_of_another_class(self):
+        """测试分类器只接受与训练样本同类的取值，共同前缀不足以命中"""
+        router = IntentRouter(threshold=0.6, classifier=NGramIntentClassifier(min_examples=3))
+        for expression in ["1+2", "3*4", "5-1", "(2+3)/4"]:
+            router.observe(f"帮我计算{expression}", {"tasks": [{"tool": "calculator", "parameters": {"expression": expression}}]})
+        
+        plan = router.route("帮我计算7*8")
+        self.assertEqual(plan["tasks"][0]["parameters"], {"expression": "7*8"})
+        self.assertIsNone(router.route("帮我计算__import__('os').getpid()"))
+        self.assertIsNone(router.route("帮我计算一下明天北京去上海的火车票多少钱"))
+    
+    def test_schema_violation_falls_back(self):
+        """测试规则或分类器生成的参数不符合工具schema时交给LLM"""
+        def validate(tool, parameters):
+            if "<" in parameters["query"]:
+                raise ValueError("参数 query 格式不正确")
+        
+        router = IntentRouter(threshold=0.6, classifier=NGramIntentClassifier())
+        router.add_rule("search", r"^搜索(?P<query>.+)$", "search")
+        
+        self.assertIsNotNone(router.route("搜索Python", validate=validate))
+        self.assertIsNone(router.route("搜索<script>", validate=validate))
+        self.assertEqual(router.get_stats()["fallbacks"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
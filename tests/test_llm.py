@@ -0,0 +1,548 @@
+import sys
+import os
+import asyncio
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, AsyncMock, patch
+import httpx
+from openai import RateLimitError, BadRequestError
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import config
+from core.llm import LLMClient, get_async_redis_pool, _get_http_client
+from core.llm_cache import LRUCache, LLMResponseCache, compress_value, decompress_value
+from core.semantic_cache import SemanticCache, normalize_prompt
+from core.rate_limit import ProviderRateLimiter, TokenBucket, estimate_tokens
+from core.retry import RetryPolicy, Hedger, retry_after_seconds
+from core.usage import UsageTracker, usage_scope
+from core.reasoning import ReasoningFilter, split_reasoning
+from core.mock_provider import MockBackend, LatencyModel
+from modules.tools.registry import ToolRegistry
+
+def make_response(content: str):
+    """构造与OpenAI返回结构一致的响应对象"""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+def make_status_error(error_cls, status: int, headers: dict = None):
+    """构造带响应头的Provider错误"""
+    request = httpx.Request("POST", "http://provider.test/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return error_cls("provider error", response=response, body=None)
+
+def make_chunk(content: str):
+    """构造流式响应中的单个chunk"""
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+class FakeStream:
+    """模拟openai.Stream，支持迭代和上下文管理"""
+    
+    def __init__(self, chunks):
+        self.chunks = chunks
+    
+    def __iter__(self):
+        return iter(self.chunks)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        pass
+
+def make_client() -> LLMClient:
+    """构造不连接真实Provider和Redis的LLMClient"""
+    client = LLMClient.__new__(LLMClient)
+    client.client = MagicMock()
+    client.async_client = MagicMock()
+    client.async_client.chat.completions.create = AsyncMock(return_value=make_response("异步回复"))
+    client.redis_client = MagicMock()
+    client.redis_client.get.return_value = None
+    client.async_redis_client = MagicMock()
+    client.async_redis_client.get = AsyncMock(return_value=None)
+    client.async_redis_client.setex = AsyncMock()
+    client.cache = LLMResponseCache(client.redis_client, client.async_redis_client, LRUCache(1024 * 1024))
+    client.semantic_cache = None
+    client.rate_limiter = ProviderRateLimiter()
+    return client
+
+class TestLLMClient(unittest.TestCase):
+    """LLM客户端测试"""
+    
+    def test_ainvoke_calls_provider_and_caches(self):
+        """测试异步调用未命中缓存时请求Provider并写入缓存"""
+        client = make_client()
+        result = asyncio.run(client.ainvoke("你好"))
+        
+        self.assertEqual(result, "异步回复")
+        client.async_client.chat.completions.create.assert_awaited_once()
+        client.async_redis_client.setex.assert_awaited_once()
+    
+    def test_ainvoke_cache_hit(self):
+        """测试异步调用命中缓存时不请求Provider"""
+        client = make_client()
+        client.async_redis_client.get = AsyncMock(return_value="缓存回复".encode())
+        result = asyncio.run(client.ainvoke("你好"))
+        
+        self.assertEqual(result, "缓存回复")
+        client.async_client.chat.completions.create.assert_not_called()
+    
+    def test_sync_and_async_share_cache_key(self):
+        """测试同步与异步调用使用相同的缓存键"""
+        sync_client = make_client()
+        sync_client.client.chat.completions.create.return_value = make_response("同步回复")
+        sync_client.invoke("相同的提示词")
+        async_client = make_client()
+        asyncio.run(async_client.ainvoke("相同的提示词"))
+        
+        sync_key = sync_client.redis_client.setex.call_args[0][0]
+        async_key = async_client.async_redis_client.setex.call_args[0][0]
+        self.assertEqual(sync_key, async_key)
+    
+    def test_stream_yields_tokens_and_writes_cache(self):
+        """测试流式调用逐个产出token并在结束后写入缓存"""
+        client = make_client()
+        client.client.chat.completions.create.return_value = FakeStream(
+            [make_chunk("你"), make_chunk("好"), make_chunk(None)]
+        )
+        tokens = list(client.stream("打个招呼"))
+        
+        self.assertEqual(tokens, ["你", "好"])
+        client.redis_client.setex.assert_called_once()
+        self.assertEqual(decompress_value(client.redis_client.setex.call_args[0][2]), "你好")
+    
+    def test_stream_first_token_before_completion(self):
+        """测试非推理模型的流式输出不缓存开头，首个token在流结束前就输出"""
+        client = make_client()
+        received = []
+        
+        def chunks():
+            for text in ("北京", "今天", "晴"):
+                received.append(text)
+                yield make_chunk(text)
+        client.client.chat.completions.create.return_value = FakeStream(chunks())
+        
+        with patch.object(config, "model_name", "gpt-4o"):
+            iterator = client.stream("非推理模型")
+            self.assertEqual(next(iterator), "北京")
+            self.assertEqual(received, ["北京"])
+            iterator.close()
+    
+    def test_stream_replays_cache(self):
+        """测试流式调用命中缓存时回放缓存内容"""
+        client = make_client()
+        client.redis_client.get.return_value = "缓存回复".encode()
+        
+        self.assertEqual("".join(client.stream("打个招呼")), "缓存回复")
+        client.client.chat.completions.create.assert_not_called()
+    
+    def test_stream_abandoned_is_not_cached(self):
+        """测试调用方提前退出时不缓存不完整内容"""
+        client = make_client()
+        client.client.chat.completions.create.return_value = FakeStream(
+            [make_chunk("你"), make_chunk("好")]
+        )
+        iterator = client.stream("打个招呼")
+        next(iterator)
+        iterator.close()
+        
+        client.redis_client.setex.assert_not_called()
+    
+    def test_concurrent_invoke_is_coalesced(self):
+        """测试相同提示词的并发调用只请求一次Provider"""
+        client = make_client()
+        
+        def slow_create(**kwargs):
+            time.sleep(0.2)
+            return make_response("合并回复")
+        
+        client.client.chat.completions.create.side_effect = slow_create
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.invoke("相同的提示词"))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(results, ["合并回复"] * 5)
+        self.assertEqual(client.client.chat.completions.create.call_count, 1)
+    
+    def test_concurrent_ainvoke_is_coalesced(self):
+        """测试相同提示词的并发异步调用只请求一次Provider"""
+        client = make_client()
+        
+        async def slow_create(**kwargs):
+            await asyncio.sleep(0.1)
+            return make_response("合并回复")
+        
+        client.async_client.chat.completions.create = AsyncMock(side_effect=slow_create)
+        
+        async def run():
+            return await asyncio.gather(*[client.ainvoke("相同的提示词") for _ in range(5)])
+        
+        self.assertEqual(asyncio.run(run()), ["合并回复"] * 5)
+        self.assertEqual(client.async_client.chat.completions.create.await_count, 1)
+    
+    def test_cancelled_leader_keeps_coalesced_call(self):
+        """测试发起请求的调用方被取消后，合并等待的其他调用方仍拿到结果"""
+        client = make_client()
+        
+        async def slow_create(**kwargs):
+            await asyncio.sleep(0.1)
+            return make_response("合并回复")
+        
+        client.async_client.chat.completions.create = AsyncMock(side_effect=slow_create)
+        
+        async def run():
+            leader = asyncio.ensure_future(client.ainvoke("相同的提示词"))
+            await asyncio.sleep(0.02)
+            follower = asyncio.ensure_future(client.ainvoke("相同的提示词"))
+            await asyncio.sleep(0.02)
+            leader.cancel()
+            return await follower
+        
+        self.assertEqual(asyncio.run(run()), "合并回复")
+        self.assertEqual(client.async_client.chat.completions.create.await_count, 1)
+    
+    def test_l1_cache_skips_redis(self):
+        """测试进程内缓存命中时不访问Redis"""
+        client = make_client()
+        client.client.chat.completions.create.return_value = make_response("回复")
+        client.invoke("重复的提示词")
+        client.redis_client.get.reset_mock()
+        
+        self.assertEqual(client.invoke("重复的提示词"), "回复")
+        client.redis_client.get.assert_not_called()
+        self.assertEqual(client.get_cache_stats()["l1_hits"], 1)
+    
+    def test_invoke_many_keeps_order_and_dedupes(self):
+        """测试批量调用按顺序返回，且缓存命中和重复提示词不重复请求"""
+        client = make_client()
+        client.cache.set(client._cache_key("b"), "缓存b", 60)
+        client.client.chat.completions.create.side_effect = (
+            lambda **kwargs: make_response("回复" + kwargs["messages"][0]["content"])
+        )
+        results = client.invoke_many(["a", "b", "a", "c"], max_concurrency=2)
+        
+        self.assertEqual(results, ["回复a", "缓存b", "回复a", "回复c"])
+        self.assertEqual(client.client.chat.completions.create.call_count, 2)
+    
+    def test_ainvoke_many_return_exceptions(self):
+        """测试异步批量调用可返回单条失败而不影响其他结果"""
+        client = make_client()
+        
+        async def create(**kwargs):
+            if kwargs["messages"][0]["content"] == "坏":
+                raise RuntimeError("429")
+            return make_response("好")
+        
+        client.async_client.chat.completions.create = AsyncMock(side_effect=create)
+        results = asyncio.run(client.ainvoke_many(["好1", "坏"], return_exceptions=True))
+        
+        self.assertEqual(results[0], "好")
+        self.assertIsInstance(results[1], Exception)
+    
+    def test_invoke_tools_returns_structured_calls(self):
+        """测试原生工具调用直接返回结构化的工具调用并缓存"""
+        registry = ToolRegistry()
+        registry.register_tool("calculator", lambda expression: expression, {
+            "description": "执行数学计算",
+            "parameters": {"type": "object", "properties": {"expression": {"type": "string"}},
+                           "required": ["expression"]}
+        })
+        backend = MockBackend(latency=LatencyModel("fixed", 0))
+        client = make_client()
+        client.client = backend.client
+        
+        tools = registry.to_openai_tools()
+        result = client.invoke_tools("用户消息: 3 * 7", tools)
+        self.assertEqual(result["tool_calls"][0]["name"], "calculator")
+        self.assertEqual(result["tool_calls"][0]["arguments"], {"expression": "3 * 7"})
+        self.assertEqual(client.invoke_tools("用户消息: 3 * 7", tools), result)
+        self.assertEqual(backend.calls, 1)
+
+    def test_async_connections_per_event_loop(self):
+        """测试异步Redis连接池和HTTP客户端在同一事件循环内共享，连续asyncio.run时各自新建"""
+        async def connections():
+            pool, http_client = get_async_redis_pool("redis://localhost:6379/15"), _get_http_client(True)
+            self.assertIs(get_async_redis_pool("redis://localhost:6379/15"), pool)
+            self.assertIs(_get_http_client(True), http_client)
+            return pool, http_client
+        
+        first_pool, first_client = asyncio.run(connections())
+        second_pool, second_client = asyncio.run(connections())
+        self.assertIsNot(first_pool, second_pool)
+        self.assertIsNot(first_client, second_client)
+        self.assertIs(_get_http_client(False), _get_http_client(False))
+
+class TestRateLimit(unittest.TestCase):
+    """速率限制测试"""
+    
+    def test_token_bucket_waits_when_empty(self):
+        """测试令牌耗尽后按速率等待"""
+        bucket = TokenBucket(rate_per_minute=600)  # 每秒10个
+        bucket.acquire(600)
+        start = time.monotonic()
+        bucket.acquire(2)
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+    
+    def test_unlimited_bucket(self):
+        """测试额度为0时不限制"""
+        bucket = TokenBucket(rate_per_minute=0)
+        start = time.monotonic()
+        for _ in range(1000):
+            bucket.acquire(100)
+        self.assertLess(time.monotonic() - start, 0.1)
+    
+    def test_each_attempt_takes_quota(self):
+        """测试重试的每次尝试都占用请求额度"""
+        client = make_client()
+        client.rate_limiter = MagicMock(wraps=ProviderRateLimiter())
+        client.client.chat.completions.create.side_effect = [
+            make_status_error(RateLimitError, 429, {"retry-after-ms": "10"}), make_response("成功")
+        ]
+        
+        self.assertEqual(client.invoke("重试的提示词"), "成功")
+        self.assertEqual(client.rate_limiter.acquire.call_count, 2)
+    
+    def test_estimate_tokens(self):
+        """测试token估算对中英文分别计数"""
+        self.assertEqual(estimate_tokens("你好"), 2)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+
+class TestRetry(unittest.TestCase):
+    """重试与对冲请求测试"""
+    
+    def test_retry_honours_retry_after(self):
+        """测试429按Retry-After等待后重试成功"""
+        policy = RetryPolicy(max_attempts=3)
+        error = make_status_error(RateLimitError, 429, {"retry-after-ms": "50"})
+        fn = MagicMock(side_effect=[error, "成功"])
+        
+        self.assertEqual(retry_after_seconds(error), 0.05)
+        self.assertEqual(policy.call(fn), "成功")
+        self.assertEqual(policy.retries, 1)
+    
+    def test_no_retry_on_bad_request(self):
+        """测试参数错误不重试"""
+        policy = RetryPolicy(max_attempts=3)
+        fn = MagicMock(side_effect=make_status_error(BadRequestError, 400))
+        
+        with self.assertRaises(BadRequestError):
+            policy.call(fn)
+        self.assertEqual(fn.call_count, 1)
+    
+    def test_hedge_returns_faster_attempt(self):
+        """测试首个请求过慢时对冲请求先返回"""
+        hedger = Hedger(max_workers=4)
+        delays = iter([0.5, 0.0])
+        
+        def call():
+            time.sleep(next(delays))
+            return threading.current_thread().name
+        
+        start = time.monotonic()
+        hedger.call(call, delay=0.05)
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual((hedger.hedged, hedger.hedge_wins), (1, 1))
+    
+    def test_async_hedge_cancels_loser(self):
+        """测试异步对冲取消落后的请求"""
+        hedger = Hedger()
+        delays = iter([1.0, 0.0])
+        cancelled = []
+        
+        async def call():
+            try:
+                await asyncio.sleep(next(delays))
+                return "完成"
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        
+        async def run():
+            result = await hedger.acall(call, delay=0.05)
+            await asyncio.sleep(0)
+            return result
+        
+        self.assertEqual(asyncio.run(run()), "完成")
+        self.assertEqual(cancelled, [True])
+
+class TestLLMResponseCache(unittest.TestCase):
+    """LLM响应缓存测试"""
+    
+    def test_lru_evicts_by_bytes(self):
+        """测试LRU按字节数淘汰最久未使用的条目"""
+        cache = LRUCache(max_bytes=100)
+        cache.set("a", "x" * 40, ttl=60)
+        cache.set("b", "x" * 40, ttl=60)
+        cache.get("a")
+        cache.set("c", "x" * 40, ttl=60)
+        
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertLessEqual(cache.size_bytes, 100)
+    
+    def test_lru_expires(self):
+        """测试LRU条目过期"""
+        cache = LRUCache(max_bytes=100)
+        cache.set("a", "x", ttl=0)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.size_bytes, 0)
+    
+    def test_compression_roundtrip(self):
+        """测试大响应压缩存储且可还原"""
+        value = "思考过程" * 1000
+        data = compress_value(value, min_bytes=1024)
+        
+        self.assertLess(len(data), len(value.encode()))
+        self.assertEqual(decompress_value(data), value)
+        self.assertEqual(decompress_value("小响应".encode()), "小响应")
+
+class TestSemanticCache(unittest.TestCase):
+    """语义缓存测试"""
+    
+    def test_normalize_masks_timestamps(self):
+        """测试归一化屏蔽时间戳、空白和标点"""
+        self.assertEqual(
+            normalize_prompt("现在是 2026-10-16 12:00:01，北京天气？"),
+            normalize_prompt("现在是2026-10-17 08:30:00 北京天气")
+        )
+    
+    def test_near_duplicate_hit(self):
+        """测试近似重复提示词命中，不同问题不命中"""
+        cache = SemanticCache(threshold=0.9)
+        cache.add("请问北京今天的天气怎么样？", "key_beijing", namespace="m")
+        
+        self.assertEqual(cache.lookup("请问 北京今天的天气怎么样", namespace="m"), "key_beijing")
+        self.assertIsNone(cache.lookup("请问上海今天的天气怎么样？", namespace="m"))
+        self.assertIsNone(cache.lookup("请问北京今天的天气怎么样？", namespace="other"))
+    
+    def test_probe_skips_unindexed_features(self):
+        """测试查询独有的n-gram不占用探测名额，带少量新增内容的近似重复仍能命中"""
+        cache = SemanticCache(threshold=0.9, probe_features=8)
+        text = "请根据用户的历史订单和浏览记录推荐三款适合夏季户外运动的轻便透气跑鞋并说明理由" * 3
+        cache.add(text, "key", namespace="m")
+        
+        self.assertEqual(cache.lookup(text + "谢谢啦朋友", namespace="m"), "key")
+    
+    def test_invoke_uses_semantic_cache(self):
+        """测试LLM调用只按调用方指定的可变部分做语义匹配，模板不同或未指定时不复用"""
+        client = make_client()
+        client.semantic_cache = SemanticCache(threshold=0.9)
+        client.client.chat.completions.create.return_value = make_response("晴")
+        template = "基于以下上下文分析用户意图并返回JSON格式的任务计划。\n用户消息: {}"
+        client.invoke(template.format("北京今天天气怎么样？"), semantic_key="北京今天天气怎么样？")
+        
+        self.assertEqual(client.invoke(template.format("北京今天天气怎么样"), semantic_key="北京今天天气怎么样"), "晴")
+        self.assertEqual(client.client.chat.completions.create.call_count, 1)
+        
+        client.client.chat.completions.create.return_value = make_response("多云")
+        self.assertEqual(client.invoke(template.format("查询上海天气"), semantic_key="查询上海天气"), "多云")
+        self.assertEqual(client.invoke("另一个模板。用户消息: 北京今天天气怎么样", semantic_key="北京今天天气怎么样"), "多云")
+        self.assertEqual(client.invoke(template.format("北京今天天气怎么样!")), "多云")
+        self.assertEqual(client.client.chat.completions.create.call_count, 4)
+
+class TestUsage(unittest.TestCase):
+    """Token用量与成本统计测试"""
+    
+    def test_record_by_dimension(self):
+        """测试按模型、会话和调用位置汇总用量与成本"""
+        tracker = UsageTracker()
+        response = SimpleNamespace(
+            model="gpt-4o",
+            choices=[SimpleNamespace(message=SimpleNamespace(content="好"))],
+            usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=100,
+                                  prompt_tokens_details=SimpleNamespace(cached_tokens=400))
+        )
+        with usage_scope(session_id="s1"):
+            with usage_scope(call_site="analyze_intent"):
+                tracker.record_response("gpt-4o", "提示词", response)
+            tracker.record_cache_hit("gpt-4o", "提示词", "好")
+        
+        snapshot = tracker.snapshot(recent=1)
+        self.assertEqual(snapshot["total"]["calls"], 1)
+        self.assertEqual(snapshot["total"]["cached_tokens"], 400)
+        self.assertAlmostEqual(snapshot["by_model"]["gpt-4o"]["cost"], (600 * 2.5 + 400 * 1.25 + 100 * 10) / 1e6)
+        self.assertEqual(snapshot["by_call_site"]["analyze_intent"]["prompt_tokens"], 1000)
+        self.assertEqual(snapshot["by_call_site"]["other"]["cache_hits"], 1)
+        self.assertEqual(snapshot["recent"][0]["session_id"], "s1")
+        
+        session = tracker.session_snapshot("s1")
+        self.assertEqual((session["calls"], session["cache_hits"]), (1, 1))
+        self.assertEqual(tracker.session_snapshot("s2")["calls"], 0)
+    
+    def test_session_limit(self):
+        """测试只保留最近活跃的会话"""
+        tracker = UsageTracker(max_sessions=2)
+        for session_id in ["a", "b", "c"]:
+            with usage_scope(session_id=session_id):
+                tracker.record("gpt-4o", 10, 10)
+        self.assertEqual(list(tracker.by_session), ["b", "c"])
+        self.assertEqual(tracker.snapshot()["total"]["calls"], 3)
+
+class TestReasoning(unittest.TestCase):
+    """推理模型思考内容处理测试"""
+    
+    def test_stream_filter_across_chunks(self):
+        """测试标签被切分到多个chunk时仍能正确过滤"""
+        reasoning_filter = ReasoningFilter()
+        pieces = ["<th", "ink>先想{一想", "}</thi", "nk>\n\n答案", "是<b>42</b>"]
+        answer = "".join(reasoning_filter.feed(p) for p in pieces) + reasoning_filter.flush()
+        self.assertEqual(answer, "答案是<b>42</b>")
+        self.assertEqual(reasoning_filter.reasoning, "先想{一想}")
+    
+    def test_stream_filter_holds_until_close_tag(self):
+        """测试省略开头<think>的流：缓存开头直到</think>，思考内容不输出"""
+        reasoning_filter = ReasoningFilter(hold_limit=100)
+        pieces = ["用户想要", "天气{x}", "</think>", "\n\n北京晴"]
+        answer = "".join(reasoning_filter.feed(p) for p in pieces) + reasoning_filter.flush()
+        self.assertEqual(answer, "北京晴")
+        self.assertEqual(reasoning_filter.reasoning, "用户想要天气{x}")
+        
+        # 没有思考块的回答超过上限后照常流式输出，短回答在结束时输出
+        reasoning_filter = ReasoningFilter(hold_limit=4)
+        self.assertEqual(reasoning_filter.feed("普通"), "")
+        self.assertEqual(reasoning_filter.feed("的回答"), "普通的回答")
+        reasoning_filter = ReasoningFilter(hold_limit=100)
+        self.assertEqual(reasoning_filter.feed("短回答") + reasoning_filter.flush(), "短回答")
+    
+    def test_split_without_open_tag(self):
+        """测试省略开头<think>的输出"""
+        self.assertEqual(split_reasoning("思考中</think>\n回答"), ("思考中", "回答"))
+        self.assertEqual(split_reasoning("普通回答\n"), ("", "普通回答\n"))
+    
+    def test_invoke_caches_answer_only(self):
+        """测试只返回和缓存回答，思考token单独统计"""
+        client = make_client()
+        client.client.chat.completions.create.return_value = make_response("<think>推理{x}</think>\n\n{\"tasks\": []}")
+        
+        result = client.invoke("推理提示词")
+        self.assertEqual(result, '{"tasks": []}')
+        self.assertEqual(client.cache.get(client._cache_key("推理提示词")), result)
+        self.assertEqual(client.parse_response("<think>{坏的}</think>" + result), {"tasks": []})
+    
+    def test_stream_skips_reasoning(self):
+        """测试流式输出跳过思考内容"""
+        client = make_client()
+        client.client.chat.completions.create.return_value = FakeStream(
+            [make_chunk("<think>想"), make_chunk("一想</think>"), make_chunk("好的")]
+        )
+        self.assertEqual(list(client.stream("流式推理")), ["好的"])
+        self.assertEqual(client.cache.get(client._cache_key("流式推理")), "好的")
+
+    def test_stream_caches_answer_without_open_tag(self):
+        """测试思考块超过缓存上限已被输出时，写入缓存的仍只有回答"""
+        client = make_client()
+        client.client.chat.completions.create.return_value = FakeStream(
+            [make_chunk("用户想要"), make_chunk("天气{x}"), make_chunk("</think>"), make_chunk("\n\n北京晴")]
+        )
+        with patch.object(config, "model_name", "deepseek-ai/DeepSeek-R1-Distill-Qwen-32B"), \
+                patch.object(config, "llm_reasoning_hold_chars", 2):
+            "".join(client.stream("省略开头标签"))
+            self.assertEqual(client.cache.get(client._cache_key("省略开头标签")), "北京晴")
+
+if __name__ == "__main__":
+    unittest.main()
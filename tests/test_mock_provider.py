@@ -0,0 +1,175 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.mock_provider import MockBackend, MockScript, LatencyModel
+from core import cassette
+from core.cassette import CassetteRecorder, CassettePlayer, iter_cassette
+from core.config import config
+from core.llm import LLMClient
+from test_llm import make_client
+from core.exceptions import LLMError
+from core.retry import is_retryable_error
+
+def make_request(prompt: str, **kwargs):
+    return {"model": "mock", "messages": [{"role": "user", "content": prompt}], **kwargs}
+
+class TestMockProvider(unittest.TestCase):
+    """模拟Provider测试"""
+    
+    def test_task_plan_response(self):
+        """测试意图分析提示词返回合法任务计划"""
+        backend = MockBackend(latency=LatencyModel("fixed", 0))
+        prompt = "请分析用户意图并返回JSON格式的任务计划:\n用户消息: 帮我算一下 12 * 3"
+        response = backend.client.chat.completions.create(**make_request(prompt))
+        plan = json.loads(response.choices[0].message.content)
+        self.assertEqual(plan["tasks"][0]["tool"], "calculator")
+        self.assertEqual(plan["tasks"][0]["parameters"]["expression"], "12 * 3")
+        self.assertGreater(response.usage.total_tokens, 0)
+    
+    def test_script_response(self):
+        """测试脚本规则优先于内置模板"""
+        script = MockScript([{"pattern": "天气(?P<city>\\w+)", "response": "$city今天晴"}])
+        backend = MockBackend(script=script, latency=LatencyModel("fixed", 0))
+        response = backend.client.chat.completions.create(**make_request("查询天气北京"))
+        self.assertEqual(response.choices[0].message.content, "北京今天晴")
+    
+    def test_latency_and_errors(self):
+        """测试固定延迟和错误注入"""
+        backend = MockBackend(latency=LatencyModel("fixed", 50), error_rate=1.0, seed=1)
+        start = time.perf_counter()
+        with self.assertRaises(Exception) as ctx:
+            backend.client.chat.completions.create(**make_request("你好"))
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+        self.assertTrue(is_retryable_error(ctx.exception))
+        self.assertEqual(backend.get_stats(), {"calls": 1, "errors": 1})
+    
+    def test_reproducible_latency(self):
+        """测试相同seed下延迟序列可复现"""
+        samples = []
+        for _ in range(2):
+            backend = MockBackend(latency=LatencyModel("lognormal", 100), seed=7)
+            samples.append([backend.latency.sample() for _ in range(5)])
+        self.assertEqual(samples[0], samples[1])
+    
+    def test_async_stream(self):
+        """测试异步流式响应"""
+        backend = MockBackend(latency=LatencyModel("fixed", 0), stream_chunk_delay=0)
+        
+        async def collect():
+            stream = await backend.async_client.chat.completions.create(**make_request("你好", stream=True))
+            parts = [chunk.choices[0].delta.content async for chunk in stream]
+            await stream.close()
+            return "".join(parts)
+        
+        self.assertTrue(asyncio.run(collect()).startswith("已为您处理完成"))
+
+class TestCassette(unittest.TestCase):
+    """LLM流量录制与回放测试"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "llm.jsonl.gz")
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def record(self, prompts, stream: bool = False):
+        recorder = CassetteRecorder(self.path)
+        backend = MockBackend(latency=LatencyModel("fixed", 50), stream_chunk_delay=0)
+        client = recorder.wrap(backend.client)
+        for prompt in prompts:
+            response = client.chat.completions.create(**make_request(prompt, stream=stream))
+            if stream:
+                with response:
+                    list(response)
+        recorder.close()
+        return recorder
+    
+    def test_record_and_replay(self):
+        """测试录制后按提示词回放，相同提示词按录制顺序返回"""
+        self.assertEqual(self.record(["你好", "任务执行历史:\n任务: search, 结果: 晴"]).recorded, 2)
+        
+        player = CassettePlayer(self.path, latency_scale=0)
+        response = player.client.chat.completions.create(**make_request("任务执行历史:\n任务: search, 结果: 晴"))
+        self.assertEqual(response.choices[0].message.content, "已为您处理完成。任务: search, 结果: 晴")
+        with self.assertRaises(LLMError):
+            player.client.chat.completions.create(**make_request("没录过"))
+        self.assertEqual(player.get_stats(), {"hits": 1, "misses": 1, "prompts": 2})
+    
+    def test_replay_scaled_latency(self):
+        """测试按缩放后的原始延迟回放流式响应"""
+        self.record(["你好"], stream=True)
+        
+        player = CassettePlayer(self.path, latency_scale=2.0)
+        
+        async def collect():
+            start = time.perf_counter()
+            stream = await player.async_client.chat.completions.create(**make_request("你好", stream=True))
+            text = "".join([chunk.choices[0].delta.content async for chunk in stream])
+            return text, time.perf_counter() - start
+        
+        text, elapsed = asyncio.run(collect())
+        self.assertTrue(text.startswith("已为您处理完成"))
+        self.assertGreaterEqual(elapsed, 0.1)
+    
+    def test_async_record_runs_off_event_loop(self):
+        """测试异步客户端的录制写入在线程中进行，不阻塞事件循环"""
+        recorder = CassetteRecorder(self.path)
+        threads = []
+        record = recorder.record
+        recorder.record = lambda *args, **kwargs: (threads.append(threading.current_thread()), record(*args, **kwargs))
+        client = recorder.wrap_async(MockBackend(latency=LatencyModel("fixed", 0), stream_chunk_delay=0).async_client)
+        
+        async def run():
+            await client.chat.completions.create(**make_request("你好"))
+            stream = await client.chat.completions.create(**make_request("再见", stream=True))
+            [chunk async for chunk in stream]
+        asyncio.run(run())
+        recorder.close()
+        
+        self.assertEqual(recorder.recorded, 2)
+        self.assertNotIn(threading.main_thread(), threads)
+    
+    def test_cache_hits_are_recorded(self):
+        """测试录制模式记录缓存命中，回放时同一提示词优先使用上游调用的记录"""
+        self.record(["你好"])
+        recorder = CassetteRecorder(self.path)
+        client = make_client()
+        for prompt in ("你好", "只在缓存里"):
+            client.cache.set(client._cache_key(prompt), "缓存的回答", 60)
+        with patch.object(config, "llm_cassette_mode", "record"), patch.object(cassette, "_recorder", recorder):
+            self.assertEqual(client.invoke("你好"), "缓存的回答")
+            self.assertEqual(asyncio.run(client.ainvoke("只在缓存里")), "缓存的回答")
+        recorder.close()
+        
+        self.assertEqual([entry.get("cached", False) for entry in iter_cassette(self.path)], [False, True, True])
+        player = CassettePlayer(self.path, latency_scale=0)
+        for _ in range(2):
+            response = player.client.chat.completions.create(**make_request("你好"))
+            self.assertNotEqual(response.choices[0].message.content, "缓存的回答")
+        response = player.client.chat.completions.create(**make_request("只在缓存里"))
+        self.assertEqual(response.choices[0].message.content, "缓存的回答")
+    
+    def test_replay_skips_redis_cache(self):
+        """测试回放模式的LLMClient不读写Redis缓存，回答全部来自回放文件"""
+        self.record(["你好"])
+        with patch.object(config, "llm_cassette_mode", "replay"), patch.object(config, "llm_cassette_path", self.path), \
+                patch.object(config, "llm_cassette_latency_scale", 0), patch.object(cassette, "_player", None):
+            client = LLMClient()
+            self.addCleanup(client.cache.l1.delete, client._cache_key("你好"))
+            self.assertIsNone(client.redis_client)
+            self.assertTrue(client.invoke("你好").startswith("已为您处理完成"))
+            self.assertEqual(cassette.get_cassette_player().get_stats()["hits"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
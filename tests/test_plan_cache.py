@@ -0,0 +1,124 @@
+import sys
+import os
+import time
+import unittest
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.plan_cache import PlanCache, build_template
+
+def weather_plan(city: str, days: int = 1) -> dict:
+    """LLM生成的天气查询计划"""
+    return {"intent": "查询天气", "tasks": [
+        {"type": "天气", "tool": "weather", "parameters": {"city": city, "days": days}}
+    ]}
+
+class TestPlanCache(unittest.TestCase):
+    """任务计划缓存测试"""
+    
+    def test_reuse_template_with_new_slots(self):
+        """测试结构相同的消息复用模板并填入新的槽位值"""
+        cache = PlanCache()
+        key = cache.store("查询北京未来3天的天气", weather_plan("北京", 3))
+        self.assertEqual(key, "查询{0}未来{1}天的天气")
+        
+        plan = cache.lookup("查询上海未来5天的天气？", tools=["weather"])
+        self.assertEqual(plan["tasks"][0]["parameters"], {"city": "上海", "days": 5})
+        self.assertEqual(plan["plan_key"], key)
+        self.assertIsNone(cache.lookup("查询上海未来5天的天气", tools=["search"]))
+        self.assertIsNone(cache.lookup("上海明天下雨吗"))
+    
+    def test_non_numeric_slot_is_miss(self):
+        """测试数值槽位取到无法转换的文本时按未命中处理，不抛出异常"""
+        cache = PlanCache()
+        cache.store("查询北京未来3天的天气", weather_plan("北京", 3))
+        
+        self.assertIsNone(cache.lookup("查询上海未来三天的天气"))
+        self.assertEqual(cache.get_stats()["misses"], 1)
+        self.assertEqual(cache.get_stats()["hits"], 0)
+    
+    def test_intent_and_type_use_new_slots(self):
+        """测试意图和任务类型中的实体同样替换为新的槽位值"""
+        cache = PlanCache()
+        cache.store("查询北京天气", {"intent": "查询北京天气", "tasks": [
+            {"type": "查询北京天气", "tool": "weather", "parameters": {"city": "北京"}}
+        ]})
+        
+        plan = cache.lookup("查询上海天气")
+        self.assertEqual(plan["intent"], "查询上海天气")
+        self.assertEqual(plan["tasks"][0]["type"], "查询上海天气")
+        self.assertEqual(plan["tasks"][0]["parameters"], {"city": "上海"})
+    
+    def test_slot_keeps_value_class(self):
+        """测试槽位只接受与学习时取值同类的文本：算式模板不会把任意文本当作算式"""
+        cache = PlanCache()
+        cache.store("帮我计算1+2", {"tasks": [{"tool": "calculator", "parameters": {"expression": "1+2"}}]})
+        
+        plan = cache.lookup("帮我计算(3+4)*5")
+        self.assertEqual(plan["tasks"][0]["parameters"], {"expression": "(3+4)*5"})
+        self.assertIsNone(cache.lookup("帮我计算__import__('os').getpid()"))
+        self.assertIsNone(cache.lookup("帮我计算一下明天的火车票多少钱"))
+    
+    def test_schema_violation_is_miss(self):
+        """测试填入后的参数不符合工具schema时按未命中处理"""
+        def validate(tool, parameters):
+            if not parameters["city"].isalpha():
+                raise ValueError("参数 city 格式不正确")
+        
+        cache = PlanCache()
+        cache.store("查询北京天气", {"tasks": [{"tool": "weather", "parameters": {"city": "北京"}}]})
+        
+        self.assertIsNotNone(cache.lookup("查询上海天气", validate=validate))
+        self.assertIsNone(cache.lookup("查询<上海>天气", validate=validate))
+        self.assertEqual(cache.get_stats()["misses"], 1)
+    
+    def test_uncacheable_plans(self):
+        """测试参数无法在消息中定位或缺少固定文本的计划不缓存"""
+        self.assertIsNone(build_template("那里天气怎么样", weather_plan("北京")))
+        self.assertIsNone(build_template("北京", {"tasks": [{"tool": "weather", "parameters": {"city": "北京"}}]}))
+    
+    def test_evict_after_failures(self):
+        """测试模板连续执行失败后被淘汰，成功会重置失败计数"""
+        cache = PlanCache(max_failures=2)
+        key = cache.store("查询北京天气", {"tasks": [{"tool": "weather", "parameters": {"city": "北京"}}]})
+        
+        cache.feedback(key, success=False)
+        cache.feedback(key, success=True)
+        cache.feedback(key, success=False)
+        self.assertIsNotNone(cache.lookup("查询上海天气"))
+        
+        cache.feedback(key, success=False)
+        self.assertIsNone(cache.lookup("查询广州天气"))
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+
+    def test_lookup_matches_only_indexed_candidates(self):
+        """测试查找只对前后缀一致的模板做正则匹配，过期模板连同索引一起移除"""
+        cache = PlanCache(max_entries=2000)
+        for i in range(1000):
+            cache.store(f"查询北京第{i}号站的天气", {"tasks": [{"tool": "weather", "parameters": {"city": "北京"}}]})
+        key = cache.store("搜索北京的新闻", {"tasks": [{"tool": "search", "parameters": {"query": "北京"}}]})
+        
+        self.assertEqual(len(cache._candidates("搜索上海的新闻")), 1)
+        plan = cache.lookup("搜索上海的新闻")
+        self.assertEqual((plan["plan_key"], plan["tasks"][0]["parameters"]), (key, {"query": "上海"}))
+        
+        cache._templates[key].created_at = time.time() - cache.ttl - 1
+        self.assertIsNone(cache.lookup("搜索上海的新闻"))
+        self.assertEqual(cache._candidates("搜索上海的新闻"), [])
+        self.assertEqual(cache.get_stats()["entries"], 1000)
+    
+    def test_max_entries_evicts_from_index(self):
+        """测试超出容量时淘汰最久未使用的模板，命中会刷新使用顺序"""
+        cache = PlanCache(max_entries=2)
+        cache.store("查询北京天气", {"tasks": [{"tool": "weather", "parameters": {"city": "北京"}}]})
+        cache.store("搜索北京的新闻", {"tasks": [{"tool": "search", "parameters": {"query": "北京"}}]})
+        self.assertIsNotNone(cache.lookup("查询上海天气"))
+        cache.store("翻译hello", {"tasks": [{"tool": "translate", "parameters": {"text": "hello"}}]})
+        
+        self.assertIsNotNone(cache.lookup("查询广州天气"))
+        self.assertIsNone(cache.lookup("搜索上海的新闻"))
+        self.assertEqual(cache._candidates("搜索上海的新闻"), [])
+
+if __name__ == "__main__":
+    unittest.main()
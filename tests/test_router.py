@@ -0,0 +1,128 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+import unittest
+from unittest.mock import MagicMock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.router import LLMRouter, RouterBackend
+
+class StubProvider:
+    """本地OpenAI兼容桩服务，可配置延迟和状态码"""
+    
+    def __init__(self, content: str, status: int = 200, delay: float = 0.0):
+        self.content = content
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub.calls += 1
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(stub.delay)
+                if stub.status != 200:
+                    payload = {"error": {"message": "stub error", "type": "server_error"}}
+                else:
+                    payload = {
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body["model"],
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": stub.content},
+                            "finish_reason": "stop"
+                        }]
+                    }
+                data = json.dumps(payload).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def make_request():
+    return {"model": "stub-model", "messages": [{"role": "user", "content": "你好"}]}
+
+class TestLLMRouter(unittest.TestCase):
+    """多Provider路由测试"""
+    
+    def setUp(self):
+        self.stubs = []
+    
+    def tearDown(self):
+        for stub in self.stubs:
+            stub.close()
+    
+    def make_router(self, *stubs) -> LLMRouter:
+        self.stubs.extend(stubs)
+        return LLMRouter([
+            RouterBackend(name=f"stub{i}", base_url=stub.base_url, api_key="test", timeout=1)
+            for i, stub in enumerate(stubs)
+        ])
+    
+    def test_failover_on_5xx(self):
+        """测试5xx时自动切换到其他后端"""
+        broken = StubProvider("坏", status=503)
+        healthy = StubProvider("好")
+        router = self.make_router(broken, healthy)
+        
+        response = router.create(**make_request())
+        self.assertEqual(response.choices[0].message.content, "好")
+        self.assertEqual(router.get_stats()["stub0"]["error_rate"], 1.0)
+    
+    def test_rate_limit_per_backend(self):
+        """测试切换后端时按实际调用的后端各自占用限流额度"""
+        broken = StubProvider("坏", status=503)
+        healthy = StubProvider("好")
+        router = self.make_router(broken, healthy)
+        for backend in router.backends:
+            backend.rate_limiter = MagicMock(wraps=backend.rate_limiter)
+        
+        router.create(**make_request())
+        self.assertEqual([b.rate_limiter.acquire.call_count for b in router.backends], [1, 1])
+    
+    def test_failover_on_timeout(self):
+        """测试超时时自动切换到其他后端"""
+        hanging = StubProvider("慢", delay=2)
+        healthy = StubProvider("好")
+        router = self.make_router(hanging, healthy)
+        
+        response = asyncio.run(router.acreate(**make_request()))
+        self.assertEqual(response.choices[0].message.content, "好")
+    
+    def test_prefers_fastest_backend(self):
+        """测试路由优先选择延迟更低的后端"""
+        slow = StubProvider("慢", delay=0.2)
+        fast = StubProvider("快")
+        router = self.make_router(slow, fast)
+        
+        # 首轮探测两个后端
+        router.create(**make_request())
+        router.create(**make_request())
+        for _ in range(5):
+            response = router.create(**make_request())
+        self.assertEqual(response.choices[0].message.content, "快")
+        self.assertLessEqual(slow.calls, 2)
+
+if __name__ == "__main__":
+    unittest.main()
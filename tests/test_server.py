@@ -0,0 +1,102 @@
+import sys
+import os
+import asyncio
+import json
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp.test_utils import TestServer, TestClient
+from core.server import AgentServer
+from test_session import make_manager
+import unittest
+
+def make_server(responses=(), stream_chunks=()) -> AgentServer:
+    """在离线运行时上创建HTTP服务，流式回复依次输出stream_chunks"""
+    manager = make_manager(responses)
+    
+    async def astream(prompt):
+        for chunk in stream_chunks:
+            yield chunk
+    manager.runtime.llm_client.astream = astream
+    return AgentServer(manager=manager, max_concurrency=2, drain_timeout=1)
+
+class TestAgentServer(unittest.IsolatedAsyncioTestCase):
+    """HTTP服务测试"""
+    
+    async def asyncSetUp(self):
+        self.plan = """{"intent": "计算", "tasks": [{"tool": "calculator", "parameters": {"expression": "2+3"}}]}"""
+    
+    async def start(self, server: AgentServer) -> TestClient:
+        client = TestClient(TestServer(server.build_app()))
+        await client.start_server()
+        self.addAsyncCleanup(client.close)
+        return client
+    
+    async def test_chat(self):
+        """测试普通对话请求返回完整回复，会话按session_id复用"""
+        server = make_server([self.plan, "结果是5"])
+        client = await self.start(server)
+        
+        response = await client.post("/chat", json={"session_id": "user-1", "message": "计算2+3"})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(await response.json(), {"session_id": "user-1", "reply": "结果是5"})
+        
+        status = await (await client.get("/status/user-1")).json()
+        self.assertTrue(status["active"])
+        self.assertEqual(status["completed_tasks"], 1)
+        self.assertEqual((await client.post("/chat", json={"session_id": "user-1"})).status, 400)
+    
+    async def test_stream_chat(self):
+        """测试SSE逐段输出最终回复并以done事件结束"""
+        server = make_server([self.plan], stream_chunks=["结果", "是5"])
+        client = await self.start(server)
+        
+        response = await client.post("/chat", json={"session_id": "user-1", "message": "计算2+3", "stream": True})
+        self.assertEqual(response.headers["Content-Type"], "text/event-stream; charset=utf-8")
+        events = (await response.text()).strip().split("\n\n")
+        
+        self.assertEqual([json.loads(e[len("data: "):])["delta"] for e in events[:-1]], ["结果", "是5"])
+        self.assertTrue(events[-1].startswith("event: done"))
+        self.assertEqual(server.manager.runtime.memory.export_session("user-1")[-1]["content"], "助手: 结果是5")
+        self.assertEqual(server.manager.get_stats()["inflight"], 0)
+    
+    async def test_admission_rejection(self):
+        """测试准入控制拒绝时返回对应状态码和Retry-After"""
+        server = make_server()
+        server.admission.max_inflight_per_tenant = 1
+        await server.admission.acquire("tenant-a")
+        client = await self.start(server)
+        
+        response = await client.post("/chat", json={"message": "你好"}, headers={"X-Tenant-ID": "tenant-a"})
+        self.assertEqual(response.status, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        self.assertEqual((await (await client.get("/status")).json())["admission"]["tenant_limited"], 1)
+    
+    async def test_drain_waits_for_inflight_requests(self):
+        """测试排空时健康检查返回503、拒绝新对话，并等待进行中的请求完成"""
+        server = make_server()
+        gate = asyncio.Event()
+        
+        async def slow_reply(prompt, **kwargs):
+            await gate.wait()
+            return """{"tasks": [], "answer": "完成"}"""
+        server.manager.runtime.llm_client.ainvoke.side_effect = slow_reply
+        client = await self.start(server)
+        
+        pending = asyncio.create_task(client.post("/chat", json={"message": "你好"}))
+        while server.inflight == 0:
+            await asyncio.sleep(0.01)
+        drain = asyncio.create_task(server.drain())
+        await asyncio.sleep(0.05)
+        
+        self.assertEqual((await client.get("/health")).status, 503)
+        self.assertEqual((await client.post("/chat", json={"message": "你好"})).status, 503)
+        self.assertFalse(drain.done())
+        
+        gate.set()
+        self.assertEqual((await (await pending).json())["reply"], "完成")
+        self.assertTrue(await drain)
+
+if __name__ == "__main__":
+    unittest.main()
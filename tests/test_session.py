@@ -0,0 +1,176 @@
+import sys
+import os
+import asyncio
+import time
+import json
+import threading
+import unittest
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.session import SessionManager
+from modules.state import StateStore
+from modules.scheduler import TaskScheduler
+from core.exceptions import StateError
+from core.config import config
+from test_agent import make_offline_runtime
+
+def make_manager(responses, **kwargs) -> SessionManager:
+    """构造使用内存StateStore的会话管理器"""
+    store = StateStore()
+    store.redis_client = None
+    return SessionManager(runtime=make_offline_runtime(responses), store=store, **kwargs)
+
+class TestSessionManager(unittest.TestCase):
+    """会话换出与恢复测试"""
+    
+    def test_evict_and_rehydrate(self):
+        """测试空闲会话换出后释放内存，下一条消息到达时恢复记忆和状态"""
+        plan = """{"intent": "搜索资料", "tasks": [{"tool": "search", "parameters": {"query": "Python"}}]}"""
+        manager = make_manager([plan, "第一次回复", """{"tasks": []}"""], idle_timeout=60)
+        memory = manager.runtime.memory
+        
+        asyncio.run(manager.process_message("s1", "搜索Python"))
+        agent = manager.get("s1")
+        agent.scheduler.add_task("未完成", {"query": "Rust"}, tool="search")
+        
+        self.assertEqual(manager.evict_idle(now=time.time() + 120), 1)
+        self.assertEqual(memory.export_session("s1"), [])
+        self.assertEqual(manager.get_stats()["active"], 0)
+        
+        restored = manager.get("s1")
+        self.assertIsNot(restored, agent)
+        self.assertEqual(restored.state.intent, "搜索资料")
+        self.assertEqual(len(memory.export_session("s1")), 2)
+        self.assertEqual(restored.scheduler.get_next_task()["params"], {"query": "Rust"})
+        self.assertEqual(restored.scheduler.add_task("新任务", {}), "task_3")
+        self.assertEqual(manager.get_stats()["rehydrated"], 1)
+    
+    def test_scheduler_prunes_finished_tasks(self):
+        """测试已结束的任务从队列清理、历史有上限，导出的待执行任务恢复后依赖仍然满足"""
+        scheduler = TaskScheduler(max_history=2)
+        for _ in range(5):
+            task_id = scheduler.add_task("搜索", {"query": "Python"})
+            scheduler.get_ready_tasks()
+            scheduler.complete_task(task_id, "完成")
+        dependency = scheduler.add_task("搜索", {"query": "Go"})
+        scheduler.get_ready_tasks()
+        scheduler.complete_task(dependency, "完成")
+        pending = scheduler.add_task("搜索", {"query": "Rust"}, depends_on=[dependency])
+        
+        self.assertEqual(scheduler.prune_finished(), 5)
+        self.assertEqual([task["task_id"] for task in scheduler.task_queue], [dependency, pending])
+        self.assertEqual(len(scheduler.completed_tasks), 2)
+        
+        exported = json.loads(json.dumps(scheduler.export_pending()))
+        self.assertEqual([task["status"] for task in exported["tasks"]], ["completed", "pending"])
+        restored = TaskScheduler()
+        restored.import_pending(exported)
+        task = restored.get_next_task()
+        self.assertEqual((task["task_id"], task["params"]), (pending, {"query": "Rust"}))
+        restored.complete_task(pending, "完成")
+        self.assertEqual(restored.prune_finished(), 2)
+        self.assertEqual(restored.export_pending()["tasks"], [])
+    
+    def test_max_active_evicts_least_recent(self):
+        """测试活跃会话超出上限时换出最久未使用的会话"""
+        manager = make_manager([], max_active=2)
+        manager.get("a")
+        manager.get("b")
+        manager.get("a")
+        manager.get("c")
+        
+        self.assertEqual(list(manager._sessions), ["a", "c"])
+        self.assertEqual(manager.get_stats()["evicted"], 1)
+    
+    def test_failed_eviction_keeps_session(self):
+        """测试换出时写快照失败不影响当前请求，被换出的会话留在内存中"""
+        manager = make_manager([], max_active=1)
+        manager.get("a")
+        
+        def fail(*args, **kwargs):
+            raise StateError("保存会话快照失败: Redis不可用")
+        manager.store.save_snapshot = fail
+        
+        self.assertIsNotNone(manager.get("b"))
+        self.assertEqual(set(manager._sessions), {"a", "b"})
+        self.assertEqual(manager.get_stats()["evicted"], 0)
+    
+    def test_snapshot_io_does_not_block_other_sessions(self):
+        """测试快照读取在锁外的线程中进行，慢速加载不阻塞其他会话和事件循环"""
+        manager = make_manager([])
+        manager.get("active")
+        load_snapshot = manager.store.load_snapshot
+        
+        def slow_load(session_id, **kwargs):
+            time.sleep(0.3)
+            return load_snapshot(session_id, **kwargs)
+        manager.store.load_snapshot = slow_load
+        
+        async def run():
+            start = time.monotonic()
+            loads = [asyncio.ensure_future(manager.aget(s)) for s in ("x", "y")]
+            await asyncio.sleep(0.05)
+            self.assertIsNotNone(await manager.aget("active"))
+            self.assertLess(time.monotonic() - start, 0.2)
+            await asyncio.gather(*loads)
+            self.assertLess(time.monotonic() - start, 0.5)
+        asyncio.run(run())
+    
+    def test_get_waits_for_running_eviction(self):
+        """测试换出写快照期间到达的请求等待写入完成，恢复出完整状态而不是新建空会话"""
+        manager = make_manager([])
+        manager.get("s1").state.intent = "查天气"
+        save_snapshot = manager.store.save_snapshot
+        
+        def slow_save(*args, **kwargs):
+            time.sleep(0.2)
+            save_snapshot(*args, **kwargs)
+        manager.store.save_snapshot = slow_save
+        
+        evicting = threading.Thread(target=manager.evict, args=("s1",))
+        evicting.start()
+        time.sleep(0.05)
+        restored = manager.get("s1")
+        evicting.join()
+        
+        self.assertEqual(restored.state.intent, "查天气")
+        self.assertEqual(manager.get_stats()["rehydrated"], 1)
+    
+    def test_short_term_is_bounded_per_session(self):
+        """测试短期记忆按会话存放，超过条数上限或过期的记录被丢弃"""
+        memory = make_manager([]).runtime.memory
+        memory.import_session([{"session_id": "old", "content": "过期", "timestamp": time.time() - 7200}])
+        for i in range(150):
+            memory._add_short_term("s1", f"消息{i}")
+        memory._add_short_term("s2", "另一个会话")
+        
+        self.assertEqual(len(memory.export_session("s1")), config.short_term_memory_max_entries)
+        self.assertEqual(memory.export_session("s1")[-1]["content"], "消息149")
+        self.assertEqual(memory.export_session("old"), [])
+        self.assertEqual(set(memory.short_term), {"s1", "s2"})
+        memory.drop_local("s1")
+        self.assertEqual([m["content"] for m in memory.export_session("s2")], ["另一个会话"])
+    
+    def test_drop_local_keeps_other_sessions(self):
+        """测试换出线程释放短期记忆时不会丢失其他会话同时写入的记忆"""
+        memory = make_manager([]).runtime.memory
+        memory.import_session([{"session_id": "other", "content": "旧消息", "timestamp": time.time()}] * 5000)
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # 频繁切换线程，让读-改-写的竞争更容易出现
+        self.addCleanup(sys.setswitchinterval, interval)
+        
+        def drop():
+            for _ in range(200):
+                memory.drop_local("gone")
+        dropping = threading.Thread(target=drop)
+        dropping.start()
+        for i in range(50):
+            memory._add_short_term("kept", f"消息{i}")
+        dropping.join()
+        
+        self.assertEqual(len(memory.export_session("kept")), 50)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import sys
+import os
+import threading
+import unittest
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.tokenizer import ApproxTokenizer, ContextBuilder, get_context_window
+from modules.memory import MemoryManager
+from modules.state import ConversationState
+
+def make_memory_manager() -> MemoryManager:
+    """构造不连接Redis的记忆管理器"""
+    manager = MemoryManager.__new__(MemoryManager)
+    manager.short_term = {}
+    manager.long_term = {}
+    manager._long_term_sessions = {}
+    manager._lock = threading.RLock()
+    manager.redis_client = None
+    return manager
+
+class TestTokenizer(unittest.TestCase):
+    """Token计数与上下文预算测试"""
+    
+    def test_approx_truncate(self):
+        """测试截断结果不超过预算"""
+        tokenizer = ApproxTokenizer()
+        text = "你好世界" + "hello world" * 10
+        truncated = tokenizer.truncate(text, 10)
+        self.assertLessEqual(tokenizer.count(truncated), 10)
+        self.assertTrue(text.startswith(truncated))
+    
+    def test_context_window(self):
+        """测试按模型选择上下文窗口"""
+        self.assertEqual(get_context_window("gpt-4o"), 128000)
+        self.assertEqual(get_context_window("unknown-model"), 8192)
+    
+    def test_builder_priority(self):
+        """测试预算不足时优先保留先加入的分段"""
+        builder = ContextBuilder(max_tokens=20)
+        builder.add_section("最近对话", ["用户: 你好", "助手: 你好！"])
+        builder.add_section("相关记忆", ["一条很长很长很长很长很长的长期记忆"])
+        result = builder.build()
+        
+        self.assertIn("最近对话", result.text)
+        self.assertNotIn("相关记忆", result.text)
+        self.assertLessEqual(result.used_tokens, 20)
+        self.assertGreater(result.dropped_tokens, 0)
+        self.assertEqual(result.sections["相关记忆"]["dropped_items"], 1)
+    
+    def test_memory_build_context(self):
+        """测试记忆上下文按token预算填充"""
+        manager = make_memory_manager()
+        for i in range(50):
+            manager.add_experience("s1", f"用户: 第{i}条消息")
+        manager.add_experience("s1", "Python是一门编程语言", is_structured=True, key="python")
+        
+        result = manager.build_context("s1", "介绍一下 python", max_tokens=60,
+                                       slots={"city": {"value": "北京", "confidence": 0.9}})
+        self.assertLessEqual(result.used_tokens, 60)
+        self.assertIn("第49条消息", result.text)
+        self.assertNotIn("第0条消息", result.text)
+        self.assertGreater(result.dropped_tokens, 0)
+        
+        # 预算充足时三类信息都保留
+        result = manager.build_context("s1", "介绍一下 python", max_tokens=2000,
+                                       slots={"city": {"value": "北京", "confidence": 0.9}})
+        self.assertIn("Python是一门编程语言", result.text)
+        self.assertIn("city: 北京", result.text)
+        
+        # 其他会话的长期记忆不会进入上下文
+        self.assertNotIn("Python是一门编程语言", manager.build_context("s2", "介绍一下 python", max_tokens=2000).text)
+    
+    def test_state_context_budget(self):
+        """测试对话状态上下文按token截断"""
+        state = ConversationState("s1")
+        for i in range(30):
+            state.slots[f"slot{i}"] = {"value": "值" * 10, "confidence": 1.0}
+        context = state.to_context(max_tokens=50)
+        self.assertTrue(context.endswith("...[上下文已截断]"))
+        self.assertLessEqual(ApproxTokenizer().count(context.replace("...[上下文已截断]", "")), 50)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import sys
+import os
+import asyncio
+import unittest
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from aiohttp.test_utils import TestServer, TestClient
+from core.hash_ring import ConsistentHashRing
+from core.server import AgentServer
+from core.workers import WorkerPool
+from test_session import make_manager
+
+class TestConsistentHashRing(unittest.TestCase):
+    """一致性哈希环测试"""
+    
+    def test_adding_node_moves_only_its_share(self):
+        """测试增加节点时只有约1/N的键迁移，且都迁移到新节点"""
+        ring = ConsistentHashRing(["worker-0", "worker-1", "worker-2"])
+        keys = [f"session-{i}" for i in range(4000)]
+        before = {key: ring.get_node(key) for key in keys}
+        self.assertTrue(all(600 < list(before.values()).count(n) < 2000 for n in ring.nodes))
+        
+        ring.add_node("worker-3")
+        moved = [key for key in keys if ring.get_node(key) != before[key]]
+        self.assertTrue(all(ring.get_node(key) == "worker-3" for key in moved))
+        self.assertLess(abs(len(moved) / len(keys) - 0.25), 0.1)
+        
+        ring.remove_node("worker-3")
+        self.assertEqual({key: ring.get_node(key) for key in keys}, before)
+
+class TestWorkerPool(unittest.IsolatedAsyncioTestCase):
+    """会话亲和性转发测试，工作进程用同一事件循环内的AgentServer代替"""
+    
+    async def asyncSetUp(self):
+        self.pool = WorkerPool(workers=2)
+        self.pool._client = aiohttp.ClientSession()
+        self.addAsyncCleanup(self.pool._client.close)
+        self.workers = {}
+        for node in ("worker-0", "worker-1"):
+            server = AgentServer(manager=make_manager(['{"tasks": [], "answer": "好"}'] * 20), node=node)
+            test_server = TestServer(server.build_app())
+            await test_server.start_server()
+            self.addAsyncCleanup(test_server.close)
+            self.workers[node] = server
+            self.pool.ports[node] = test_server.port
+            self.pool.ring.add_node(node)
+        self.client = TestClient(TestServer(self.pool.build_app()))
+        await self.client.start_server()
+        self.addAsyncCleanup(self.client.close)
+    
+    async def test_sessions_stay_on_owner(self):
+        """测试同一会话的请求总是转发到哈希环上的归属进程"""
+        for _ in range(2):
+            for i in range(6):
+                response = await self.client.post("/chat", json={"session_id": f"s{i}", "message": "你好"})
+                self.assertEqual((await response.json())["reply"], "好")
+        
+        for i in range(6):
+            owner = self.pool.ring.get_node(f"s{i}")
+            self.assertIsNotNone(self.workers[owner].manager.peek(f"s{i}"))
+            other = "worker-1" if owner == "worker-0" else "worker-0"
+            self.assertIsNone(self.workers[other].manager.peek(f"s{i}"))
+        
+        # 未指定会话ID时由前端分配，返回的ID与实际所在进程一致
+        session_id = (await (await self.client.post("/chat", json={"message": "你好"})).json())["session_id"]
+        self.assertIsNotNone(self.workers[self.pool.ring.get_node(session_id)].manager.peek(session_id))
+    
+    async def test_rebalance_evicts_moved_sessions(self):
+        """测试哈希环变化后工作进程换出不再归属自己的会话"""
+        for i in range(6):
+            await self.client.post("/chat", json={"session_id": f"s{i}", "message": "你好"})
+        manager = self.workers["worker-0"].manager
+        owned = manager.get_stats()["active"]
+        
+        url = f"http://127.0.0.1:{self.pool.ports['worker-0']}/internal/rebalance"
+        async with self.pool._client.post(url, json={"nodes": ["worker-1"]}) as response:
+            self.assertEqual((await response.json())["evicted"], owned)
+        self.assertEqual(manager.get_stats()["active"], 0)
+        self.assertEqual(manager.get_stats()["evicted"], owned)
+    
+    async def test_handoff_publishes_ring_after_snapshot(self):
+        """测试扩容时迁移中会话的请求等原归属进程写完快照、新哈希环发布后再转发，由新进程恢复而不是新建空会话"""
+        self.workers["worker-1"].manager.store = self.workers["worker-0"].manager.store
+        self.pool.ring = ConsistentHashRing(["worker-0"])
+        sessions = [f"s{i}" for i in range(10)]
+        for session_id in sessions:
+            await self.client.post("/chat", json={"session_id": session_id, "message": "你好"})
+        ring = ConsistentHashRing(["worker-0", "worker-1"])
+        moved = next(s for s in sessions if ring.get_node(s) == "worker-1")
+        
+        async def transfer():
+            await asyncio.sleep(0.2)
+            await self.pool._rebalance(ring)
+        handoff = asyncio.ensure_future(self.pool._handoff(ring, transfer))
+        await asyncio.sleep(0.05)
+        response = await self.client.post("/chat", json={"session_id": moved, "message": "你好"})
+        self.assertEqual((await response.json())["reply"], "好")
+        await handoff
+        
+        self.assertIs(self.pool.ring, ring)
+        self.assertIsNone(self.workers["worker-0"].manager.peek(moved))
+        self.assertIsNotNone(self.workers["worker-1"].manager.peek(moved))
+        self.assertEqual(self.workers["worker-1"].manager.get_stats()["rehydrated"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
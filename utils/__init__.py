@@ -3,8 +3,18 @@ Mofy Agent Framework - 工具函数
 提供日志、缓存、参数解析等工具函数
 """
 
-from .logger import setup_logger
-from .cache import CacheManager
-from .parser import ParameterParser
+import importlib
 
-__all__ = ["setup_logger", "CacheManager", "ParameterParser"]
\ No newline at end of file
+# 导出名 -> 所在子模块，首次访问时才导入
+_EXPORTS = {
+    "setup_logger": ".logger",
+    "CacheManager": ".cache",
+    "ParameterParser": ".parser",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,6 +6,7 @@ Mofy Agent Framework - 缓存管理
 import time
 import hashlib
 import json
+import threading
 from typing import Any, Optional, Dict
 import redis
 from ..core.config import config
@@ -111,5 +112,21 @@ class CacheManager:
         key_str = json.dumps(key_data, sort_keys=True, default=str)
         return hashlib.md5(key_str.encode()).hexdigest()
 
-# 全局缓存管理器实例
-cache_manager = CacheManager()
\ No newline at end of file
+# 全局缓存管理器实例，首次使用时才创建并连接Redis
+_cache_manager: Optional[CacheManager] = None
+_cache_manager_lock = threading.Lock()
+
+def get_cache_manager() -> CacheManager:
+    """获取全局缓存管理器"""
+    global _cache_manager
+    if _cache_manager is None:
+        with _cache_manager_lock:
+            if _cache_manager is None:
+                _cache_manager = CacheManager()
+    return _cache_manager
+
+def __getattr__(name: str):
+    # 兼容 from utils.cache import cache_manager
+    if name == "cache_manager":
+        return get_cache_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -30,5 +30,13 @@ def setup_logger():
     
     return logger
 
-# 初始化日志
-mofy_logger = setup_logger()
\ No newline at end of file
+# 日志在首次访问mofy_logger时初始化，import本模块不会创建日志文件
+_mofy_logger = None
+
+def __getattr__(name: str):
+    global _mofy_logger
+    if name == "mofy_logger":
+        if _mofy_logger is None:
+            _mofy_logger = setup_logger()
+        return _mofy_logger
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file